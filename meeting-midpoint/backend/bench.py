@@ -0,0 +1,893 @@
+"""MeetPoint 백엔드 벤치마크.
+
+    python bench.py wal --rooms 200 --updates 5000
+    python bench.py stress --rooms 1000 --threads 32 --ops 50000
+    python bench.py multiproc --workers 4 --rooms 50 --threads 16 --ops 4000
+    python bench.py search --rooms 200 --budget 48 [--snap] [--prefilter 12]
+    python bench.py hours --venues 2000 --queries 200
+    python bench.py results --rooms 1000 --venues 2000
+    python bench.py load --scales 10,100,1000 --latency-ms 30 --error-rate 0.01 --out load.json [--compare base.json]
+    python bench.py concurrency --levels 100,500,2000 --latency-ms 200 [--modes sync,async]
+
+서버 모듈을 임시 디렉터리의 rooms.dat/rooms.log로 띄워서 측정하므로 실제 데이터는 건드리지 않음.
+multiproc은 같은 임시 디렉터리의 SQLite 파일을 공유하는 서버 프로세스를 --workers개 띄움(포트 --port부터).
+load는 카카오/구글 대신 bench_upstream.py 대역 서버(녹화 재생 + 합성 응답)를 띄우므로 API 키 없이 돎.
+concurrency는 같은 대역 서버 위에 서버 프로세스를 SERVER_MODE별로 띄우고(async는 uvicorn, asgiref 필요) 동시 요청 수를 올려 가며 비교.
+"""
+import os, sys, gc, json, time, random, asyncio, argparse, tempfile, pathlib, statistics, threading, subprocess, tracemalloc
+from datetime import datetime, timedelta
+
+_TMP = tempfile.mkdtemp(prefix="meetpoint-bench-")
+os.environ.setdefault("ROOMS_PATH", os.path.join(_TMP, "rooms.json"))
+os.environ.setdefault("CACHE_DB_PATH", "")
+sys.path.insert(0, str(pathlib.Path(__file__).parent))
+import server  # noqa: E402
+import requests  # noqa: E402
+import bench_upstream  # noqa: E402
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q / 100.0 * (len(xs) - 1))))] if xs else None
+
+
+def _latency_summary(samples_s):
+    ms = [x * 1000.0 for x in samples_s]
+    return {"p50_ms": round(_pct(ms, 50), 4), "p95_ms": round(_pct(ms, 95), 4),
+            "p99_ms": round(_pct(ms, 99), 4), "mean_ms": round(statistics.fmean(ms), 4)}
+
+
+def _fake_item(i):
+    # 카카오 문서 + 구글 보강 필드 정도 크기의 추천 결과
+    return {
+        "id": str(10000000 + i), "place_name": f"장소{i}", "category_name": "음식점 > 한식 > 육류,고기",
+        "category_group_code": "FD6", "category_group_name": "음식점", "phone": "02-000-0000",
+        "address_name": "서울 강남구 역삼동 000-0", "road_address_name": "서울 강남구 테헤란로 000",
+        "x": f"{127.02 + i * 1e-4:.7f}", "y": f"{37.49 + i * 1e-4:.7f}", "distance": "350",
+        "place_url": f"http://place.map.kakao.com/{10000000 + i}",
+        "_open_now": True, "_phone": "02-000-0000", "_website": "https://example.com",
+        "_photo_url": "https://maps.googleapis.com/maps/api/place/photo?maxwidth=640&photo_reference=" + "x" * 200,
+        "_weekday_text": [f"{d}: 오전 11:00~오후 10:00" for d in "월화수목금토일"],
+        "_periods": [{"open": {"day": d, "time": "1100"}, "close": {"day": d, "time": "2200"}} for d in range(7)],
+        "_centroid_dist_km": 0.35, "_open_minutes_left": 180, "_closes_at": "22:00", "_open_enough": True,
+    }
+
+
+def _make_rooms(n_rooms, n_people=6, n_items=15):
+    # results는 서버가 저장하는 모양(vid + 방별 값)으로, 장소 레코드는 server.VENUES에 등록
+    rooms = {}
+    now = server._now_ms()
+    for r in range(n_rooms):
+        code = f"B{r:05d}"
+        parts = {}
+        for k in range(n_people):
+            pid = f"P{r:03d}{k:03d}"
+            parts[pid] = {"pid": pid, "nickname": f"n{k}", "mode": "car",
+                          "lat": 37.5 + random.random() / 10, "lng": 127.0 + random.random() / 10, "updated_at": now}
+        results, venues = server._compact_results({"count": n_items, "centroid": {"lat": 37.5, "lng": 127.0},
+                                                   "items": [_fake_item(i) for i in range(n_items)]})
+        server.VENUES.acquire(venues, server._venue_ids(results))
+        rooms[code] = {"code": code, "created_at": now, "expires_at": now + 3600 * 1000,
+                       "meta": {"purpose": "", "meetingTime": ""}, "participants": parts, "ver": 1,
+                       "results": results, "host_secret": "HS_BENCH", "eta": None}
+    return rooms
+
+
+def _update_one(rooms):
+    code = random.choice(list(rooms))
+    room = rooms[code]
+    pid = random.choice(list(room["participants"]))
+    p = room["participants"][pid]
+    p["lat"] += 1e-4; p["lng"] += 1e-4; p["updated_at"] = server._now_ms()
+    room["ver"] += 1
+    return code, pid, p, room["ver"]
+
+
+def bench_wal(args):
+    # 위치 업데이트 처리량: 기존 방식(매번 rooms.json 전체 재기록) vs WAL append
+    random.seed(args.seed)
+    base = _make_rooms(args.rooms)
+    out = {"scenario": "wal", "rooms": args.rooms, "updates": args.updates,
+           "state_bytes": len(json.dumps(base, ensure_ascii=False).encode("utf-8"))}
+
+    legacy_path = pathlib.Path(_TMP) / "legacy.json"
+    rooms = json.loads(json.dumps(base))
+    lat = []
+    t0 = time.perf_counter()
+    for _ in range(args.updates):
+        t = time.perf_counter()
+        _update_one(rooms)
+        legacy_path.write_text(json.dumps(rooms, ensure_ascii=False), encoding="utf-8")
+        lat.append(time.perf_counter() - t)
+    el = time.perf_counter() - t0
+    out["legacy_rewrite"] = {"updates_per_s": round(args.updates / el, 1), **_latency_summary(lat)}
+
+    server.ROOMS.clear()
+    server.ROOMS.update(json.loads(json.dumps(base)))
+    server.ROOM_LOG.compact()
+    lat = []
+    t0 = time.perf_counter()
+    for _ in range(args.updates):
+        t = time.perf_counter()
+        code, pid, p, ver = _update_one(server.ROOMS)
+        server._persist("p", code, pid=pid, p=p, ver=ver)
+        lat.append(time.perf_counter() - t)
+    server.ROOM_LOG.flush()
+    el = time.perf_counter() - t0
+    out["wal_append"] = {"updates_per_s": round(args.updates / el, 1), **_latency_summary(lat),
+                         "fsyncs": server.ROOM_LOG.stats["fsyncs"]}
+
+    # 복구 확인: 스냅샷 + 로그 재생 결과가 메모리 상태와 같아야 함
+    expect = json.dumps(dict(server.ROOMS.items()), sort_keys=True)
+    t = time.perf_counter()
+    server._load_rooms()
+    out["load_ms"] = round((time.perf_counter() - t) * 1000, 1)
+    out["resident_after_load"] = server.ROOMS.info()["resident"]
+    out["recovered_ok"] = json.dumps(dict(server.ROOMS.items()), sort_keys=True) == expect
+
+    # 스냅샷의 만료시각은 지났지만 로그에서 연장된 방은 재시작 후에도 남아야 함(연장 안 된 방은 사라짐)
+    now = server._now_ms()
+    template = next(iter(base.values()))
+    for code in ("WTTLEXT", "WTTLEND"):
+        server.ROOMS[code] = {**json.loads(json.dumps(template)), "code": code, "results": None, "expires_at": now + 1000}
+    server.ROOM_LOG.compact()
+    server.ROOMS["WTTLEXT"]["expires_at"] = now + 3600 * 1000
+    server._persist("set", "WTTLEXT", fields={"expires_at": now + 3600 * 1000})
+    server.ROOM_LOG.flush()
+    time.sleep(max(0, now + 1000 - server._now_ms()) / 1000 + 0.05)
+    server._load_rooms()
+    out["ttl_extension_recovered_ok"] = "WTTLEXT" in server.ROOMS and "WTTLEND" not in server.ROOMS
+    return out
+
+
+def _room_matches(st, exp):
+    return (st is not None and st["ver"] == exp["mut"]
+            and sorted(p["pid"] for p in st["participants"]) == sorted(exp["pids"]))
+
+
+def bench_stress(args):
+    # 방 여러 개에 join/update/state를 여러 스레드로 동시에 던지고, 끝난 뒤 불변식 확인
+    #  - 방 ver == 그 방에서 성공한 join+update 수
+    #  - 참가자 수 == 그 방 join 수, 각 참가자 좌표는 마지막으로 보낸 값 중 하나
+    #  - 로그 재생 결과 == 메모리 상태 (memory 저장소일 때)
+    random.seed(args.seed)
+    client = server.app.test_client()
+    codes = [client.post("/api/room/create", json={"ttlMinutes": 60}).get_json()["code"] for _ in range(args.rooms)]
+    expect = {c: {"mut": 0, "pids": []} for c in codes}
+    exp_lock = threading.Lock()
+    errors = []
+    lat = {"join": [], "update": [], "state": []}
+    per_thread = max(1, args.ops // args.threads)
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        c = server.app.test_client()
+        for _ in range(per_thread):
+            code = rnd.choice(codes)
+            with exp_lock:
+                pids = list(expect[code]["pids"])
+            op = "join" if not pids or rnd.random() < 0.1 else ("update" if rnd.random() < 0.6 else "state")
+            t = time.perf_counter()
+            if op == "join":
+                r = c.post("/api/room/join", json={"code": code, "nickname": "s"})
+                ok = r.status_code == 200
+                if ok:
+                    with exp_lock:
+                        expect[code]["pids"].append(r.get_json()["pid"]); expect[code]["mut"] += 1
+            elif op == "update":
+                r = c.post("/api/room/update", json={"code": code, "pid": rnd.choice(pids),
+                                                     "lat": 37.4 + rnd.random() / 5, "lng": 126.9 + rnd.random() / 5,
+                                                     "mode": rnd.choice(["car", "bus", "subway", "walk"])})
+                ok = r.status_code == 200
+                if ok:
+                    with exp_lock:
+                        expect[code]["mut"] += 1
+            else:
+                r = c.get(f"/api/room/state?code={code}")
+                st = r.get_json()
+                ok = r.status_code == 200 and st["ver"] >= 0 and all("pid" in p for p in st["participants"])
+            lat[op].append(time.perf_counter() - t)
+            if not ok:
+                errors.append((op, code, r.status_code))
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.threads)]
+    for th in threads: th.start()
+    for th in threads: th.join()
+    el = time.perf_counter() - t0
+
+    bad = [code for code in codes if not _room_matches(server.STORE.state(code), expect[code])]
+    recovered = True
+    if server.STORE.name == "memory":
+        server.ROOM_LOG.flush()
+        state = json.dumps({c: server.ROOMS[c] for c in codes}, sort_keys=True)
+        server.ROOM_LOG.compact()
+        server._load_rooms()
+        recovered = json.dumps({c: server.ROOMS.get(c) for c in codes}, sort_keys=True) == state
+    total = sum(len(v) for v in lat.values())
+    return {"scenario": "stress", "store": server.STORE.name, "rooms": args.rooms, "threads": args.threads, "ops": total,
+            "ops_per_s": round(total / el, 1),
+            "latency": {k: _latency_summary(v) for k, v in lat.items() if v},
+            "errors": len(errors), "inconsistent_rooms": len(bad), "recovered_ok": recovered,
+            "ok": not errors and not bad and recovered}
+
+
+# 합성 서울: 구 중심 근처에 참가자를 뿌리고, 실제 도로/대중교통 비슷한 비선형 이동시간을 흉내 냄
+#  - 모드별 속도 + 우회 계수, 대중교통 대기시간
+#  - 한강(위도 ~37.53)을 건너면 모드별 가산
+#  - 강남/도심 혼잡권에서는 자동차 속도 감소
+SEOUL_HUBS = [
+    (37.5665, 126.9780), (37.5547, 126.9706), (37.4979, 127.0276), (37.5133, 127.1001), (37.5571, 126.9245),
+    (37.5219, 126.9245), (37.5407, 127.0702), (37.6542, 127.0568), (37.4837, 126.9016), (37.5502, 127.1458),
+    (37.6176, 126.9227), (37.4765, 126.9816), (37.5894, 127.0167), (37.5270, 126.8966), (37.5048, 127.0049),
+]
+_SYN_MODE = {"car": (32.0, 1.35, 2.0), "bus": (18.0, 1.25, 7.0), "subway": (33.0, 1.15, 9.0), "walk": (4.8, 1.2, 0.0)}
+_SYN_RIVER = {"car": 6.0, "bus": 8.0, "subway": 2.0, "walk": 20.0}
+_SYN_JAMS = [((37.4979, 127.0276), 3.0), ((37.5665, 126.9780), 2.5)]
+
+
+def _synthetic_eta(participants, cands, depart_unix=0, stats=None):
+    # server.EtaObjective의 eta_fn 자리에 끼우는 합성 제공자(server._eta_matrix_steps와 같은 인자). DM 요청/원소 수도 같은 방식으로 셈
+    out = []
+    for p in participants:
+        speed, detour, fixed = _SYN_MODE.get(p.get("mode", "car"), _SYN_MODE["car"])
+        row = []
+        for clat, clng in cands:
+            km = server.haversine_km(p["lat"], p["lng"], clat, clng) * detour
+            v = speed
+            if p.get("mode", "car") == "car":
+                for (jlat, jlng), r in _SYN_JAMS:
+                    if server.haversine_km(jlat, jlng, clat, clng) < r:
+                        v *= 0.6
+            m = fixed + km / v * 60
+            if (p["lat"] - 37.53) * (clat - 37.53) < 0:
+                m += _SYN_RIVER.get(p.get("mode", "car"), 6.0)
+            row.append(int(round(m)))
+        out.append(row)
+    if stats is not None and cands:
+        plan = server._dm_plan(len(participants), len(cands))
+        server._stat_add(stats, requests=-(-len(participants) // plan[0]) * -(-len(cands) // plan[1]),
+                         elements=len(participants) * len(cands))
+    return out
+
+
+def _synthetic_rooms(n, rnd):
+    rooms = []
+    for _ in range(n):
+        people = []
+        for _k in range(rnd.randint(3, 8)):
+            hlat, hlng = rnd.choice(SEOUL_HUBS)
+            people.append({"lat": hlat + rnd.gauss(0, 0.012), "lng": hlng + rnd.gauss(0, 0.015),
+                           "mode": rnd.choice(["car", "car", "subway", "subway", "bus", "walk"])})
+        rooms.append(people)
+    return rooms
+
+
+def bench_search(args):
+    # 탐색 전략 비교(합성 서울 방, 고정 시드): 평가 수와 목적함수 (max, sum)을 grid(무제한) 기준과 비교
+    #  grid@budget = 같은 예산으로 잘린 grid, 나머지는 SEARCH_STRATEGIES 전부
+    #  --prefilter N이면 grid@full+pfN(배치마다 로컬 추정 상위 N만 평가)도 비교
+    rnd = random.Random(args.seed)
+    rooms = _synthetic_rooms(args.rooms, rnd)
+    runs = [("grid", None, 0)] + [(name, args.budget, 0) for name in sorted(server.SEARCH_STRATEGIES) if name != "grid"]
+    runs.append(("grid", args.budget, 0))
+    if args.prefilter:
+        runs.append(("grid", None, args.prefilter))
+    _label = lambda n, b, pf: f"{n}@{b or 'full'}" + (f"+pf{pf}" if pf else "")
+    res = {_label(*run): {"evals": [], "requests": [], "ms": [], "gap_max": [], "gap_sum": [],
+                          "better": 0, "equal": 0, "worse": 0} for run in runs}
+    for people in rooms:
+        seed = server.time_weighted_centroid(people)
+        ref = None
+        for name, budget, pf in runs:
+            fn, _default = server.SEARCH_STRATEGIES[name]
+            stats = {"requests": 0, "elements": 0}
+            obj = server.EtaObjective(people, 0, stats, budget=budget, eta_fn=_synthetic_eta, snap=args.snap, prefilter=pf)
+            t = time.perf_counter()
+            best = server._run(fn(obj, seed, args.radius, 5, True))
+            el = time.perf_counter() - t
+            key = server._objective(best)
+            ref = ref or key
+            r = res[_label(name, budget, pf)]
+            r["evals"].append(obj.evaluations); r["requests"].append(stats["requests"]); r["ms"].append(el * 1000)
+            r["gap_max"].append(key[0] - ref[0]); r["gap_sum"].append(key[1] - ref[1])
+            r["better" if key < ref else "equal" if key == ref else "worse"] += 1
+    out = {"scenario": "search", "rooms": args.rooms, "budget": args.budget, "radius_m": args.radius,
+           "snap": args.snap, "prefilter": args.prefilter, "subway_model": server.SUBWAY.info(), "strategies": {}}
+    for k, r in res.items():
+        out["strategies"][k] = {
+            "mean_evaluations": round(statistics.fmean(r["evals"]), 1),
+            "mean_dm_requests": round(statistics.fmean(r["requests"]), 1),
+            "mean_max_gap_min": round(statistics.fmean(r["gap_max"]), 3),
+            "p95_max_gap_min": _pct(r["gap_max"], 95),
+            "mean_sum_gap_min": round(statistics.fmean(r["gap_sum"]), 2),
+            "vs_grid": {"better": r["better"], "equal": r["equal"], "worse": r["worse"]},
+            "mean_ms": round(statistics.fmean(r["ms"]), 2),
+        }
+    return out
+
+
+def _spawn_workers(n, port0, db_path):
+    # ROOM_STORE=sqlite 서버 프로세스 n개를 같은 DB 파일로 띄우고 /api/health가 뜰 때까지 대기
+    procs, urls = [], []
+    for i in range(n):
+        env = {**os.environ, "ROOM_STORE": "sqlite", "ROOM_STORE_PATH": db_path, "PORT": str(port0 + i)}
+        procs.append(subprocess.Popen([sys.executable, server.__file__], env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        urls.append(f"http://127.0.0.1:{port0 + i}")
+    deadline = time.time() + 30
+    for url in urls:
+        while True:
+            try:
+                if requests.get(url + "/api/health", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline:
+                for p in procs: p.kill()
+                raise RuntimeError(f"worker did not start: {url}")
+            time.sleep(0.1)
+    return procs, urls
+
+
+def bench_multiproc(args):
+    # 워커 프로세스 여러 개가 SQLite 저장소 하나를 공유. 요청마다 워커를 무작위로 골라 보낸 뒤
+    #  - 방 ver == 성공한 join+update+leave 수 (어느 워커가 처리했든 ver 증가가 빠지거나 겹치지 않음)
+    #  - 모든 워커가 같은 ver/참가자 목록을 봄
+    #  - 한 워커의 long-poll이 다른 워커의 변경으로 깨어남
+    random.seed(args.seed)
+    db_path = os.path.join(_TMP, "rooms-multiproc.sqlite3")
+    procs, urls = _spawn_workers(args.workers, args.port, db_path)
+    try:
+        sess = requests.Session()
+        codes = [sess.post(random.choice(urls) + "/api/room/create", json={"ttlMinutes": 60}).json()["code"]
+                 for _ in range(args.rooms)]
+        expect = {c: {"mut": 0, "pids": []} for c in codes}
+        exp_lock = threading.Lock()
+        errors = []
+        lat = {"join": [], "update": [], "leave": [], "state": []}
+        per_thread = max(1, args.ops // args.threads)
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            s = requests.Session()
+            for _ in range(per_thread):
+                code = rnd.choice(codes)
+                base = rnd.choice(urls)
+                with exp_lock:
+                    pids = list(expect[code]["pids"])
+                x = rnd.random()
+                op = "join" if not pids or x < 0.1 else "leave" if x < 0.15 else "update" if x < 0.7 else "state"
+                t = time.perf_counter()
+                if op == "join":
+                    r = s.post(base + "/api/room/join", json={"code": code, "nickname": "m"})
+                    if r.status_code == 200:
+                        with exp_lock:
+                            expect[code]["pids"].append(r.json()["pid"]); expect[code]["mut"] += 1
+                elif op == "leave":
+                    pid = rnd.choice(pids)
+                    r = s.post(base + "/api/room/leave", json={"code": code, "pid": pid})
+                    if r.status_code == 200:
+                        with exp_lock:
+                            if pid in expect[code]["pids"]: expect[code]["pids"].remove(pid)
+                            expect[code]["mut"] += 1
+                elif op == "update":
+                    r = s.post(base + "/api/room/update", json={"code": code, "pid": rnd.choice(pids),
+                                                                "lat": 37.4 + rnd.random() / 5, "lng": 126.9 + rnd.random() / 5})
+                    if r.status_code == 200:
+                        with exp_lock:
+                            expect[code]["mut"] += 1
+                    elif r.status_code == 404 and r.json().get("error") == "participant_not_found":
+                        pass  # 같은 참가자가 다른 스레드에서 방금 나감
+                else:
+                    r = s.get(base + f"/api/room/state?code={code}&delta=1")
+                lat[op].append(time.perf_counter() - t)
+                if r.status_code not in (200, 404) or (r.status_code == 404 and op != "update"):
+                    errors.append((op, code, r.status_code))
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.threads)]
+        for th in threads: th.start()
+        for th in threads: th.join()
+        el = time.perf_counter() - t0
+
+        bad = set()
+        for code in codes:
+            for url in urls:
+                if not _room_matches(sess.get(url + f"/api/room/state?code={code}").json(), expect[code]):
+                    bad.add(code)
+
+        # 워커 0에서 long-poll, 워커 1에서 변경 → 깨어나기까지 걸린 시간
+        code = codes[0]
+        ver = sess.get(urls[0] + f"/api/room/state?code={code}").json()["ver"]
+        woke = {}
+        def _poll():
+            t = time.perf_counter()
+            r = requests.get(urls[0] + f"/api/room/state?code={code}&since={ver}&wait=10").json()
+            woke.update(ver=r["ver"], t=time.perf_counter())
+        th = threading.Thread(target=_poll); th.start()
+        time.sleep(0.5)
+        t_join = time.perf_counter()
+        requests.post(urls[-1] + "/api/room/join", json={"code": code, "nickname": "wake"})
+        th.join()
+        wake_ms = round((woke["t"] - t_join) * 1000, 1)
+    finally:
+        for p in procs: p.terminate()
+        for p in procs: p.wait()
+    total = sum(len(v) for v in lat.values())
+    return {"scenario": "multiproc", "workers": args.workers, "rooms": args.rooms, "threads": args.threads,
+            "ops": total, "ops_per_s": round(total / el, 1),
+            "latency": {k: _latency_summary(v) for k, v in lat.items() if v},
+            "errors": len(errors), "inconsistent_rooms": len(bad),
+            "cross_worker_wake_ms": wake_ms, "cross_worker_wake_ok": woke.get("ver") == ver + 1,
+            "ok": not errors and not bad and woke.get("ver") == ver + 1}
+
+
+def _random_periods(rnd):
+    # 24시간 / 매일 같은 시간 / 밤샘(토→일 포함) / 휴무일 있는 가게를 섞음
+    kind = rnd.random()
+    if kind < 0.05:
+        return [{"open": {"day": 0, "time": "0000"}}]
+    o = rnd.choice(["0700", "1000", "1100", "1130", "1700", "1800"])
+    c = rnd.choice(["1500", "2100", "2200", "2330", "0100", "0300"])
+    days = [d for d in range(7) if rnd.random() > 0.15]
+    out = []
+    for d in days:
+        cd = d if c > o else (d + 1) % 7
+        out.append({"open": {"day": d, "time": o}, "close": {"day": cd, "time": c}})
+    return out
+
+
+def _datetime_walk(meeting_dt, periods):
+    # 컴파일 전 방식: 요청마다 periods를 돌며 모임 주의 datetime을 만들어 비교(기준선)
+    best = None
+    for p in periods or []:
+        op, cl = p.get("open") or {}, p.get("close") or {}
+        g_base = (meeting_dt.weekday() + 1) % 7
+        od = meeting_dt + timedelta(days=int(op["day"]) - g_base)
+        open_dt = datetime(od.year, od.month, od.day, int(op["time"][:2]), int(op["time"][2:]))
+        if "day" in cl:
+            cd = meeting_dt + timedelta(days=int(cl["day"]) - g_base)
+            close_dt = datetime(cd.year, cd.month, cd.day, int(cl["time"][:2]), int(cl["time"][2:]))
+            if close_dt <= open_dt:
+                close_dt += timedelta(days=1)
+        else:
+            close_dt = open_dt + timedelta(hours=24)
+        if open_dt <= meeting_dt < close_dt:
+            mins = int((close_dt - meeting_dt).total_seconds() // 60)
+            if best is None or mins > best:
+                best = mins
+    return best
+
+
+def bench_hours(args):
+    # 영업시간 필터: 요청마다 datetime으로 periods 해석 vs 보강 때 컴파일해 둔 주 단위 분 구간을 bisect로 일괄 조회
+    rnd = random.Random(args.seed)
+    venues = [_random_periods(rnd) for _ in range(args.venues)]
+    base = datetime(2026, 10, 11)   # 일요일
+    times = [base + timedelta(minutes=rnd.randrange(7 * 1440)) for _ in range(args.queries)]
+
+    t = time.perf_counter()
+    walk = [[_datetime_walk(dt, p) for p in venues] for dt in times]
+    walk_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    compiled = [server._compile_periods(p) for p in venues]
+    compile_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    batch = [server._open_minutes_batch(compiled, dt) for dt in times]
+    batch_s = time.perf_counter() - t
+
+    # 영업시간을 모르는 곳은 빼고 비교. 기준선은 토요일에 열어 일요일에 닫는 구간과 24시간 영업을 놓치므로
+    # differ는 그런 곳(기준선은 닫힘, 컴파일 쪽은 열림)
+    same = diff = 0
+    for row_w, row_b in zip(walk, batch):
+        for w, b in zip(row_w, row_b):
+            if b is False:
+                continue
+            if w == b:
+                same += 1
+            else:
+                diff += 1
+    n = args.venues * args.queries
+    return {"scenario": "hours", "venues": args.venues, "queries": args.queries,
+            "datetime_walk": {"total_ms": round(walk_s * 1000, 1), "us_per_venue": round(walk_s / n * 1e6, 3)},
+            "compiled": {"compile_ms": round(compile_s * 1000, 1), "total_ms": round(batch_s * 1000, 1),
+                         "us_per_venue": round(batch_s / n * 1e6, 3)},
+            "speedup": round(walk_s / max(batch_s, 1e-9), 1),
+            "agree": same, "differ": diff}
+
+
+def _suggest_results(rnd, pool, n_items):
+    # 이웃한 방끼리 장소가 겹치도록 풀의 한 구간에서 뽑고, 방별 값(거리/ETA)은 방마다 다르게
+    start = rnd.randrange(max(1, len(pool) - 2 * n_items))
+    picks = sorted(rnd.sample(range(start, min(len(pool), start + 2 * n_items)), n_items))
+    items = json.loads(json.dumps([pool[j] for j in picks], ensure_ascii=False))   # 요청마다 따로 만든 dict처럼
+    for d in items:
+        d["_centroid_dist_km"] = round(rnd.random() * 2, 3)
+        d["_eta_max"], d["_eta_sum"] = rnd.randrange(10, 60), rnd.randrange(60, 300)
+    return {"count": len(items), "centroid": {"lat": 37.5, "lng": 127.0}, "items": items}
+
+
+def _measure(build):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return kept, used
+
+
+def bench_results(args):
+    # 방 results 저장: 방마다 장소 문서 전체(예전) vs 공유 장소 테이블 + 방에는 vid와 방별 값만
+    rnd = random.Random(args.seed)
+    pool = [_fake_item(i) for i in range(args.venues)]
+    n_items = server.ROOM_RESULTS_MAX
+    fresh = [_suggest_results(rnd, pool, n_items) for _ in range(args.rooms)]
+
+    legacy, legacy_mem = _measure(lambda: [json.loads(json.dumps(r, ensure_ascii=False)) for r in fresh])
+
+    def _compact():
+        table = server.VenueTable()
+        rooms = []
+        for r in json.loads(json.dumps(fresh, ensure_ascii=False)):
+            compact, venues = server._compact_results(r)
+            table.acquire(venues, server._venue_ids(compact))
+            rooms.append(compact)
+        return rooms, table
+    (rooms, table), compact_mem = _measure(_compact)
+
+    legacy_bytes = len(json.dumps(legacy, ensure_ascii=False).encode("utf-8"))
+    room_bytes = len(json.dumps(rooms, ensure_ascii=False).encode("utf-8"))
+    table_bytes = len(json.dumps(table.records(), ensure_ascii=False).encode("utf-8"))
+    # 풀어 낸 결과(vid 제외)가 원래 항목과 같아야 함
+    same = all([{k: v for k, v in d.items() if k != "vid"}
+                for d in server._materialize_results(c, table.get_many(server._venue_ids(c)))["items"]] == r["items"]
+               for c, r in zip(rooms, fresh))
+    return {"scenario": "results", "rooms": args.rooms, "venue_pool": args.venues, "items_per_room": n_items,
+            "legacy": {"heap_kb": round(legacy_mem / 1024, 1), "per_room_kb": round(legacy_mem / args.rooms / 1024, 2),
+                       "json_kb": round(legacy_bytes / 1024, 1)},
+            "shared": {"heap_kb": round(compact_mem / 1024, 1), "per_room_kb": round(compact_mem / args.rooms / 1024, 2),
+                       "room_json_kb": round(room_bytes / 1024, 1), "venue_table_json_kb": round(table_bytes / 1024, 1),
+                       **table.info()},
+            "heap_reduction": round(legacy_mem / max(compact_mem, 1), 2),
+            "state_bytes_reduction": round(legacy_bytes / max(room_bytes, 1), 1),
+            "materialized_ok": same}
+
+
+def _reset_upstream_state(upstream_rps):
+    # 규모마다 같은 조건에서 시작: 업스트림 캐시/증분 풀이를 비우고 가드(버킷·브레이커)를 새로
+    for cache in (server.KAKAO_CACHE, server.ENRICH_CACHE, server.TT_CACHE):
+        cache.clear()
+    with server._ROOM_SOLVES_LOCK:
+        server._ROOM_SOLVES.clear()
+    for name in list(server.GUARDS):
+        server.GUARDS[name] = server.UpstreamGuard(name, upstream_rps or server.UPSTREAM_RPS[name])
+
+
+def _upstream_delta(before, after):
+    out = {k: v - before["calls"][k] for k, v in after["calls"].items() if v - before["calls"][k]}
+    for k in ("elements", "errors_injected", "throttles_injected", "replayed", "synthesized"):
+        if after[k] - before[k]:
+            out[k] = after[k] - before[k]
+    return out
+
+
+def _drive(stand_in, fn, jobs, threads):
+    # jobs를 스레드 threads개가 나눠 fn(client, job) → 상태 라벨. 지연/처리량/상태 분포/업스트림 호출 수
+    it = iter(jobs)
+    lock = threading.Lock()
+    lat, status = [], {}
+
+    def worker():
+        c = server.app.test_client()
+        while True:
+            with lock:
+                job = next(it, None)
+            if job is None:
+                return
+            t = time.perf_counter()
+            label = fn(c, job)
+            el = time.perf_counter() - t
+            with lock:
+                lat.append(el)
+                status[label] = status.get(label, 0) + 1
+
+    before = stand_in.snapshot()
+    t0 = time.perf_counter()
+    ths = [threading.Thread(target=worker) for _ in range(threads)]
+    for th in ths: th.start()
+    for th in ths: th.join()
+    el = time.perf_counter() - t0
+    return {"requests": len(lat), "throughput_rps": round(len(lat) / el, 1) if el else None,
+            "latency": _latency_summary(lat) if lat else None, "status": status,
+            "upstream": _upstream_delta(before, stand_in.snapshot())}
+
+
+def _post_label(c, url, body):
+    r = c.post(url, json=body)
+    j = r.get_json(silent=True) or {}
+    return f"{r.status_code}" + (" partial" if j.get("partial") else "") + (" degraded" if j.get("degraded") else "")
+
+
+def _load_scale(args, stand_in, n, rnd):
+    _reset_upstream_state(args.upstream_rps)
+    c = server.app.test_client()
+    rooms = []   # (code, host_secret, [pid])
+    for people in _synthetic_rooms(n, rnd):
+        j = c.post("/api/room/create", json={"ttlMinutes": 60, "meetingTime": "2026-10-16T19:00:00"}).get_json()
+        pids = []
+        for p in people:
+            pid = c.post("/api/room/join", json={"code": j["code"], "nickname": "b"}).get_json()["pid"]
+            c.post("/api/room/update", json={"code": j["code"], "pid": pid, **p})
+            pids.append(pid)
+        rooms.append((j["code"], j["hostSecret"], pids))
+    out = {"rooms": n, "participants": sum(len(r[2]) for r in rooms)}
+    phases = args.phases.split(",")
+
+    if "churn" in phases:
+        # 위치 갱신 60% / 변경분 조회 30% / 새 참가 10%
+        ops = []
+        for _ in range(n * args.churn):
+            code, _hs, pids = rnd.choice(rooms)
+            r = rnd.random()
+            ops.append(("update", code, rnd.choice(pids)) if r < 0.6 else ("state", code, None) if r < 0.9
+                       else ("join", code, None))
+
+        def churn(cl, op):
+            kind, code, pid = op
+            if kind == "update":
+                r = cl.post("/api/room/update", json={"code": code, "pid": pid, "lat": 37.45 + rnd.random() / 5,
+                                                      "lng": 126.9 + rnd.random() / 4})
+            elif kind == "state":
+                r = cl.get(f"/api/room/state?code={code}&delta=1")
+            else:
+                r = cl.post("/api/room/join", json={"code": code, "nickname": "c"})
+            return f"{kind} {r.status_code}"
+        out["churn"] = _drive(stand_in, churn, ops, args.threads)
+
+    if "eta" in phases:
+        out["eta"] = _drive(stand_in, lambda cl, code: _post_label(cl, "/api/eta-centroid", {"roomCode": code}),
+                            [r[0] for r in rooms], args.threads)
+
+    if "suggest" in phases:
+        cats = ["FD6", "CE7", "BAR"]
+        out["suggest"] = _drive(stand_in, lambda cl, job: _post_label(cl, "/api/meeting-suggest",
+                                                                      {"roomCode": job[0], "category": job[1]}),
+                                [(r[0], cats[i % len(cats)]) for i, r in enumerate(rooms)], args.threads)
+
+    if "persist" in phases and server.STORE.name == "memory":
+        # rooms.dat 압축(스냅샷) + 재시작 복구 시간과 크기(색인만 읽음 → 방 본문은 복구 확인에서 처음 읽힘)
+        server.ROOM_LOG.flush()
+        expect = json.dumps({r[0]: server.ROOMS.get(r[0]) for r in rooms}, sort_keys=True)
+        t = time.perf_counter()
+        server.ROOM_LOG.compact()
+        compact_s = time.perf_counter() - t
+        t = time.perf_counter()
+        server._load_rooms()
+        load_s = time.perf_counter() - t
+        resident = server.ROOMS.info()["resident"]
+        out["persist"] = {"compact_ms": round(compact_s * 1000, 1), "load_ms": round(load_s * 1000, 1),
+                          "resident_after_load": resident,
+                          "snapshot_kb": round(server.ROOMS_DAT_PATH.stat().st_size / 1024, 1),
+                          "venues": len(server.VENUES),
+                          "recovered_ok": json.dumps({r[0]: server.ROOMS.get(r[0]) for r in rooms}, sort_keys=True) == expect}
+
+    for code, hs, _pids in rooms:
+        try:
+            server.STORE.close(code, hs)
+        except server.RoomError:
+            pass
+    return out
+
+
+def _compare(base, cur):
+    # 같은 규모·단계끼리 p95와 처리량 비교: [기준, 이번, 이번/기준]
+    out = {}
+    for scale, phases in cur.get("scales", {}).items():
+        for phase, m in phases.items():
+            b = base.get("scales", {}).get(scale, {}).get(phase)
+            if not isinstance(m, dict) or not isinstance(b, dict) or not m.get("latency") or not b.get("latency"):
+                continue
+            row = {}
+            for key, x, y in (("p95_ms", b["latency"]["p95_ms"], m["latency"]["p95_ms"]),
+                              ("throughput_rps", b["throughput_rps"], m["throughput_rps"])):
+                row[key] = [x, y, round(y / x, 3) if x else None]
+            out[f"{scale}/{phase}"] = row
+    return out
+
+
+def bench_load(args):
+    # 대역 서버 위에서 규모(방 수)별로 방 churn, /api/eta-centroid, /api/meeting-suggest, rooms.dat 영속화를 측정
+    rnd = random.Random(args.seed)
+    stand_in = bench_upstream.StandIn(0, args.fixtures, None, args.latency_ms, args.latency_sigma,
+                                      args.error_rate, args.throttle_rate, args.seed).start()
+    server.KAKAO_API_BASE = server.GOOGLE_API_BASE = stand_in.url
+    server.KAKAO_REST_KEY = server.GOOGLE_API_KEY = "bench"
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=pathlib.Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    out = {"scenario": "load", "commit": commit, "store": server.STORE.name, "numpy": server._np is not None,
+           "config": {"threads": args.threads, "churn_per_room": args.churn, "latency_ms": args.latency_ms,
+                      "latency_sigma": args.latency_sigma, "error_rate": args.error_rate,
+                      "throttle_rate": args.throttle_rate, "upstream_rps": args.upstream_rps or None,
+                      "fixtures": len(stand_in.fixtures), "seed": args.seed},
+           "scales": {}}
+    try:
+        for n in (int(x) for x in args.scales.split(",") if x):
+            out["scales"][str(n)] = _load_scale(args, stand_in, n, rnd)
+    finally:
+        stand_in.stop()
+    if args.compare:
+        out["compare"] = _compare(json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8")), out)
+    if args.out:
+        pathlib.Path(args.out).write_text(json.dumps(out, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+                                          encoding="utf-8")
+    return out
+
+
+def _proc_usage(pid):
+    # (스레드 수, RSS MB). /proc이 없으면 (None, None)
+    try:
+        fields = dict(line.split(":", 1) for line in pathlib.Path(f"/proc/{pid}/status").read_text().splitlines() if ":" in line)
+        return int(fields["Threads"]), round(int(fields["VmRSS"].split()[0]) / 1024, 1)
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+async def _post_raw(port, path, body, timeout):
+    # 연결마다 소켓 하나(Connection: close). 클라이언트 쪽 스레드 없이 수천 개를 동시에 열기 위함 → (라벨, 초)
+    data = json.dumps(body).encode("utf-8")
+    t = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), timeout)
+        writer.write((f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), max(0.1, timeout - (time.perf_counter() - t)))
+        writer.close()
+    except asyncio.TimeoutError:
+        return "timeout", time.perf_counter() - t
+    except OSError:
+        return "conn_error", time.perf_counter() - t
+    el = time.perf_counter() - t
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    try:
+        status = int(head.split(b" ", 2)[1])
+        j = json.loads(payload)
+    except (IndexError, ValueError):
+        return "bad_response", el
+    return f"{status}" + (" partial" if j.get("partial") else ""), el
+
+
+def _concurrency_level(port, pid, bodies, timeout):
+    # bodies를 한꺼번에 보내고 끝날 때까지 서버 프로세스의 스레드 수/RSS 최대값을 샘플링
+    peak = {"threads": 0, "rss_mb": 0.0}
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            th, rss = _proc_usage(pid)
+            if th is not None:
+                peak["threads"] = max(peak["threads"], th); peak["rss_mb"] = max(peak["rss_mb"], rss)
+            done.wait(0.05)
+
+    async def burst():
+        return await asyncio.gather(*[_post_raw(port, "/api/eta-centroid", b, timeout) for b in bodies])
+
+    sampler = threading.Thread(target=sample); sampler.start()
+    t0 = time.perf_counter()
+    try:
+        res = asyncio.run(burst())
+    finally:
+        done.set(); sampler.join()
+    el = time.perf_counter() - t0
+    status = {}
+    for label, _el in res:
+        status[label] = status.get(label, 0) + 1
+    ok = [e for label, e in res if label == "200"]
+    return {"requests": len(res), "ok": len(ok), "status": status, "wall_s": round(el, 2),
+            "throughput_rps": round(len(ok) / el, 1) if el else None,
+            "latency": _latency_summary([e for _l, e in res]), "peak_threads": peak["threads"], "peak_rss_mb": peak["rss_mb"]}
+
+
+def bench_concurrency(args):
+    # 업스트림 지연이 긴 /api/eta-centroid를 동시에 levels개씩 보내 SERVER_MODE=sync(스레드)와 async(ASGI)의 한계를 비교
+    #  - 요청마다 참가자 좌표가 달라 이동시간 캐시가 맞지 않음(매번 업스트림을 기다림)
+    #  - ok = 200이고 partial이 아닌 응답(마감 안에 업스트림 결과를 다 받음)
+    rnd = random.Random(args.seed)
+    stand_in = bench_upstream.StandIn(0, args.fixtures, None, args.latency_ms, args.latency_sigma,
+                                      args.error_rate, args.throttle_rate, args.seed).start()
+    out = {"scenario": "concurrency", "config": {"latency_ms": args.latency_ms, "latency_sigma": args.latency_sigma,
+                                                  "fanout_workers": args.fanout, "upstream_rps": args.upstream_rps,
+                                                  "timeout_s": args.timeout, "seed": args.seed}, "modes": {}}
+    levels = [int(x) for x in args.levels.split(",") if x]
+    try:
+        for i, mode in enumerate(m for m in args.modes.split(",") if m):
+            if mode == "async":
+                try:
+                    import uvicorn, asgiref  # noqa: F401
+                except ImportError:
+                    out["modes"][mode] = {"skipped": "uvicorn/asgiref not installed"}
+                    continue
+            port = args.port + i
+            env = {**os.environ, "SERVER_MODE": mode, "PORT": str(port),
+                   "ROOMS_PATH": os.path.join(_TMP, f"rooms-{mode}.json"), "CACHE_DB_PATH": "", "TT_CACHE_PERSIST": "0",
+                   "KAKAO_API_BASE": stand_in.url, "GOOGLE_API_BASE": stand_in.url,
+                   "KAKAO_REST_KEY": "bench", "GOOGLE_PLACES_KEY": "bench",
+                   "FANOUT_WORKERS": str(args.fanout), "UPSTREAM_POOL_SIZE": str(args.fanout),
+                   "KAKAO_RPS": str(args.upstream_rps), "GOOGLE_RPS": str(args.upstream_rps)}
+            proc = subprocess.Popen([sys.executable, server.__file__], env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                deadline = time.time() + 30
+                while True:
+                    try:
+                        if requests.get(f"http://127.0.0.1:{port}/api/health", timeout=1).ok:
+                            break
+                    except requests.RequestException:
+                        pass
+                    if time.time() > deadline or proc.poll() is not None:
+                        raise RuntimeError(f"{mode} server did not start")
+                    time.sleep(0.1)
+                idle = _proc_usage(proc.pid)
+                res = {"idle_threads": idle[0], "idle_rss_mb": idle[1], "levels": {}}
+                for n in levels:
+                    bodies = [{"participants": [dict(p, mode="car") for p in people], "strategy": "grid"}
+                              for people in _synthetic_rooms(n, rnd)]
+                    res["levels"][str(n)] = _concurrency_level(port, proc.pid, bodies, args.timeout)
+                out["modes"][mode] = res
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        stand_in.stop()
+    return out
+
+
+SCENARIOS = {"wal": bench_wal, "stress": bench_stress, "multiproc": bench_multiproc, "search": bench_search,
+             "hours": bench_hours, "results": bench_results, "load": bench_load, "concurrency": bench_concurrency}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("scenario", choices=sorted(SCENARIOS))
+    ap.add_argument("--rooms", type=int, default=200)
+    ap.add_argument("--updates", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--ops", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--port", type=int, default=5600)
+    ap.add_argument("--budget", type=int, default=48)
+    ap.add_argument("--radius", type=int, default=2000)
+    ap.add_argument("--snap", action="store_true", help="search: 후보를 역/장소로 스냅")
+    ap.add_argument("--prefilter", type=int, default=0, help="search: 로컬 추정 상위 N만 평가하는 grid도 비교")
+    ap.add_argument("--venues", type=int, default=2000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--scales", default="10,100,1000", help="load: 방 수 목록")
+    ap.add_argument("--phases", default="churn,eta,suggest,persist", help="load: 측정할 단계")
+    ap.add_argument("--churn", type=int, default=5, help="load: 방당 churn 요청 수")
+    ap.add_argument("--fixtures", help="load: 대역 서버가 재생할 녹화 파일(JSONL)")
+    ap.add_argument("--latency-ms", type=float, default=30.0, help="load: 업스트림 지연 중앙값")
+    ap.add_argument("--latency-sigma", type=float, default=0.5, help="load: 지연 로그정규 분포의 sigma")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="load: 업스트림 500 비율")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="load: 업스트림 스로틀 비율")
+    ap.add_argument("--upstream-rps", type=float, default=1000.0, help="load/concurrency: 업스트림 가드 속도(0이면 서버 설정)")
+    ap.add_argument("--out", help="load: 결과 JSON 파일")
+    ap.add_argument("--compare", help="load: 비교할 이전 결과 JSON")
+    ap.add_argument("--levels", default="100,500,2000", help="concurrency: 동시 요청 수 목록")
+    ap.add_argument("--modes", default="sync,async", help="concurrency: 비교할 SERVER_MODE")
+    ap.add_argument("--fanout", type=int, default=64, help="concurrency: 서버 FANOUT_WORKERS")
+    ap.add_argument("--timeout", type=float, default=60.0, help="concurrency: 클라이언트 요청 타임아웃(초)")
+    args = ap.parse_args(argv)
+    print(json.dumps(SCENARIOS[args.scenario](args), ensure_ascii=False, indent=2, sort_keys=args.scenario == "load"))
+
+
+if __name__ == "__main__":
+    main()
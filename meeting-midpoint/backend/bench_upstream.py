@@ -0,0 +1,258 @@
+"""bench.py load용 업스트림 대역 서버.
+
+카카오 로컬 검색, 구글 Places(nearbysearch/details), Distance Matrix와 같은 경로로 응답함.
+녹화해 둔 응답(fixtures, JSONL)이 있으면 그대로 돌려주고, 없으면 요청 파라미터로 정해지는 합성 응답을 만듦.
+지연은 로그정규 분포(중앙값 --latency-ms, --latency-sigma), 오류/스로틀은 확률로 섞음.
+
+    python bench_upstream.py --port 5900 --fixtures fixtures.jsonl --latency-ms 40 --error-rate 0.01
+    python bench_upstream.py --port 5900 --record fixtures.jsonl     # 실제 API로 넘기면서 응답을 녹화
+
+서버는 KAKAO_API_BASE / GOOGLE_API_BASE를 http://127.0.0.1:<port>로 두면 이쪽을 부름.
+녹화는 서버를 실제 키로 띄워야 함(카카오 키는 Authorization 헤더, 구글 키는 key 파라미터로 그대로 넘김).
+"""
+import sys, json, math, time, random, hashlib, argparse, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+
+REAL_BASES = {"kakao": "https://dapi.kakao.com", "google": "https://maps.googleapis.com"}
+ENDPOINTS = {
+    "/v2/local/search/category.json": ("kakao", "kakao_category"),
+    "/v2/local/search/keyword.json": ("kakao", "kakao_keyword"),
+    "/maps/api/place/nearbysearch/json": ("google", "google_nearby"),
+    "/maps/api/place/details/json": ("google", "google_details"),
+    "/maps/api/distancematrix/json": ("google", "google_distance_matrix"),
+}
+# 녹화/재생 키에서 뺄 파라미터(키, 매번 달라지는 출발 시각)
+VOLATILE_PARAMS = ("key", "departure_time")
+# Distance Matrix 합성: 모드별 (속도 km/h, 우회 계수, 고정 분)
+DM_MODES = {"driving": (32.0, 1.35, 2.0), "walking": (4.8, 1.2, 0.0), "bus": (18.0, 1.25, 7.0),
+            "subway": (33.0, 1.15, 9.0), "transit": (25.0, 1.2, 8.0)}
+
+
+def fixture_key(path, params):
+    return path + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()) if k not in VOLATILE_PARAMS)
+
+
+def _rng(*parts):
+    return random.Random(hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest())
+
+
+def _km(lat1, lng1, lat2, lng2):
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 6371.0 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+# ── 합성 응답
+def synth_kakao(params):
+    # 검색 중심 셀(약 100m)과 검색어/카테고리로 정해지는 장소 목록을 거리순으로 쪽 단위로 자름
+    lat, lng = float(params["y"]), float(params["x"])
+    radius = int(params.get("radius") or 2000)
+    size, page = int(params.get("size") or 15), int(params.get("page") or 1)
+    what = params.get("query") or params.get("category_group_code") or "-"
+    cell = f"{round(lat, 3)}:{round(lng, 3)}"
+    rnd = _rng("kakao", cell, what, radius)
+    total = rnd.randint(5, 60)
+    docs = []
+    for i in range(total):
+        d = radius * math.sqrt(rnd.random())
+        th = rnd.random() * 2 * math.pi
+        vlat = lat + d * math.cos(th) / 111320.0
+        vlng = lng + d * math.sin(th) / (111320.0 * math.cos(math.radians(lat)))
+        vid = str(int(hashlib.sha1(f"{cell}|{what}|{i}".encode()).hexdigest()[:8], 16))
+        docs.append({"id": vid, "place_name": f"{what} {i}", "category_name": "음식점 > 벤치",
+                     "category_group_code": params.get("category_group_code") or "FD6",
+                     "phone": "02-000-0000", "address_name": "서울 벤치구", "road_address_name": "서울 벤치로",
+                     "x": f"{vlng:.7f}", "y": f"{vlat:.7f}", "distance": str(int(d)),
+                     "place_url": f"http://place.map.kakao.com/{vid}"})
+    docs.sort(key=lambda x: int(x["distance"]))
+    lo = (page - 1) * size
+    return 200, {"documents": docs[lo:lo + size],
+                 "meta": {"total_count": total, "pageable_count": total, "is_end": lo + size >= total}}
+
+
+def synth_nearby(params):
+    rnd = _rng("nearby", params.get("keyword"), params.get("location"))
+    if rnd.random() < 0.1:
+        return 200, {"status": "ZERO_RESULTS", "results": []}
+    pid = "B" + hashlib.sha1(f"{params.get('keyword')}|{params.get('location')}".encode()).hexdigest()[:20]
+    return 200, {"status": "OK", "results": [{"place_id": pid, "name": params.get("keyword")}]}
+
+
+def synth_details(params):
+    # 영업시간: 대부분 11~22시, 일부 밤샘/24시간/휴무일
+    rnd = _rng("details", params.get("place_id"))
+    kind = rnd.random()
+    if kind < 0.1:
+        periods = [{"open": {"day": 0, "time": "0000"}}]
+    else:
+        o, c = rnd.choice([(1100, 2200), (1000, 2100), (1700, 200), (1130, 1500), (800, 2300)])
+        off = rnd.randrange(7) if kind < 0.4 else None
+        periods = []
+        for day in range(7):
+            if day == off:
+                continue
+            cday = day if c > o else (day + 1) % 7
+            periods.append({"open": {"day": day, "time": f"{o:04d}"}, "close": {"day": cday, "time": f"{c:04d}"}})
+    hours = {"open_now": True, "periods": periods,
+             "weekday_text": [f"{d}: 벤치 영업시간" for d in ("월", "화", "수", "목", "금", "토", "일")]}
+    return 200, {"status": "OK", "result": {"formatted_phone_number": "02-000-0000", "website": "https://example.com",
+                                            "photos": [{"photo_reference": "bench-" + str(params.get("place_id"))}],
+                                            "opening_hours": hours, "current_opening_hours": hours}}
+
+
+def synth_distance_matrix(params):
+    def _pts(s):
+        return [tuple(map(float, p.split(","))) for p in (s or "").split("|") if p]
+    mode = params.get("transit_mode") or params.get("mode") or "driving"
+    speed, detour, fixed = DM_MODES.get(mode, DM_MODES["driving"])
+    rows = []
+    for olat, olng in _pts(params.get("origins")):
+        els = []
+        for dlat, dlng in _pts(params.get("destinations")):
+            sec = int((fixed + _km(olat, olng, dlat, dlng) * detour / speed * 60) * 60)
+            els.append({"status": "OK", "duration": {"value": sec, "text": f"{sec // 60} mins"}})
+        rows.append({"elements": els})
+    return 200, {"status": "OK", "rows": rows}
+
+
+SYNTH = {"kakao_category": synth_kakao, "kakao_keyword": synth_kakao, "google_nearby": synth_nearby,
+         "google_details": synth_details, "google_distance_matrix": synth_distance_matrix}
+
+
+class StandIn:
+    # 대역 서버 본체. 통계는 엔드포인트별 호출 수 + 주입한 오류/스로틀 + 재생/합성 수
+    def __init__(self, port=0, fixtures=None, record=None, latency_ms=30.0, latency_sigma=0.5,
+                 error_rate=0.0, throttle_rate=0.0, seed=7):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.fixtures = {}
+        if fixtures:
+            with open(fixtures, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self.fixtures[rec["key"]] = (rec["status"], rec["body"])
+        self._record = open(record, "a", encoding="utf-8") if record else None
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {}
+        self.reset_stats()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"calls": {name: 0 for _u, name in ENDPOINTS.values()}, "elements": 0,
+                          "errors_injected": 0, "throttles_injected": 0, "replayed": 0, "synthesized": 0,
+                          "recorded": 0}
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="bench-upstream", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        if self._record:
+            self._record.close()
+
+    def _draw(self):
+        with self._lock:
+            delay = self.latency_ms * math.exp(self._rnd.gauss(0, self.latency_sigma)) / 1000.0 if self.latency_ms else 0.0
+            r = self._rnd.random()
+        fault = "error" if r < self.error_rate else "throttle" if r < self.error_rate + self.throttle_rate else None
+        return delay, fault
+
+    def respond(self, path, params, headers):
+        upstream, name = ENDPOINTS[path]
+        delay, fault = self._draw()
+        with self._lock:
+            self.stats["calls"][name] += 1
+            if name == "google_distance_matrix":
+                self.stats["elements"] += (params.get("origins", "").count("|") + 1) * (params.get("destinations", "").count("|") + 1)
+        if self._record:
+            resp = requests.get(REAL_BASES[upstream] + path, params=params, timeout=10,
+                                headers={k: v for k, v in headers.items() if k.lower() == "authorization"})
+            status, body = resp.status_code, resp.json()
+            with self._lock:
+                self._record.write(json.dumps({"key": fixture_key(path, params), "status": status, "body": body},
+                                              ensure_ascii=False) + "\n")
+                self._record.flush()
+                self.stats["recorded"] += 1
+            return status, body
+        time.sleep(delay)
+        if fault == "error":
+            with self._lock:
+                self.stats["errors_injected"] += 1
+            return 500, {"errorType": "InternalError", "message": "injected"}
+        if fault == "throttle":
+            with self._lock:
+                self.stats["throttles_injected"] += 1
+            if upstream == "kakao":
+                return 429, {"errorType": "RequestThrottled", "message": "injected"}
+            return 200, {"status": "OVER_QUERY_LIMIT", "rows": [], "results": []}
+        hit = self.fixtures.get(fixture_key(path, params))
+        with self._lock:
+            self.stats["replayed" if hit else "synthesized"] += 1
+        return hit if hit else SYNTH[name](params)
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive(서버 쪽 세션 풀과 같은 조건)
+
+            def do_GET(self):
+                u = urlsplit(self.path)
+                if u.path == "/__stats":
+                    status, body = 200, stand_in.snapshot()
+                elif u.path in ENDPOINTS:
+                    status, body = stand_in.respond(u.path, dict(parse_qsl(u.query)), self.headers)
+                else:
+                    status, body = 404, {"error": "unknown_endpoint", "path": u.path}
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *a):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=5900)
+    ap.add_argument("--fixtures", help="재생할 녹화 파일(JSONL)")
+    ap.add_argument("--record", help="실제 API로 넘기며 이 파일에 녹화")
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--latency-sigma", type=float, default=0.5)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args(argv)
+    s = StandIn(args.port, args.fixtures, args.record, args.latency_ms, args.latency_sigma,
+                args.error_rate, args.throttle_rate, args.seed)
+    print(f"bench upstream on {s.url} (fixtures={len(s.fixtures)}, record={bool(args.record)})", file=sys.stderr)
+    try:
+        s.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
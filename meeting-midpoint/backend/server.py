@@ -1,8 +1,15 @@
-import os, math, time, json, random, string, pathlib, logging
+import os, io, sys, math, time, json, random, string, pathlib, logging, threading, contextvars, sqlite3, atexit, heapq, hashlib, bisect, asyncio, mmap, itertools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, TimeoutError as FuturesTimeout
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from abc import ABC, abstractmethod
+from array import array
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Tuple
-from flask import Flask, request, jsonify, send_from_directory, make_response
+from typing import List, Dict, Tuple, Callable
+from flask import Flask, Response, request, jsonify, send_from_directory, make_response, stream_with_context, g
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv, find_dotenv
 
 # ── Load .env
@@ -28,6 +35,14 @@ try:
 except Exception:
     pass
 
+# (선택) numpy가 있으면 ETA 행렬/후보 순위를 벡터화. ETA_NUMPY=0이면 순수 파이썬 경로
+try:
+    import numpy as _np
+    if os.getenv("ETA_NUMPY", "1") == "0":
+        _np = None
+except Exception:
+    _np = None
+
 # 개발 중 캐시 끔(브라우저가 예전 JS를 붙잡는 이슈 방지)
 app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
 
@@ -39,10 +54,772 @@ log = logging.getLogger("meetpoint")
 KAKAO_REST_KEY = (os.getenv("KAKAO_REST_KEY") or "").strip()
 GOOGLE_API_KEY = (os.getenv("GOOGLE_PLACES_KEY") or os.getenv("GOOGLE_MAPS_KEY") or "").strip()
 KAKAO_JS_KEY   = (os.getenv("KAKAO_JS_KEY") or "").strip()
+# 업스트림 주소. 벤치마크(bench.py load)는 녹화된 응답을 돌려주는 로컬 대역 서버로 바꿔 끼움
+KAKAO_API_BASE  = (os.getenv("KAKAO_API_BASE") or "https://dapi.kakao.com").rstrip("/")
+GOOGLE_API_BASE = (os.getenv("GOOGLE_API_BASE") or "https://maps.googleapis.com").rstrip("/")
+
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE") or 16)     # 업스트림 호스트당 최대 커넥션
+FANOUT_WORKERS     = int(os.getenv("FANOUT_WORKERS") or 32)         # 병렬 업스트림 호출 스레드 수
+UPSTREAM_TIMEOUT_S = float(os.getenv("UPSTREAM_TIMEOUT_S") or 10)   # 호출 1건 타임아웃
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S") or 15)   # API 요청 1건 전체 마감
+
+# ── Upstream HTTP (업스트림별 keep-alive 세션 + 병렬 fan-out)
+def _make_session() -> requests.Session:
+    sess = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=UPSTREAM_POOL_SIZE, pool_block=True)
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
+    return sess
+
+SESSIONS: Dict[str, requests.Session] = {"kakao": _make_session(), "google": _make_session()}
+_FANOUT = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="upstream")
+_DEADLINE: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+_PROGRESS: contextvars.ContextVar = contextvars.ContextVar("progress", default=None)   # 비동기 작업 안에서만 Job
+
+class DeadlineExceeded(Exception):
+    pass
+
+@contextmanager
+def _deadline(seconds: float = REQUEST_DEADLINE_S):
+    # 요청 단위 마감시각. 중첩되면 더 이른 쪽을 따름
+    cur = _DEADLINE.get()
+    dl = time.monotonic() + seconds
+    token = _DEADLINE.set(dl if cur is None else min(cur, dl))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+def _with_deadline(fn):
+    @wraps(fn)
+    def wrapper(*a, **kw):
+        with _deadline():
+            return fn(*a, **kw)
+    return wrapper
+
+def _progress(stage: str, **fields):
+    # 진행 상황 보고. 비동기 작업 안이 아니면(동기 요청) 아무것도 안 함
+    job = _PROGRESS.get()
+    if job is not None:
+        job.report(stage, **fields)
+
+def _time_left() -> float | None:
+    dl = _DEADLINE.get()
+    return None if dl is None else dl - time.monotonic()
+
+# ── Metrics: 카운터/히스토그램/게이지를 모아 /api/metrics(Prometheus 텍스트)로 노출
+# 단계 구간(_span)은 stage 히스토그램에 쌓이고, 요청 안이면 Server-Timing 헤더용으로도 모음
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") != "0"   # 모든 API 응답에 Server-Timing(아니면 ?timing=1인 요청만)
+_TIMINGS: contextvars.ContextVar = contextvars.ContextVar("timings", default=None)   # 요청별 [(단계, 초)]
+
+class Metrics:
+    # 라벨은 키워드 인자. 값이 적은 것(경로 규칙, API 이름, 상태 코드, 단계)만 라벨로 씀
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}    # 이름 → (type, help)
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._hists: Dict[Tuple[str, tuple], List[float]] = {}   # 버킷별 개수 + [합, 개수]
+        self._gauges: Dict[str, Callable] = {}         # 이름 → () -> 값 | {라벨 tuple: 값}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = [0.0] * (len(METRIC_BUCKETS) + 2)
+            h[bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1   # 마지막 버킷 칸은 +Inf
+            h[-2] += seconds
+            h[-1] += 1
+
+    def gauge(self, name: str, help_text: str, fn: Callable):
+        self.describe(name, "gauge", help_text)
+        self._gauges[name] = fn
+
+    def render(self) -> str:
+        def _labels(pairs):
+            if not pairs:
+                return ""
+            esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted((k, list(v)) for k, v in self._hists.items())
+        by_name: Dict[str, List[str]] = {}
+        for (name, labels), v in counters:
+            by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {v:g}")
+        for (name, labels), h in hists:
+            rows = by_name.setdefault(name, [])
+            acc = 0.0
+            for le, n in zip([*(f"{b:g}" for b in METRIC_BUCKETS), "+Inf"], h[:-2]):
+                acc += n
+                rows.append(f"{name}_bucket{_labels(labels + (('le', le),))} {acc:g}")
+            rows.append(f"{name}_sum{_labels(labels)} {h[-2]:.6f}")
+            rows.append(f"{name}_count{_labels(labels)} {h[-1]:g}")
+        for name, fn in self._gauges.items():
+            try:
+                v = fn()
+            except Exception as e:
+                log.warning("metrics gauge %s failed: %s", name, e)
+                continue
+            items = v.items() if isinstance(v, dict) else [((), v)]
+            by_name[name] = [f"{name}{_labels(labels)} {float(x):g}" for labels, x in items]
+        out = []
+        for name in sorted(by_name):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *by_name[name]]
+        return "\n".join(out) + "\n"
+
+METRICS = Metrics()
+METRICS.describe("meetpoint_http_requests_total", "counter", "API requests by route, method and status")
+METRICS.describe("meetpoint_http_request_seconds", "histogram", "API request latency by route")
+METRICS.describe("meetpoint_stage_seconds", "histogram", "Pipeline stage duration")
+METRICS.describe("meetpoint_upstream_requests_total", "counter", "Upstream calls by API and status (or refusal reason)")
+METRICS.describe("meetpoint_upstream_seconds", "histogram", "Upstream call latency by API")
+
+@contextmanager
+def _span(stage: str):
+    # 파이프라인 단계 시간. _fan_out 작업 안에서도 같은 요청 목록에 쌓임(컨텍스트 복사)
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        el = time.perf_counter() - t
+        METRICS.observe("meetpoint_stage_seconds", el, stage=stage)
+        timings = _TIMINGS.get()
+        if timings is not None:
+            timings.append((stage, el))
+
+def _spanned(stage: str, fn: Callable) -> Callable:
+    # _fan_out에 넘길 작업을 단계 구간으로 감쌈
+    def run():
+        with _span(stage):
+            return fn()
+    return run
+
+# ── Upstream 보호: 업스트림별 적응형 토큰 버킷 + 서킷 브레이커 + API별 하루 사용량 예산
+# 스로틀(429/OVER_QUERY_LIMIT)이 오면 속도를 절반으로 줄이고 성공마다 조금씩 되돌림
+# 연속 실패가 쌓이면 브레이커가 열려 BREAKER_COOLDOWN_S 동안 호출 없이 바로 실패 → 호출 쪽은 속도기반 ETA/보강 없는 결과로 대체
+UPSTREAM_RPS       = {"kakao": float(os.getenv("KAKAO_RPS") or 20), "google": float(os.getenv("GOOGLE_RPS") or 50)}
+RATE_MIN_RPS       = float(os.getenv("RATE_MIN_RPS") or 1)         # 스로틀이 계속돼도 이 밑으로는 안 내림
+RATE_MAX_WAIT_S    = float(os.getenv("RATE_MAX_WAIT_S") or 2)      # 토큰을 이보다 오래 기다려야 하면 바로 실패
+BREAKER_FAILURES   = int(os.getenv("BREAKER_FAILURES") or 5)       # 연속 실패가 이만큼이면 열림
+BREAKER_COOLDOWN_S = float(os.getenv("BREAKER_COOLDOWN_S") or 30)  # 열린 뒤 이 시간이 지나면 시험 호출 1건 허용
+# API별 하루 예산(0이면 무제한): QUOTA_<API>_REQUESTS, QUOTA_<API>_ELEMENTS. 사용량은 프로세스별로 셈
+UPSTREAM_APIS = ("kakao_local", "google_nearby", "google_details", "google_distance_matrix")
+QUOTAS = {api: (int(os.getenv(f"QUOTA_{api.upper()}_REQUESTS") or 0), int(os.getenv(f"QUOTA_{api.upper()}_ELEMENTS") or 0))
+          for api in UPSTREAM_APIS}
+# 200으로 와도 본문에 이게 있으면 스로틀로 봄
+THROTTLE_MARKERS = {"google": ("OVER_QUERY_LIMIT", "RESOURCE_EXHAUSTED"), "kakao": ("RequestThrottled",)}   # 에러 본문의 status/error.status/errorType
+
+class UpstreamUnavailable(Exception):
+    # 호출을 보내지 않고 실패(reason: circuit_open | rate_limited | quota_exhausted)
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream}: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+class TokenBucket:
+    # 초당 rate개씩 차는 버킷(최대 max_rate개). 토큰은 미리 차감해 두고 모자란 만큼 기다림
+    def __init__(self, rate: float):
+        self.max_rate = self.rate = max(rate, RATE_MIN_RPS)
+        self.tokens = self.max_rate
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"throttled": 0, "rejected": 0, "waited_ms": 0}
+
+    def acquire(self, max_wait: float) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.max_rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.0)
+            if wait > max_wait:
+                self.stats["rejected"] += 1
+                return False
+            self.tokens -= 1
+            self.stats["waited_ms"] += int(wait * 1000)
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def refund(self):
+        # 토큰을 받고도 호출을 안 보냈으면 돌려놓음
+        with self._lock:
+            self.tokens = min(self.max_rate, self.tokens + 1)
+
+    def on_throttle(self, retry_after: float | None):
+        with self._lock:
+            self.stats["throttled"] += 1
+            self.rate = max(RATE_MIN_RPS, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class CircuitBreaker:
+    # closed → (연속 실패 BREAKER_FAILURES) → open → (쿨다운) → half_open: 시험 호출 1건 → 성공이면 closed, 실패면 다시 open
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "short_circuited": 0}
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._open_locked()
+
+    def _open_locked(self) -> bool:
+        return self.state == "open" and time.monotonic() - self.opened_at < BREAKER_COOLDOWN_S
+
+    def short_circuit(self) -> bool:
+        # 열려 있으면 막은 호출로 세고 True(확인과 집계가 한 락 안)
+        with self._lock:
+            if not self._open_locked():
+                return False
+            self.stats["short_circuited"] += 1
+            return True
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN_S:
+                self.state, self._probing = "half_open", False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.state, self.failures, self._probing = "closed", 0, False
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= BREAKER_FAILURES:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                    log.warning("circuit opened after %d failures", self.failures)
+                self.state, self.opened_at, self._probing = "open", time.monotonic(), False
+
+class QuotaMeter:
+    # API별 하루(로컬 날짜) 요청/원소 사용량. 예산을 넘기는 호출은 그날 더 보내지 않음
+    def __init__(self):
+        self.day = None
+        self.used: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, api: str, elements: int) -> bool:
+        with self._lock:
+            today = time.strftime("%Y-%m-%d")
+            if today != self.day:
+                self.day, self.used = today, {}
+            u = self.used.setdefault(api, {"requests": 0, "elements": 0, "rejected": 0})
+            max_req, max_el = QUOTAS.get(api, (0, 0))
+            if (max_req and u["requests"] + 1 > max_req) or (max_el and u["elements"] + elements > max_el):
+                u["rejected"] += 1
+                return False
+            u["requests"] += 1
+            u["elements"] += elements
+            return True
+
+    def give_back(self, api: str, elements: int):
+        with self._lock:
+            u = self.used.get(api)
+            if u is not None:
+                u["requests"] = max(0, u["requests"] - 1)
+                u["elements"] = max(0, u["elements"] - elements)
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {"day": self.day, "used": {k: dict(v) for k, v in self.used.items()},
+                    "budgets": {api: {"requests": r, "elements": e} for api, (r, e) in QUOTAS.items() if r or e}}
+
+def _throttle_status(resp: requests.Response) -> str | None:
+    # 에러 모양 본문의 상태 문자열: Google {"status": ...} / {"error": {"status": ...}}, 카카오 {"errorType": ...}
+    # 정상 응답은 status가 OK/ZERO_RESULTS라 통과하고, 결과 안의 가게 이름 등에 같은 글자가 있어도 스로틀로 보지 않음
+    try:
+        body = resp.json()
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    err = body.get("error")
+    if isinstance(err, dict) and err.get("status"):
+        return err["status"]
+    return body.get("status") or body.get("errorType")
+
+class UpstreamGuard:
+    def __init__(self, name: str, rps: float):
+        self.name = name
+        self.bucket = TokenBucket(rps)
+        self.breaker = CircuitBreaker()
+
+    def available(self) -> bool:
+        return not self.breaker.is_open()
+
+    def before(self, api: str, elements: int, left: float | None):
+        if self.breaker.short_circuit():
+            raise UpstreamUnavailable(self.name, "circuit_open")
+        if not self.bucket.acquire(RATE_MAX_WAIT_S if left is None else min(RATE_MAX_WAIT_S, left)):
+            raise UpstreamUnavailable(self.name, "rate_limited")
+        if not QUOTA.take(api, elements):
+            self.bucket.refund()
+            raise UpstreamUnavailable(self.name, "quota_exhausted")
+        if not self.breaker.allow():
+            # 그 사이 다른 호출이 시험 호출 자리를 가져감 → 보내지 않은 만큼 되돌림
+            self.bucket.refund()
+            QUOTA.give_back(api, elements)
+            raise UpstreamUnavailable(self.name, "circuit_open")
+
+    def after(self, resp: requests.Response | None):
+        # resp=None: 연결 실패/타임아웃
+        if resp is None:
+            self.breaker.record(False)
+            return
+        markers = THROTTLE_MARKERS.get(self.name, ())
+        # 본문에 표식 글자가 있을 때만 JSON을 풀어 확인(정상 응답마다 본문을 두 번 파싱하지 않게)
+        if resp.status_code == 429 or (any(m.encode() in resp.content for m in markers)
+                                       and _throttle_status(resp) in markers):
+            try:
+                retry_after = float(resp.headers.get("Retry-After") or 0)
+            except ValueError:
+                retry_after = 0.0
+            self.bucket.on_throttle(retry_after)
+            self.breaker.record(False)
+        elif resp.status_code >= 500:
+            self.breaker.record(False)
+        else:
+            self.bucket.on_success()
+            self.breaker.record(True)
+
+    def info(self) -> Dict:
+        return {"state": self.breaker.state, "failures": self.breaker.failures,
+                "rate": round(self.bucket.rate, 2), "max_rate": self.bucket.max_rate,
+                **self.bucket.stats, **self.breaker.stats}
+
+QUOTA = QuotaMeter()
+GUARDS: Dict[str, UpstreamGuard] = {name: UpstreamGuard(name, rps) for name, rps in UPSTREAM_RPS.items()}
+
+def _http_get(upstream: str, url: str, api: str | None = None, elements: int = 1, **kw) -> requests.Response:
+    # api/elements: 하루 사용량 집계 단위(기본은 업스트림 이름, 요청 1건 = 원소 1개)
+    left = _time_left()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(url)
+    guard = GUARDS[upstream]
+    api = api or upstream
+    try:
+        guard.before(api, elements, left)
+    except UpstreamUnavailable as e:
+        METRICS.inc("meetpoint_upstream_requests_total", api=api, status=e.reason)
+        raise
+    left = _time_left()
+    timeout = UPSTREAM_TIMEOUT_S if left is None else max(0.1, min(UPSTREAM_TIMEOUT_S, left))
+    t = time.perf_counter()
+    try:
+        resp = SESSIONS[upstream].get(url, timeout=timeout, **kw)
+    except requests.RequestException:
+        METRICS.inc("meetpoint_upstream_requests_total", api=api, status="error")
+        METRICS.observe("meetpoint_upstream_seconds", time.perf_counter() - t, api=api)
+        guard.after(None)
+        raise
+    METRICS.inc("meetpoint_upstream_requests_total", api=api, status=str(resp.status_code))
+    METRICS.observe("meetpoint_upstream_seconds", time.perf_counter() - t, api=api)
+    guard.after(resp)
+    return resp
+
+def _fan_out(fns: List[Callable]) -> Tuple[List, bool]:
+    # 독립 호출을 병렬 실행. 마감까지 끝나지 않은 작업은 취소하고 None으로 채움
+    # 반환: (결과 리스트, partial 여부). 예외가 난 작업도 None
+    if not fns:
+        return [], False
+    futs = [_FANOUT.submit(contextvars.copy_context().run, fn) for fn in fns]
+    left = _time_left()
+    done, pending = wait(futs, timeout=None if left is None else max(0.0, left))
+    for f in pending:
+        f.cancel()
+    out = []
+    for f in futs:
+        if f in done and f.exception() is None:
+            out.append(f.result())
+        else:
+            if f in done:
+                log.warning("upstream task failed: %r", f.exception())
+            out.append(None)
+    if pending:
+        log.warning("deadline exceeded: %d/%d upstream tasks dropped", len(pending), len(futs))
+    return out, bool(pending)
+
+def _fan_out_iter(fns: List[Callable]):
+    # _fan_out과 같지만 끝나는 순서대로 (인덱스, 결과)를 바로 내보냄. 마감까지 못 끝난 작업은 취소하고 (인덱스, None)
+    if not fns:
+        return
+    futs = {_FANOUT.submit(contextvars.copy_context().run, fn): i for i, fn in enumerate(fns)}
+    left = _time_left()
+    seen = set()
+    try:
+        for f in as_completed(futs, timeout=None if left is None else max(0.0, left)):
+            seen.add(f)
+            if f.exception() is None:
+                yield futs[f], f.result()
+            else:
+                log.warning("upstream task failed: %r", f.exception())
+                yield futs[f], None
+    except FuturesTimeout:
+        pending = [f for f in futs if f not in seen]
+        log.warning("deadline exceeded: %d/%d upstream tasks dropped", len(pending), len(futs))
+        for f in pending:
+            f.cancel()
+            yield futs[f], None
+    finally:
+        # 소비하는 쪽이 중간에 멈추면(클라이언트 연결 끊김 등) 아직 시작 안 한 작업은 버림
+        for f in futs:
+            if f not in seen:
+                f.cancel()
+
+# ── 단계 실행기
+# 업스트림을 기다리는 파이프라인(ETA 풀이, 추천)은 제너레이터로 쓰고, 기다릴 일을 아래 단계 객체로 yield함
+# 단계가 아닌 값은 이벤트(추천 스트림의 한 줄)로 그대로 바깥에 전달
+#  - 동기 모드: _drive/_run이 그 자리에서 _fan_out 등으로 기다림(지금까지와 같은 스레드 동작)
+#  - 비동기 모드(ASGI): _arun이 이벤트 루프에서 await → 기다리는 동안 요청이 스레드를 잡지 않음
+# 업스트림 작업 자체는 두 모드 모두 _FANOUT 풀에서 돌므로 업스트림 동시 호출 수는 FANOUT_WORKERS로 묶임
+class _Calls:
+    # 독립 업스트림 작업 묶음. 보내 주는 값은 _fan_out과 같은 (결과 리스트, partial)
+    # each=True면 _fan_out_iter처럼 끝나는 순서대로 (인덱스, 결과) 하나씩 → 작업 수만큼 같은 객체를 yield
+    def __init__(self, fns: List[Callable], each: bool = False):
+        self.fns, self.each = fns, each
+        self._it = None                          # 동기: _fan_out_iter
+        self._futs: Dict | None = None           # 비동기: asyncio future → 인덱스
+        self._ready: deque = deque()
+
+    def run(self):
+        if not self.each:
+            return _fan_out(self.fns)
+        if self._it is None:
+            self._it = _fan_out_iter(self.fns)
+        return next(self._it)
+
+    async def arun(self):
+        if not self.fns:
+            return [], False
+        if self._futs is None:
+            loop = asyncio.get_running_loop()
+            self._futs = {asyncio.wrap_future(_FANOUT.submit(contextvars.copy_context().run, fn), loop=loop): i
+                          for i, fn in enumerate(self.fns)}
+        left = _time_left()
+        timeout = None if left is None else max(0.0, left)
+        if not self.each:
+            futs = list(self._futs)
+            done, pending = await asyncio.wait(futs, timeout=timeout)
+            for f in pending:
+                f.cancel()
+            if pending:
+                log.warning("deadline exceeded: %d/%d upstream tasks dropped", len(pending), len(futs))
+            return [self._result(f) if f in done else None for f in futs], bool(pending)
+        if not self._ready:
+            done, pending = await asyncio.wait(list(self._futs), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                log.warning("deadline exceeded: %d/%d upstream tasks dropped", len(pending), len(self.fns))
+            for f in done:
+                self._ready.append((self._futs.pop(f), self._result(f)))
+            if not done:
+                for f in pending:
+                    f.cancel()
+                    self._ready.append((self._futs.pop(f), None))
+        return self._ready.popleft()
+
+    @staticmethod
+    def _result(f):
+        if f.cancelled():
+            return None
+        if f.exception() is not None:
+            log.warning("upstream task failed: %r", f.exception())
+            return None
+        return f.result()
+
+    def close(self):
+        # 파이프라인이 중간에 멈추면 아직 시작 안 한 작업은 버림
+        if self._it is not None:
+            self._it.close()
+        for f in self._futs or ():
+            f.cancel()
+
+class _Blocking:
+    # 잠깐 막힐 수 있는 로컬 호출(방 저장소 읽기/쓰기). 비동기 모드에선 실행기 스레드에서 돌림
+    def __init__(self, fn: Callable):
+        self.fn = fn
+
+class _Acquire:
+    # threading.Lock 잡기. 비동기 모드에선 루프를 막지 않게, 바로 못 잡으면 실행기 스레드에서 기다림
+    def __init__(self, lock):
+        self.lock = lock
+
+def _drive(steps):
+    # 동기 실행. 이벤트는 yield하고, 파이프라인의 반환값은 이 제너레이터의 반환값(yield from으로 받음)
+    send, exc, calls = None, None, []
+    try:
+        while True:
+            try:
+                item = steps.throw(exc) if exc is not None else steps.send(send)
+            except StopIteration as e:
+                return e.value
+            send, exc = None, None
+            try:
+                if isinstance(item, _Calls):
+                    calls.append(item)
+                    send = item.run()
+                elif isinstance(item, _Blocking):
+                    send = item.fn()
+                elif isinstance(item, _Acquire):
+                    item.lock.acquire()
+                else:
+                    yield item
+            except Exception as e:
+                exc = e
+    finally:
+        steps.close()
+        for c in calls:
+            c.close()
+
+def _run(steps):
+    # 동기 실행 후 반환값만(이벤트는 버림)
+    it = _drive(steps)
+    while True:
+        try:
+            next(it)
+        except StopIteration as e:
+            return e.value
+
+async def _acquire_async(loop, lock):
+    # 실행기 스레드에서 lock.acquire(). 기다리는 중에 요청이 취소되면 나중에 잡힌 락을 바로 풀어 줌(락이 새지 않게)
+    fut = loop.run_in_executor(None, lock.acquire)
+    try:
+        await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        fut.add_done_callback(lambda f: lock.release() if not f.cancelled() and f.exception() is None else None)
+        raise
+
+async def _arun(steps, emit: Callable | None = None):
+    # 비동기 실행. 이벤트는 await emit(ev)로 넘기고(없으면 버림) 파이프라인의 반환값을 돌려줌
+    loop = asyncio.get_running_loop()
+    send, exc, calls = None, None, []
+    try:
+        while True:
+            try:
+                item = steps.throw(exc) if exc is not None else steps.send(send)
+            except StopIteration as e:
+                return e.value
+            send, exc = None, None
+            try:
+                if isinstance(item, _Calls):
+                    calls.append(item)
+                    send = await item.arun()
+                elif isinstance(item, _Blocking):
+                    send = await loop.run_in_executor(None, contextvars.copy_context().run, item.fn)
+                elif isinstance(item, _Acquire):
+                    if not item.lock.acquire(blocking=False):
+                        await _acquire_async(loop, item.lock)
+                elif emit is not None:
+                    await emit(item)
+            except Exception as e:
+                exc = e
+    finally:
+        steps.close()
+        for c in calls:
+            c.close()
+
+# ── TTL 캐시 (프로세스 내 LRU + SQLite 영속화)
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", str(pathlib.Path(__file__).with_name("cache.sqlite3")))  # 빈 값이면 메모리만
+_MISS = object()
+_CACHE_DB = None
+_CACHE_DB_LOCK = threading.Lock()
+
+def _cache_db():
+    global _CACHE_DB
+    if _CACHE_DB is None:
+        db = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS cache (ns TEXT, key TEXT, value TEXT, expires REAL, PRIMARY KEY (ns, key))")
+        db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        _CACHE_DB = db
+    return _CACHE_DB
+
+class TTLCache:
+    # 항목별 TTL을 갖는 LRU. persist=True면 SQLite에 write-through, 메모리 miss 시 디스크 조회
+    def __init__(self, ns: str, max_items: int, persist: bool = True):
+        self.ns = ns
+        self.max_items = max_items
+        self.persist = persist and bool(CACHE_DB_PATH)
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expired": 0, "puts": 0}
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            ent = self._mem.get(key)
+            if ent is not None:
+                if ent[1] > now:
+                    self._mem.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return ent[0]
+                del self._mem[key]
+                self.stats["expired"] += 1
+        if self.persist:
+            row = self._db_get(key)
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._mem_put(key, value, row[1])
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                return value
+        with self._lock:
+            self.stats["misses"] += 1
+        return _MISS
+
+    def put(self, key: str, value, ttl_s: float):
+        expires = time.time() + ttl_s
+        with self._lock:
+            self._mem_put(key, value, expires)
+            self.stats["puts"] += 1
+        if self.persist:
+            self._db_put(key, value, expires)
+
+    def put_many(self, items: List[Tuple[str, object]], ttl_s: float):
+        if not items: return
+        expires = time.time() + ttl_s
+        with self._lock:
+            for key, value in items:
+                self._mem_put(key, value, expires)
+            self.stats["puts"] += len(items)
+        if self.persist:
+            try:
+                with _CACHE_DB_LOCK:
+                    db = _cache_db()
+                    with db:  # 한 트랜잭션으로 묶어서 기록
+                        db.execute("BEGIN")
+                        db.executemany("INSERT OR REPLACE INTO cache (ns, key, value, expires) VALUES (?,?,?,?)",
+                                       [(self.ns, k, json.dumps(v, ensure_ascii=False), expires) for k, v in items])
+            except Exception as e:
+                log.warning("cache db write failed (%s): %s", self.ns, e)
+
+    def _mem_put(self, key, value, expires):
+        self._mem[key] = (value, expires)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _db_get(self, key):
+        try:
+            with _CACHE_DB_LOCK:
+                return _cache_db().execute("SELECT value, expires FROM cache WHERE ns=? AND key=?",
+                                           (self.ns, key)).fetchone()
+        except Exception as e:
+            log.warning("cache db read failed (%s): %s", self.ns, e)
+            return None
+
+    def _db_put(self, key, value, expires):
+        try:
+            with _CACHE_DB_LOCK:
+                _cache_db().execute("INSERT OR REPLACE INTO cache (ns, key, value, expires) VALUES (?,?,?,?)",
+                                    (self.ns, key, json.dumps(value, ensure_ascii=False), expires))
+        except Exception as e:
+            log.warning("cache db write failed (%s): %s", self.ns, e)
+
+    def clear(self):
+        # 메모리 쪽만 비움(벤치마크 단계 사이 초기화용). 디스크 캐시는 남음
+        with self._lock:
+            self._mem.clear()
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "size": len(self._mem), "max_items": self.max_items, "persist": self.persist}
+
+class SingleFlight:
+    # 같은 키로 동시에 들어온 호출은 먼저 온 하나만 실행하고, 나머지는 끝날 때까지 기다렸다 같은 결과(예외 포함)를 받음
+    def __init__(self):
+        self._calls: Dict[str, list] = {}   # key → [Event, 결과, 예외]
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "shared": 0}
+
+    def _begin_locked(self, key: str) -> list:
+        call = self._calls[key] = [threading.Event(), None, None]
+        self.stats["calls"] += 1
+        return call
+
+    def try_begin(self, key: str) -> list | None:
+        # 진행 중인 호출이 없을 때만 이 키의 실행 자리를 잡음(확인과 등록이 한 락 안). 잡았으면 lead로 실행해야 함
+        with self._lock:
+            return None if key in self._calls else self._begin_locked(key)
+
+    def lead(self, key: str, call: list, fn: Callable):
+        # 자리를 잡은 쪽이 실행. 끝나면(예외 포함) 기다리던 호출에 결과를 넘기고 자리를 비움
+        try:
+            call[1] = fn()
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call[0].set()
+        return call[1]
+
+    def do(self, key: str, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._begin_locked(key)
+            else:
+                self.stats["shared"] += 1
+        if leader:
+            return self.lead(key, call, fn)
+        left = _time_left()
+        if not call[0].wait(None if left is None else max(0.0, left)):
+            raise DeadlineExceeded(key)
+        if call[2] is not None:
+            raise call[2]
+        return call[1]
 
 # ── Storage
-ROOMS: Dict[str, Dict] = {}
-ROOMS_PATH = pathlib.Path(__file__).with_name("rooms.json")
+# rooms.dat = 스냅샷(방마다 JSON 한 줄 + 장소 테이블 한 줄 + 끝에 code → 바이트 오프셋 색인),
+# rooms.log = 스냅샷 이후의 방 단위 변경 레코드(append-only), rooms.json = 예전 형식 스냅샷(rooms.dat이 없을 때만 읽고, 첫 압축 때 옮김)
+# 시작할 때는 색인만 읽고 방 본문은 처음 접근할 때 mmap에서 읽음 → 부팅 시간/메모리가 쌓인 상태 크기에 비례하지 않음
+ROOMS_PATH = pathlib.Path(os.getenv("ROOMS_PATH") or pathlib.Path(__file__).with_name("rooms.json"))
+ROOMS_LOG_PATH = ROOMS_PATH.with_suffix(".log")
+ROOMS_DAT_PATH = ROOMS_PATH.with_suffix(".dat")
+ROOM_PAGE_OUT_S   = float(os.getenv("ROOM_PAGE_OUT_S") or 600)            # 스냅샷 이후 안 바뀌고 이만큼 안 쓰인 방은 메모리에서 내림(0=끔)
+WAL_FLUSH_MS      = int(os.getenv("WAL_FLUSH_MS") or 20)                  # 묶음 fsync 창
+WAL_COMPACT_BYTES = int(os.getenv("WAL_COMPACT_BYTES") or 8*1024*1024)    # 로그가 이만큼 커지면 압축
+WAL_COMPACT_S     = int(os.getenv("WAL_COMPACT_S") or 300)                # 또는 이 주기마다 압축
+ROOM_SWEEP_S      = float(os.getenv("ROOM_SWEEP_S") or 30)                # 만료 방 정리 주기
+ROOM_SLIDING_TTL  = os.getenv("ROOM_SLIDING_TTL", "1") != "0"             # 활동 시 만료시각 연장
+ROOM_TTL_EXTEND_MIN_MS = 60 * 1000                                        # 이보다 작은 연장은 기록 생략
+LONGPOLL_MAX_S    = float(os.getenv("LONGPOLL_MAX_S") or 30)              # /api/room/state?since= 최대 대기
+SSE_KEEPALIVE_S   = float(os.getenv("SSE_KEEPALIVE_S") or 15)             # SSE 주석 ping 간격
+ROOM_HISTORY_LEN  = int(os.getenv("ROOM_HISTORY_LEN") or 64)              # delta 응답용 방별 변경 이력 길이
 
 def _now_ms(): return int(time.time() * 1000)
 def _gen_code(n=6):
@@ -51,36 +828,1253 @@ def _gen_code(n=6):
 def _gen_pid():
     return "P" + "".join(random.choice(string.ascii_uppercase + string.digits) for _ in range(6))
 
-def _cleanup_and_save():
-    now = _now_ms()
-    expired = [c for c, r in list(ROOMS.items()) if r.get("expires_at", now) <= now]
-    for c in expired:
-        ROOMS.pop(c, None)
+def _apply_room_record(rooms: Dict[str, Dict], rec: Dict, venues: Dict[str, Dict]):
+    # 레코드는 모두 "값 덮어쓰기"라 같은 레코드를 다시 적용해도 결과가 같음
+    op, code = rec.get("op"), rec.get("code")
+    if op == "room":
+        rooms[code] = rec["room"]
+    elif op == "venue":
+        venues[rec["vid"]] = rec["rec"]
+    elif op == "del":
+        rooms.pop(code, None)
+    elif code in rooms:
+        room = rooms[code]
+        if op == "p":
+            room["participants"][rec["pid"]] = rec["p"]
+        elif op == "pdel":
+            room["participants"].pop(rec["pid"], None)
+        elif op == "set":
+            room.update(rec["fields"])
+        if "ver" in rec:
+            room["ver"] = rec["ver"]
+
+class RoomLog:
+    # 변경 레코드를 버퍼에 모아 WAL_FLUSH_MS마다 한 번 write+fsync, 커지면 스냅샷으로 압축
+    # snapshot(f)는 스냅샷을 f에 쓰고, 파일이 제자리에 놓인 뒤 부를 함수(새 색인 반영)를 돌려줌
+    def __init__(self, snap_path: pathlib.Path, log_path: pathlib.Path, snapshot: Callable[[io.BufferedWriter], Callable[[], None]]):
+        self.snap_path = snap_path
+        self.log_path = log_path
+        self.old_path = log_path.with_name(log_path.name + ".1")
+        self._snapshot = snapshot
+        self._buf: deque = deque()   # append/popleft는 락 없이도 원자적
+        self._io = threading.Lock()
+        self._fh = None
+        self._bytes = 0
+        self._last_compact = time.time()
+        self.stats = {"records": 0, "fsyncs": 0, "compactions": 0}
+
+    def start(self):
+        self._fh = open(self.log_path, "ab")
+        self._bytes = self._fh.tell()
+        threading.Thread(target=self._run, name="room-wal", daemon=True).start()
+        atexit.register(self.flush)
+
+    def append(self, rec: Dict):
+        line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        self._buf.append(line)
+
+    def flush(self):
+        with self._io:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        buf = []
+        while self._buf:
+            buf.append(self._buf.popleft())
+        if not buf or self._fh is None:
+            return
+        try:
+            data = b"".join(buf)
+            with _span("wal_flush"):
+                self._fh.write(data)
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+            self._bytes += len(data)
+            self.stats["records"] += len(buf)
+            self.stats["fsyncs"] += 1
+        except Exception as e:
+            log.warning("rooms log write failed: %s", e)
+
+    def compact(self):
+        with self._io, _span("wal_compact"):
+            try:
+                # 로그를 .1로 넘긴 뒤 스냅샷을 뜸 → .1의 레코드는 모두 스냅샷에 반영됨
+                self._flush_locked()
+                self._fh.close()
+                os.replace(self.log_path, self.old_path)
+                self._fh = open(self.log_path, "ab")
+                self._bytes = 0
+                tmp = self.snap_path.with_name(self.snap_path.name + ".tmp")
+                with open(tmp, "wb") as f:
+                    installed = self._snapshot(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.snap_path)
+                installed()
+                self.old_path.unlink(missing_ok=True)
+                self.stats["compactions"] += 1
+            except Exception as e:
+                log.warning("rooms compaction failed: %s", e)
+                if self._fh is None or self._fh.closed:
+                    self._fh = open(self.log_path, "ab")
+            finally:
+                self._last_compact = time.time()
+
+    def _run(self):
+        while True:
+            # 요청 스레드가 공용 락을 잡지 않도록 깨우지 않고 주기적으로 비움
+            time.sleep(WAL_FLUSH_MS / 1000.0)
+            if self._buf:
+                self.flush()
+            if self._bytes >= WAL_COMPACT_BYTES or (self._bytes and time.time() - self._last_compact >= WAL_COMPACT_S):
+                self.compact()
+
+    def replay(self, rooms: Dict[str, Dict], venues: Dict[str, Dict]) -> int:
+        n = 0
+        for path in (self.old_path, self.log_path):
+            if not path.exists():
+                continue
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except Exception:
+                        continue  # 쓰다 끊긴 마지막 줄
+                    _apply_room_record(rooms, rec, venues)
+                    n += 1
+        return n
+
+ROOM_LOG = RoomLog(ROOMS_DAT_PATH, ROOMS_LOG_PATH, lambda f: _write_rooms_snapshot(f))
+
+_DAT_FOOTER = "#rooms-index {:016d} {:016d}\n"   # 색인 줄의 (오프셋, 길이). 파일 맨 끝 고정 길이
+_DAT_FOOTER_LEN = len(_DAT_FOOTER.format(0, 0))
+
+class RoomTable:
+    # code → 방 dict. dict처럼 쓰되(get/in/[]/pop/len/iter) rooms.dat에만 있는 방은 처음 접근할 때 읽어 옴
+    # 색인 항목: code → [오프셋, 길이, expires_at, 참조하는 vid들](만료 스케줄/장소 참조 수는 본문 없이 색인으로)
+    # _gen: 스냅샷 이후 바뀐 방(변경 세대). 깨끗한 방만 내릴 수 있음(rooms.dat 줄이 곧 현재 상태)
+    def __init__(self, revive: Callable[[Dict], Dict] = lambda r: r):
+        self._live: Dict[str, Dict] = {}
+        self._index: Dict[str, list] = {}
+        self._codes: set = set()
+        self._gen: Dict[str, int] = {}
+        self._seen: Dict[str, float] = {}
+        self._tick = itertools.count(1)
+        self._mm = None
+        self._lock = threading.Lock()
+        self._revive = revive   # 스냅샷에서 읽은 방 보정(이전 프로세스의 작업 상태 등)
+        self.stats = {"loads": 0, "paged_out": 0}
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, code):
+        return code in self._codes
+
+    def __iter__(self):
+        return iter(list(self._codes))
+
+    def keys(self):
+        return list(self._codes)
+
+    def resident(self) -> List[str]:
+        return list(self._live)
+
+    def items(self):
+        # 전부 읽어 들임(벤치마크/점검용)
+        return [(c, r) for c in self.keys() if (r := self.get(c)) is not None]
+
+    def values(self):
+        return [r for _c, r in self.items()]
+
+    def get(self, code, default=None):
+        room = self._live.get(code)
+        if room is None:
+            if code not in self._index:
+                return default
+            with self._lock:
+                room = self._fetch_locked(code)
+            if room is None:
+                return default
+        self._seen[code] = time.monotonic()
+        return room
+
+    def __getitem__(self, code):
+        room = self.get(code)
+        if room is None:
+            raise KeyError(code)
+        return room
+
+    def __setitem__(self, code, room):
+        with self._lock:
+            self._live[code] = room
+            self._codes.add(code)
+            self._gen[code] = next(self._tick)
+        self._seen[code] = time.monotonic()
+
+    def update(self, rooms: Dict[str, Dict]):
+        for code, room in rooms.items():
+            self[code] = room
+
+    def pop(self, code, default=None):
+        # 메모리에 없는 방은 읽지 않고 색인만 지움(값은 default). 로그의 del 재생이 본문을 파싱하지 않도록
+        # _remove_room은 방 락을 잡고(= 방을 읽어 둔 채) 부르므로 늘 방 dict를 받음
+        with self._lock:
+            room = self._live.pop(code, None)
+            self._index.pop(code, None)
+            self._codes.discard(code)
+            self._gen.pop(code, None)
+            self._seen.pop(code, None)
+        return default if room is None else room
+
+    def clear(self):
+        with self._lock:
+            self._live.clear(); self._index.clear(); self._codes.clear(); self._gen.clear(); self._seen.clear()
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+
+    def dirty(self, code: str):
+        # 방이 바뀌어 로그에 기록될 때마다(_persist). 다음 스냅샷에 들어가기 전까지는 내리지 않음
+        if code in self._codes:
+            self._gen[code] = next(self._tick)
+
+    def _fetch_locked(self, code: str) -> Dict | None:
+        room = self._live.get(code)
+        if room is None and code in self._index:
+            off, n = self._index[code][:2]
+            room = self._live[code] = self._revive(json.loads(self._mm[off:off + n]))
+            self.stats["loads"] += 1
+        return room
+
+    def open(self, path: pathlib.Path) -> Dict[str, Dict]:
+        # rooms.dat의 끝(색인)만 읽어 방을 등록하고 장소 레코드를 돌려줌. 방 본문은 읽지 않음
+        # 만료는 여기서 거르지 않음(로그에 연장 레코드가 있을 수 있음) → 재생 뒤 drop_expired
+        with open(path, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        tail = mm[-_DAT_FOOTER_LEN:].decode("ascii", "replace").split()
+        if len(mm) < _DAT_FOOTER_LEN or len(tail) != 3 or tail[0] != "#rooms-index":
+            mm.close()
+            raise ValueError("rooms snapshot has no index footer")
+        off, n = int(tail[1]), int(tail[2])
+        idx = json.loads(mm[off:off + n])
+        voff, vn = idx["venues"]
+        venues = json.loads(mm[voff:voff + vn])
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mm
+            self._index = idx["rooms"]
+            self._codes.update(self._index)
+        return venues
+
+    def drop_expired(self, now: int) -> int:
+        # 로그 재생 뒤에 호출: 메모리에 없는 방은 로그가 건드리지 않았으므로 색인의 expires_at이 현재 값
+        with self._lock:
+            gone = [c for c, e in self._index.items() if c not in self._live and e[2] <= now]
+            for c in gone:
+                del self._index[c]
+                self._codes.discard(c)
+        return len(gone)
+
+    def raw(self, code: str):
+        # 스냅샷용: ("live", 방, 세대) 또는 ("disk", 이전 스냅샷의 줄 바이트, 색인 항목). 방 락을 잡은 상태에서 호출
+        with self._lock:
+            if code in self._live:
+                return "live", self._live[code], self._gen.get(code)
+            if code in self._index:
+                ent = self._index[code]
+                return "disk", self._mm[ent[0]:ent[0] + ent[1]], ent
+        return None
+
+    def install(self, path: pathlib.Path, index: Dict[str, list], gens: Dict[str, int | None]):
+        # 새 스냅샷이 제자리에 놓인 뒤: mmap/색인을 바꾸고, 쓴 뒤로 안 바뀐 방은 깨끗한 것으로
+        with open(path, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mm
+            self._index = {c: e for c, e in index.items() if c in self._codes}
+            for c, g in gens.items():
+                if g is not None and self._gen.get(c) == g:
+                    del self._gen[c]
+
+    def expiries(self) -> List[Tuple[int, str]]:
+        # (expires_at, code) 전부. 메모리에 없는 방은 색인 값(깨끗한 방이라 현재 값과 같음)
+        with self._lock:
+            return [(int(self._live[c].get("expires_at", 0)) if c in self._live else int(self._index[c][2]), c)
+                    for c in self._codes]
+
+    def venue_refs(self) -> List[List[str]]:
+        # 방마다 results가 가리키는 vid 목록(장소 참조 수 재계산용). 메모리에 없는 방은 색인 값
+        with self._lock:
+            return [_venue_ids(self._live[c].get("results")) if c in self._live else self._index[c][3]
+                    for c in self._codes]
+
+    def cold(self, idle_s: float) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [c for c in self._live
+                    if c not in self._gen and c in self._index and now - self._seen.get(c, 0) >= idle_s]
+
+    def evict(self, code: str, idle_s: float) -> bool:
+        # 방 락을 잡은 상태에서 호출. 그 사이 바뀌었거나 쓰였거나 작업이 도는 방은 남김
+        with self._lock:
+            room = self._live.get(code)
+            if (room is None or code in self._gen or code not in self._index
+                    or time.monotonic() - self._seen.get(code, 0) < idle_s
+                    or (room.get("job") or {}).get("state") in ("queued", "running")):
+                return False
+            del self._live[code]
+            self._seen.pop(code, None)
+            self.stats["paged_out"] += 1
+            return True
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {"resident": len(self._live), "indexed": len(self._index), "dirty": len(self._gen),
+                    "snapshot_bytes": len(self._mm) if self._mm is not None else 0, **self.stats}
+
+def _revive_room(room: Dict) -> Dict:
+    # 이전 프로세스에서 돌던 비동기 작업은 이어서 돌지 않음
+    job = room.get("job")
+    if job and job.get("state") in ("queued", "running"):
+        room["job"] = dict(job, state="lost")
+    return room
+
+ROOMS = RoomTable(revive=_revive_room)
+
+# ── Room registry (방별 락)
+# 방마다 RLock 기반 Condition 하나: 변경/읽기 스냅샷은 그 방 락만 잡고, long-poll/SSE는 같은 Condition에서 대기
+# 락 순서: 방 락 → (_ROOMS_LOCK | EXPIRY 락 | ROOM_LOG 버퍼 락). 반대 방향으로 잡지 않음
+_ROOMS_LOCK = threading.Lock()   # ROOMS/_ROOM_CONDS 키 추가·삭제용
+_ROOM_CONDS: Dict[str, threading.Condition] = {}
+
+def _room_cond(code: str, create: bool = True) -> threading.Condition | None:
+    with _ROOMS_LOCK:
+        cond = _ROOM_CONDS.get(code)
+        if cond is None and create and code in ROOMS:
+            cond = _ROOM_CONDS[code] = threading.Condition(threading.RLock())
+        return cond
+
+@contextmanager
+def _locked_room(code: str):
+    # 방 락을 잡은 채 방 dict(없으면 None)를 넘김
+    cond = _room_cond(code)
+    if cond is None:
+        yield None
+        return
+    with cond:
+        yield ROOMS.get(code)
+
+def _insert_room(room: Dict) -> str:
+    # 새 코드를 고르고, 방 락을 잡은 상태로 등록 → 생성 레코드보다 다른 변경이 먼저 기록될 수 없음
+    with _ROOMS_LOCK:
+        code = _gen_code()
+        while code in ROOMS or code in _ROOM_CONDS: code = _gen_code()
+        room["code"] = code
+        cond = _ROOM_CONDS[code] = threading.Condition(threading.RLock())
+        cond.acquire()
+        ROOMS[code] = room
     try:
-        ROOMS_PATH.write_text(json.dumps(ROOMS, ensure_ascii=False), encoding="utf-8")
-    except Exception as e:
-        log.warning("rooms save failed: %s", e)
+        EXPIRY.schedule(code, room["expires_at"])
+        _persist("room", code, room=room)
+    finally:
+        cond.release()
+    return code
+
+def _remove_room(code: str):
+    # 방 락을 잡은 상태에서 호출
+    with _ROOMS_LOCK:
+        room = ROOMS.pop(code, None)
+        cond = _ROOM_CONDS.pop(code, None)
+    _persist("del", code)
+    if room is not None:
+        VENUES.release(_venue_ids(room.get("results")))
+    _ROOM_HISTORY.pop(code, None)
+    for name in ROOM_BLOBS:
+        _BLOB_HASHES.pop((code, name), None)
+    if cond is not None:
+        with cond:
+            cond.notify_all()
+
+def _write_rooms_snapshot(f) -> Callable[[], None]:
+    # 방마다 자기 락만 잠깐 잡고 한 줄씩 → 압축 중에도 다른 방 요청은 막히지 않음
+    # 메모리에 없는 방은 이전 스냅샷의 줄을 파싱 없이 그대로 옮김
+    index: Dict[str, list] = {}
+    gens: Dict[str, int | None] = {}
+    pos = 0
+    for code in ROOMS:
+        cond = _room_cond(code)
+        if cond is None: continue
+        with cond:
+            got = ROOMS.raw(code)
+            if got is None: continue
+            kind, room, meta = got
+            if kind == "live":
+                line = json.dumps(room, ensure_ascii=False).encode("utf-8")
+                entry = [pos, len(line), int(room.get("expires_at", 0)), _venue_ids(room.get("results"))]
+                gens[code] = meta
+            else:
+                line, entry = room, [pos, len(room), *meta[2:]]
+        f.write(line); f.write(b"\n")
+        index[code] = entry
+        pos += len(line) + 1
+    # 장소 테이블은 방들 뒤에 → 스냅샷에 담긴 방이 가리키는 vid는 (그 사이 놓여났더라도 이후 로그가 대체하므로) 빠짐없음
+    venues = json.dumps(VENUES.records(), ensure_ascii=False).encode("utf-8")
+    f.write(venues); f.write(b"\n")
+    idx = json.dumps({"rooms": index, "venues": [pos, len(venues)]}, ensure_ascii=False).encode("utf-8")
+    pos += len(venues) + 1
+    f.write(idx); f.write(b"\n")
+    f.write(_DAT_FOOTER.format(pos, len(idx)).encode("ascii"))
+
+    return lambda: ROOMS.install(ROOMS_DAT_PATH, index, gens)
+
+class ExpiryScheduler:
+    # (expires_at, code) 최소 힙. 연장되면 새 항목을 넣고, 옛 항목은 꺼낼 때 시각이 안 맞으면 버림
+    def __init__(self, rooms: Callable[[], "RoomTable"]):
+        self._rooms = rooms
+        self._heap: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+        self.stats = {"sweeps": 0, "expired_total": 0, "last_expired": 0, "last_sweep_ms": 0.0}
+
+    def schedule(self, code: str, expires_at: int):
+        with self._lock:
+            heapq.heappush(self._heap, (int(expires_at), code))
+
+    def reset(self):
+        heap = self._rooms().expiries()
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+
+    def sweep(self) -> int:
+        t0 = time.perf_counter()
+        now = _now_ms()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+        expired = 0
+        for exp, code in due:
+            with _locked_room(code) as room:
+                if room is None or room.get("expires_at") != exp:
+                    continue  # 이미 닫혔거나 연장된 방
+                _remove_room(code)
+                expired += 1
+        rooms = self._rooms()
+        if len(self._heap) > 2 * len(rooms) + 1024:
+            self.reset()
+        self.stats["sweeps"] += 1
+        self.stats["expired_total"] += expired
+        self.stats["last_expired"] = expired
+        self.stats["last_sweep_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        if expired:
+            log.info("rooms expired: %d (%.1f ms)", expired, self.stats["last_sweep_ms"])
+        return expired
+
+    def start(self, interval_s: float):
+        def _loop():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    log.warning("expiry sweep failed: %s", e)
+        threading.Thread(target=_loop, name="room-expiry", daemon=True).start()
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "scheduled": len(self._heap), "interval_s": ROOM_SWEEP_S}
+
+EXPIRY = ExpiryScheduler(lambda: ROOMS)
+
+def _persist(op: str, code: str, **kw):
+    ROOMS.dirty(code)
+    ROOM_LOG.append({"op": op, "code": code, **kw})
+
+# 방별 최근 변경 이력: deque[(ver, 바뀐 pid들, 나간 pid들, 바뀐 blob 이름들)]
+_ROOM_HISTORY: Dict[str, deque] = {}
+
+def _bump(code: str, p: List[str] = (), rm: List[str] = (), blobs: List[str] = ()) -> int:
+    # 방 락을 잡은 상태에서 호출. 대기 중인 long-poll/SSE를 깨움
+    room = ROOMS[code]
+    room["ver"] += 1
+    hist = _ROOM_HISTORY.get(code)
+    if hist is None:
+        hist = _ROOM_HISTORY[code] = deque(maxlen=ROOM_HISTORY_LEN)
+    hist.append((room["ver"], tuple(p), tuple(rm), tuple(blobs)))
+    cond = _room_cond(code)
+    with cond:
+        cond.notify_all()
+    return room["ver"]
+
+# results/eta 같은 큰 값은 내용 해시로 참조 → 클라이언트는 해시가 바뀔 때만 /api/room/blob으로 받음
+# job은 이 방에서 도는 비동기 작업의 진행 상황(작업이 끝나면 결과는 results/eta에 있음)
+ROOM_BLOBS = ("results", "eta", "job")
+_BLOB_HASHES: Dict[Tuple[str, str], Tuple[object, str]] = {}
+
+def _blob_hash(code: str, name: str) -> str | None:
+    value = (ROOMS.get(code) or {}).get(name)
+    if value is None:
+        return None
+    cached = _BLOB_HASHES.get((code, name))
+    if cached is not None and cached[0] is value:
+        return cached[1]
+    h = hashlib.sha1(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    _BLOB_HASHES[(code, name)] = (value, h)
+    return h
+
+def _wait_for_change(code: str, since: int, timeout: float) -> bool:
+    # ver가 since와 달라지거나 방이 사라지면 True, 시간 초과면 False
+    def _changed():
+        room = ROOMS.get(code)
+        return room is None or room["ver"] != since
+    cond = _room_cond(code)
+    if cond is None:
+        return True
+    with cond:
+        return cond.wait_for(_changed, timeout=timeout)
+
+def _touch(code: str):
+    # 활동이 있으면 만료시각을 방 TTL만큼 뒤로 미룸(슬라이딩 TTL). 방 락을 잡은 상태에서 호출
+    room = ROOMS.get(code)
+    if not ROOM_SLIDING_TTL or room is None:
+        return
+    ttl = room.get("ttl_ms") or (room.get("expires_at", 0) - room.get("created_at", 0))
+    new_exp = _now_ms() + ttl
+    if new_exp - room.get("expires_at", 0) < ROOM_TTL_EXTEND_MIN_MS:
+        return
+    room["expires_at"] = new_exp
+    EXPIRY.schedule(code, new_exp)
+    _persist("set", code, fields={"expires_at": new_exp})
 
 def _load_rooms():
-    global ROOMS
-    try:
-        data = json.loads(ROOMS_PATH.read_text(encoding="utf-8"))
+    # rooms.dat은 색인만 읽고, 로그 재생이 건드린 방만 바로 읽음(나머지는 첫 접근 때)
+    t = time.perf_counter()
+    records: Dict[str, Dict] = {}
+    with _ROOMS_LOCK:
+        ROOMS.clear()
+        try:
+            if ROOMS_DAT_PATH.exists():
+                records = ROOMS.open(ROOMS_DAT_PATH)
+            elif ROOMS_PATH.exists():
+                # 예전 형식(rooms.json 통째로): 한 번 다 읽어 두면 다음 압축 때 rooms.dat으로 옮겨짐
+                rooms = json.loads(ROOMS_PATH.read_text(encoding="utf-8"))
+                records = rooms.pop(VENUE_KEY, None) or {}
+                ROOMS.update(rooms)
+        except Exception as e:
+            log.warning("rooms snapshot load failed: %s", e)
+        replayed = ROOM_LOG.replay(ROOMS, records)
         now = _now_ms()
-        ROOMS = {c: r for c, r in data.items() if r.get("expires_at", now) > now}
-        log.info("rooms loaded: %d", len(ROOMS))
-    except Exception:
-        ROOMS = {}
+        ROOMS.drop_expired(now)
+        for code in ROOMS.resident():
+            # 로그로 바뀐 방(과 예전 형식에서 읽은 방)만 메모리에 있음 → 다음 스냅샷까지 내리지 않음
+            ROOMS.dirty(code)
+            r = ROOMS.get(code)
+            if r.get("expires_at", now) <= now:
+                ROOMS.pop(code)
+                continue
+            # 장소 문서를 통째로 들고 있던 예전 형식의 results는 공유 테이블 참조로 바꿈
+            if r.get("results") and not _is_compact(r["results"]):
+                r["results"], venues = _compact_results(r["results"])
+                records.update(venues)
+            _revive_room(r)
+    VENUES.load(records, ROOMS.venue_refs())
+    info = ROOMS.info()
+    log.info("rooms loaded: %d (%d in memory, replayed %d log records, %d venues, %.1f ms)",
+             len(ROOMS), info["resident"], replayed, len(VENUES), (time.perf_counter() - t) * 1000)
+
+def _page_out_rooms(idle_s: float) -> int:
+    # 스냅샷 이후 안 바뀌고 idle_s 동안 안 쓰인 방을 메모리에서 내림(results/eta 같은 큰 값째로). 다음 접근 때 rooms.dat에서 다시 읽음
+    n = 0
+    for code in ROOMS.cold(idle_s):
+        cond = _room_cond(code)
+        if cond is None or not cond.acquire(blocking=False):
+            continue   # 누가 쓰는 중
+        try:
+            if ROOMS.evict(code, idle_s):
+                for name in ROOM_BLOBS:
+                    _BLOB_HASHES.pop((code, name), None)
+                n += 1
+        finally:
+            cond.release()
+    if n:
+        log.info("rooms paged out: %d", n)
+    return n
+
+# ── 공유 장소 테이블
+# 추천 결과의 장소 레코드(카카오 문서 + 구글 보강)는 내용이 같으면 방이 몇 개든 한 벌만 두고 참조 수로 관리
+# 방 results에는 vid("카카오 id.내용 해시")와 방마다 다른 값(거리/ETA/남은 영업시간)만 남기고,
+# 전체 레코드는 /api/room/blob, /api/room/state?full=1에서 요청할 때만 붙여 줌
+ROOM_RESULTS_MAX   = int(os.getenv("ROOM_RESULTS_MAX") or 30)   # 방에 저장할 추천 결과 상한
+RESULT_ROOM_FIELDS = ("_centroid_dist_km", "_eta_max", "_eta_sum", "_open_minutes_left", "_closes_at", "_open_enough")
+VENUE_KEY = "~venues"   # 예전 형식 rooms.json에서 장소 테이블 자리(방 코드와 겹치지 않음)
+
+def _venue_record(d: Dict) -> Tuple[str, Dict]:
+    rec = {k: v for k, v in d.items() if k not in RESULT_ROOM_FIELDS}
+    digest = hashlib.sha1(json.dumps(rec, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+    return f"{rec.get('id', '')}.{digest}", rec
+
+def _is_compact(results: Dict) -> bool:
+    return all("vid" in d for d in results.get("items") or [])
+
+def _compact_results(results: Dict) -> Tuple[Dict, Dict[str, Dict]]:
+    # 추천 결과 → (방에 둘 값, {vid: 장소 레코드}). 상위 ROOM_RESULTS_MAX개만, total은 원래 개수
+    items = results.get("items") or []
+    rows, venues = [], {}
+    for d in items[:ROOM_RESULTS_MAX]:
+        vid, rec = _venue_record(d)
+        venues[vid] = rec
+        rows.append({"vid": vid, **{k: d[k] for k in RESULT_ROOM_FIELDS if k in d}})
+    out = {k: v for k, v in results.items() if k != "items"}
+    out.update(count=len(rows), total=results.get("total", results.get("count", len(items))), items=rows)
+    return out, venues
+
+def _venue_ids(results: Dict | None) -> List[str]:
+    return [d["vid"] for d in (results or {}).get("items") or [] if "vid" in d]
+
+def _materialize_results(results: Dict | None, records: Dict[str, Dict]) -> Dict | None:
+    # vid를 장소 레코드로 풀어 예전과 같은 모양(items = 장소 문서 + 방별 값)으로
+    if not results:
+        return results
+    items = [{**records.get(d["vid"], {}), **d} for d in results.get("items") or []]
+    return {**results, "items": items}
+
+class VenueTable:
+    # vid → 레코드 + 참조 수. 참조가 0이 되면 버림(레코드 dict는 바꾸지 않고 공유만)
+    def __init__(self):
+        self._recs: Dict[str, Dict] = {}
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"interned": 0, "shared": 0, "dropped": 0}
+
+    def __len__(self):
+        return len(self._recs)
+
+    def acquire(self, venues: Dict[str, Dict], ids: List[str]) -> List[str]:
+        # ids의 참조 +1. 처음 보는 vid는 venues의 레코드로 등록하고 그 vid 목록을 돌려줌(로그 기록용)
+        new = []
+        with self._lock:
+            for vid in ids:
+                if vid in self._refs:
+                    self._refs[vid] += 1
+                    self.stats["shared"] += 1
+                elif vid in venues:
+                    self._recs[vid] = venues[vid]
+                    self._refs[vid] = 1
+                    self.stats["interned"] += 1
+                    new.append(vid)
+        return new
+
+    def release(self, ids: List[str]):
+        with self._lock:
+            for vid in ids:
+                n = self._refs.get(vid)
+                if n is None:
+                    continue
+                if n > 1:
+                    self._refs[vid] = n - 1
+                else:
+                    del self._refs[vid]
+                    del self._recs[vid]
+                    self.stats["dropped"] += 1
+
+    def get(self, vid: str) -> Dict | None:
+        return self._recs.get(vid)
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict]:
+        with self._lock:
+            return {vid: self._recs[vid] for vid in ids if vid in self._recs}
+
+    def records(self) -> Dict[str, Dict]:
+        with self._lock:
+            return dict(self._recs)
+
+    def load(self, records: Dict[str, Dict], id_lists):
+        # 방마다 results가 가리키는 vid 목록으로 참조 수를 다시 셈. 아무도 안 가리키는 레코드는 버림
+        refs: Dict[str, int] = {}
+        for ids in id_lists:
+            for vid in ids:
+                if vid in records:
+                    refs[vid] = refs.get(vid, 0) + 1
+        with self._lock:
+            self._refs = refs
+            self._recs = {vid: records[vid] for vid in refs}
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {"venues": len(self._recs), "refs": sum(self._refs.values()), **self.stats}
+
+VENUES = VenueTable()
+
+# ── Room store (방 연산 인터페이스 + 백엔드)
+# ROOM_STORE=memory: 위의 ROOMS/방별 락/rooms.log (프로세스 1개)
+# ROOM_STORE=sqlite: 워커 여러 개(gunicorn -w N, 여러 노드의 공유 볼륨)가 SQLite 파일 하나를 공유
+ROOM_STORE        = (os.getenv("ROOM_STORE") or "memory").strip().lower()
+ROOM_STORE_PATH   = os.getenv("ROOM_STORE_PATH") or str(pathlib.Path(__file__).with_name("rooms.sqlite3"))
+ROOM_STORE_POLL_S = float(os.getenv("ROOM_STORE_POLL_S") or 0.25)   # sqlite: 다른 워커의 변경 확인 주기(long-poll/SSE)
+PARTICIPANT_MODES = ("car", "bus", "subway", "walk")
+
+class RoomError(Exception):
+    # 저장소 연산 실패 → {"ok": False, "error": ...} 응답으로 바뀜
+    def __init__(self, error: str, status: int = 404):
+        super().__init__(error)
+        self.error = error
+        self.status = status
+
+def _new_participant(pid: str, nickname: str) -> Dict:
+    return {"pid": pid, "nickname": nickname, "mode": "car", "lat": None, "lng": None, "updated_at": 0}
+
+def _apply_participant_update(p: Dict, lat: float | None, lng: float | None, mode: str | None):
+    if lat is not None: p["lat"] = lat
+    if lng is not None: p["lng"] = lng
+    if mode in PARTICIPANT_MODES: p["mode"] = mode
+    p["updated_at"] = _now_ms()
+
+def _room_centroid(parts: List[Dict]) -> Dict | None:
+    pts = [{"lat":p["lat"],"lng":p["lng"],"mode":p["mode"]} for p in parts
+           if isinstance(p.get("lat"),(int,float)) and isinstance(p.get("lng"),(int,float))]
+    return time_weighted_centroid(pts) if pts else None
 
-_load_rooms()
+def _merge_history(entries) -> Tuple[set, set, set]:
+    # 이력 (ver, p, rm, blobs)들을 합쳐 (바뀐 pid, 나간 pid, 바뀐 blob)으로
+    changed, removed, blobs = set(), set(), set()
+    for _ver, p, rm, bl in entries:
+        changed.update(p); removed.difference_update(p)
+        removed.update(rm); changed.difference_update(rm)
+        blobs.update(bl)
+    return changed, removed, blobs
+
+class RoomStore(ABC):
+    # 방 저장소 인터페이스. 모든 메서드는 스레드 안전해야 하고, 변경 1건마다 ver가 정확히 1 올라야 함
+    # 없는 방/참가자는 RoomError, 조회 계열은 None. 추상 메서드를 하나라도 빠뜨린 백엔드는 만들 때 TypeError
+    name = "base"
+
+    def start(self): pass
+
+    @abstractmethod
+    def create(self, room: Dict) -> str: ...
+    @abstractmethod
+    def join(self, code: str, nickname: str, pid: str | None = None) -> str: ...
+    @abstractmethod
+    def update(self, code: str, pid: str, lat: float | None, lng: float | None, mode: str | None) -> int: ...
+    @abstractmethod
+    def leave(self, code: str, pid: str) -> int: ...
+    @abstractmethod
+    def close(self, code: str, host_secret: str): ...
+    @abstractmethod
+    def snapshot(self, code: str) -> Dict | None: ...      # {"meta", "participants", "ver"} 복사본
+    @abstractmethod
+    def ver(self, code: str) -> int | None: ...
+    @abstractmethod
+    def wait(self, code: str, since: int, timeout: float) -> bool: ...
+    @abstractmethod
+    def state(self, code: str, lite: bool = False) -> Dict | None: ...
+    @abstractmethod
+    def delta(self, code: str, since: int) -> Dict | None: ...
+    @abstractmethod
+    def blob(self, code: str, name: str) -> Tuple[object, str] | None: ...
+    @abstractmethod
+    def set_blob(self, code: str, name: str, value, venues: Dict[str, Dict] | None = None) -> int | None: ...
+    @abstractmethod
+    def venues(self, ids: List[str]) -> Dict[str, Dict]: ...   # vid → 장소 레코드
+    @abstractmethod
+    def info(self) -> Dict: ...
+
+    def set_results(self, code: str, results: Dict) -> int | None:
+        # results는 vid만 담은 compact 값으로 저장하고, 장소 레코드는 공유 테이블에 참조로 등록
+        compact, venues = _compact_results(results)
+        return self.set_blob(code, "results", compact, venues)
+
+    def results(self, code: str) -> Dict | None:
+        # 장소 레코드를 붙인 저장된 추천 결과
+        got = self.blob(code, "results")
+        return None if got is None else _materialize_results(got[0], self.venues(_venue_ids(got[0])))
+
+    def set_eta(self, code: str, eta: Dict) -> int | None:
+        return self.set_blob(code, "eta", eta)
+
+class MemoryRoomStore(RoomStore):
+    # 상태 조립은 방 락 안에서 참가자 dict를 복사 → 응답 직렬화 중 다른 요청이 바꿔도 일관됨
+    # (results/eta는 통째로 교체만 되므로 참조를 그대로 넘겨도 안전)
+    name = "memory"
+
+    def start(self):
+        _load_rooms()
+        ROOM_LOG.start()
+        EXPIRY.reset()
+        EXPIRY.start(ROOM_SWEEP_S)
+        if ROOM_PAGE_OUT_S > 0:
+            def _pager():
+                while True:
+                    time.sleep(min(ROOM_SWEEP_S, ROOM_PAGE_OUT_S))
+                    try:
+                        _page_out_rooms(ROOM_PAGE_OUT_S)
+                    except Exception as e:
+                        log.warning("room page-out failed: %s", e)
+            threading.Thread(target=_pager, name="room-pager", daemon=True).start()
+
+    def create(self, room):
+        return _insert_room(room)
+
+    def join(self, code, nickname, pid=None):
+        with _locked_room(code) as room:
+            if room is None:
+                raise RoomError("room_not_found")
+            parts = room["participants"]
+            if pid and pid in parts:
+                parts[pid]["nickname"] = nickname
+            else:
+                pid = _gen_pid()
+                parts[pid] = _new_participant(pid, nickname)
+            ver = _bump(code, p=[pid])
+            _persist("p", code, pid=pid, p=parts[pid], ver=ver)
+            _touch(code)
+            return pid
+
+    def update(self, code, pid, lat, lng, mode):
+        with _locked_room(code) as room:
+            if room is None:
+                raise RoomError("room_not_found")
+            p = room["participants"].get(pid)
+            if not p:
+                raise RoomError("participant_not_found")
+            _apply_participant_update(p, lat, lng, mode)
+            ver = _bump(code, p=[pid])
+            _persist("p", code, pid=pid, p=p, ver=ver)
+            _touch(code)
+            return ver
+
+    def leave(self, code, pid):
+        with _locked_room(code) as room:
+            if room is None:
+                raise RoomError("room_not_found")
+            room["participants"].pop(pid, None)
+            ver = _bump(code, rm=[pid])
+            _persist("pdel", code, pid=pid, ver=ver)
+            return ver
+
+    def close(self, code, host_secret):
+        with _locked_room(code) as room:
+            if room is None:
+                raise RoomError("room_not_found")
+            if host_secret != room.get("host_secret"):
+                raise RoomError("host_secret_mismatch", 403)
+            _remove_room(code)
+
+    def snapshot(self, code):
+        with _locked_room(code) as room:
+            if room is None:
+                return None
+            return {"meta": dict(room.get("meta") or {}),
+                    "participants": [dict(p) for p in room["participants"].values()],
+                    "ver": room["ver"]}
+
+    def ver(self, code):
+        room = ROOMS.get(code)
+        return None if room is None else room["ver"]
+
+    def wait(self, code, since, timeout):
+        return _wait_for_change(code, since, timeout)
+
+    def state(self, code, lite=False):
+        # lite=True: results/eta 대신 내용 해시만 담음
+        with _locked_room(code) as room:
+            if room is None:
+                return None
+            parts = [dict(p) for p in room["participants"].values()]
+            out = {"ok": True, "code": code, "meta": room["meta"], "participants": parts,
+                   "centroid": _room_centroid(parts), "ver": room["ver"]}
+            if lite:
+                out.update({"delta": False, **{f"{name}_hash": _blob_hash(code, name) for name in ROOM_BLOBS}})
+            else:
+                out.update({name: room.get(name) for name in ROOM_BLOBS})
+            return out
+
+    def delta(self, code, since):
+        # since 이후 바뀐 참가자/나간 pid/바뀐 blob만. 이력이 모자라면 None(→ lite 스냅샷)
+        with _locked_room(code) as room:
+            hist = _ROOM_HISTORY.get(code)
+            if room is None or hist is None or since > room["ver"]:
+                return None
+            entries = [h for h in hist if h[0] > since]
+            if len(entries) != room["ver"] - since:
+                return None
+            changed, removed, blobs = _merge_history(entries)
+            parts = room["participants"]
+            out = {
+                "ok": True, "code": code, "ver": room["ver"], "base": since, "delta": True,
+                "participants": [dict(parts[pid]) for pid in changed if pid in parts],
+                "removed": sorted(removed), "centroid": _room_centroid(list(parts.values())),
+            }
+            for name in ROOM_BLOBS:
+                out[f"{name}_changed"] = name in blobs
+                out[f"{name}_hash"] = _blob_hash(code, name)
+            return out
+
+    def blob(self, code, name):
+        with _locked_room(code) as room:
+            if room is None:
+                return None
+            h = _blob_hash(code, name)
+            return None if h is None else (room.get(name), h)
+
+    def set_blob(self, code, name, value, venues=None):
+        with _locked_room(code) as room:
+            if room is None:
+                return None
+            old = room.get(name)
+            if name == "results":
+                # 새 레코드를 먼저 로그에 → 재생할 때 방 results가 가리키는 vid가 항상 있음
+                for vid in VENUES.acquire(venues or {}, _venue_ids(value)):
+                    _persist("venue", "", vid=vid, rec=VENUES.get(vid))
+            room[name] = value
+            ver = _bump(code, blobs=[name])
+            _persist("set", code, fields={name: value}, ver=ver)
+            _touch(code)
+            if name == "results":
+                VENUES.release(_venue_ids(old))
+            return ver
+
+    def venues(self, ids):
+        return VENUES.get_many(ids)
+
+    def info(self):
+        return {"backend": self.name, "rooms": len(ROOMS), "expiry": EXPIRY.info(), "log": dict(ROOM_LOG.stats),
+                "venues": VENUES.info(), "table": ROOMS.info()}
+
+class SqliteRoomStore(RoomStore):
+    # 변경은 BEGIN IMMEDIATE 트랜잭션 하나에서 행 변경 + ver = ver + 1 + 이력 기록 → 워커가 몇 개든 ver는 빠짐없이 1씩
+    # 만료는 expires_at 인덱스로 조회 시 걸러내고, 워커마다 도는 sweeper가 지움(중복 실행돼도 무해)
+    # long-poll/SSE: 같은 프로세스 변경은 Condition으로 바로, 다른 워커 변경은 ROOM_STORE_POLL_S마다 ver 확인
+    name = "sqlite"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS rooms (code TEXT PRIMARY KEY, created_at INTEGER, expires_at INTEGER,"
+        " ttl_ms INTEGER, meta TEXT, host_secret TEXT, ver INTEGER NOT NULL DEFAULT 0,"
+        " results TEXT, results_hash TEXT, eta TEXT, eta_hash TEXT, job TEXT, job_hash TEXT)",
+        "CREATE INDEX IF NOT EXISTS rooms_expires ON rooms (expires_at)",
+        "CREATE TABLE IF NOT EXISTS participants (code TEXT, pid TEXT, data TEXT, PRIMARY KEY (code, pid))",
+        "CREATE TABLE IF NOT EXISTS history (code TEXT, ver INTEGER, p TEXT, rm TEXT, blobs TEXT, PRIMARY KEY (code, ver))",
+        "CREATE TABLE IF NOT EXISTS venues (vid TEXT PRIMARY KEY, data TEXT, refs INTEGER NOT NULL DEFAULT 0)",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pool: deque = deque()   # 쉬는 커넥션. append/pop은 락 없이도 원자적
+        self._conds: Dict[str, threading.Condition] = {}
+        self._conds_lock = threading.Lock()
+        self.stats = {"commits": 0, "sweeps": 0, "expired_total": 0, "last_expired": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @contextmanager
+    def _tx(self, write: bool = True):
+        # write=True: 시작부터 쓰기 락(다른 워커와 직렬화), False: 읽기 스냅샷
+        try:
+            db = self._pool.pop()
+        except IndexError:
+            db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield db
+                with (_span("store_commit") if write else nullcontext()):
+                    db.execute("COMMIT")
+            except BaseException:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                raise
+            if write:
+                self.stats["commits"] += 1
+        finally:
+            self._pool.append(db)
+
+    def _cond(self, code: str) -> threading.Condition:
+        with self._conds_lock:
+            cond = self._conds.get(code)
+            if cond is None:
+                cond = self._conds[code] = threading.Condition()
+            return cond
+
+    def _notify(self, code: str, drop: bool = False):
+        with self._conds_lock:
+            cond = self._conds.pop(code, None) if drop else self._conds.get(code)
+        if cond is not None:
+            with cond:
+                cond.notify_all()
+
+    def _live(self, db, code: str, cols: str = "ver"):
+        return db.execute(f"SELECT {cols} FROM rooms WHERE code=? AND expires_at > ?", (code, _now_ms())).fetchone()
+
+    def _parts(self, db, code: str) -> List[Dict]:
+        return [json.loads(d) for (d,) in db.execute("SELECT data FROM participants WHERE code=? ORDER BY rowid", (code,))]
+
+    def _bump(self, db, code: str, p: List[str] = (), rm: List[str] = (), blobs: List[str] = (), touch: bool = True) -> int:
+        db.execute("UPDATE rooms SET ver = ver + 1 WHERE code=?", (code,))
+        ver = db.execute("SELECT ver FROM rooms WHERE code=?", (code,)).fetchone()[0]
+        db.execute("INSERT OR REPLACE INTO history (code, ver, p, rm, blobs) VALUES (?,?,?,?,?)",
+                   (code, ver, json.dumps(list(p)), json.dumps(list(rm)), json.dumps(list(blobs))))
+        if ver > ROOM_HISTORY_LEN:
+            db.execute("DELETE FROM history WHERE code=? AND ver <= ?", (code, ver - ROOM_HISTORY_LEN))
+        if touch and ROOM_SLIDING_TTL:
+            now = _now_ms()
+            db.execute("UPDATE rooms SET expires_at = ? + ttl_ms WHERE code=? AND ? + ttl_ms - expires_at >= ?",
+                       (now, code, now, ROOM_TTL_EXTEND_MIN_MS))
+        return ver
+
+    def _acquire_venues(self, db, venues: Dict[str, Dict], ids: List[str]):
+        for vid in ids:
+            if vid in venues:
+                db.execute("INSERT INTO venues (vid, data, refs) VALUES (?,?,1)"
+                           " ON CONFLICT(vid) DO UPDATE SET refs = refs + 1",
+                           (vid, json.dumps(venues[vid], ensure_ascii=False)))
+            else:
+                db.execute("UPDATE venues SET refs = refs + 1 WHERE vid=?", (vid,))
+
+    def _release_venues(self, db, ids: List[str]):
+        db.executemany("UPDATE venues SET refs = refs - 1 WHERE vid=?", [(vid,) for vid in ids])
+        db.executemany("DELETE FROM venues WHERE vid=? AND refs <= 0", [(vid,) for vid in ids])
+
+    def _drop(self, db, codes: List[str]):
+        for code in codes:
+            row = db.execute("SELECT results FROM rooms WHERE code=?", (code,)).fetchone()
+            if row and row[0]:
+                self._release_venues(db, _venue_ids(json.loads(row[0])))
+        for table in ("rooms", "participants", "history"):
+            db.executemany(f"DELETE FROM {table} WHERE code=?", [(c,) for c in codes])
+
+    def start(self):
+        with self._tx() as db:
+            for stmt in self.SCHEMA:
+                db.execute(stmt)
+            # 예전 파일에는 나중에 추가된 blob 열이 없을 수 있음
+            cols = {row[1] for row in db.execute("PRAGMA table_info(rooms)")}
+            for name in ROOM_BLOBS:
+                for col in (name, f"{name}_hash"):
+                    if col not in cols:
+                        db.execute(f"ALTER TABLE rooms ADD COLUMN {col} TEXT")
+            # 장소 문서를 통째로 들고 있던 예전 형식의 results는 공유 테이블 참조로 바꿈
+            for code, data in db.execute("SELECT code, results FROM rooms WHERE results IS NOT NULL").fetchall():
+                results = json.loads(data)
+                if not results or _is_compact(results):
+                    continue
+                compact, venues = _compact_results(results)
+                self._acquire_venues(db, venues, _venue_ids(compact))
+                data = json.dumps(compact, ensure_ascii=False, sort_keys=True)
+                db.execute("UPDATE rooms SET results=?, results_hash=? WHERE code=?",
+                           (data, hashlib.sha1(data.encode("utf-8")).hexdigest()[:16], code))
+        def _loop():
+            while True:
+                time.sleep(ROOM_SWEEP_S)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    log.warning("room store sweep failed: %s", e)
+        threading.Thread(target=_loop, name="room-expiry", daemon=True).start()
+        log.info("room store: sqlite %s", self.path)
+
+    def sweep(self) -> int:
+        with self._tx() as db:
+            codes = [c for (c,) in db.execute("SELECT code FROM rooms WHERE expires_at <= ?", (_now_ms(),))]
+            self._drop(db, codes)
+        for code in codes:
+            self._notify(code, drop=True)
+        self.stats["sweeps"] += 1
+        self.stats["expired_total"] += len(codes)
+        self.stats["last_expired"] = len(codes)
+        if codes:
+            log.info("rooms expired: %d", len(codes))
+        return len(codes)
+
+    def create(self, room):
+        with self._tx() as db:
+            code = _gen_code()
+            while db.execute("SELECT 1 FROM rooms WHERE code=?", (code,)).fetchone():
+                code = _gen_code()
+            db.execute("INSERT INTO rooms (code, created_at, expires_at, ttl_ms, meta, host_secret, ver)"
+                       " VALUES (?,?,?,?,?,?,0)",
+                       (code, room["created_at"], room["expires_at"], room["ttl_ms"],
+                        json.dumps(room["meta"], ensure_ascii=False), room["host_secret"]))
+        room["code"] = code
+        return code
+
+    def join(self, code, nickname, pid=None):
+        with self._tx() as db:
+            if self._live(db, code) is None:
+                raise RoomError("room_not_found")
+            row = db.execute("SELECT data FROM participants WHERE code=? AND pid=?", (code, pid)).fetchone() if pid else None
+            if row is not None:
+                p = json.loads(row[0])
+                p["nickname"] = nickname
+                db.execute("UPDATE participants SET data=? WHERE code=? AND pid=?",
+                           (json.dumps(p, ensure_ascii=False), code, pid))
+            else:
+                pid = _gen_pid()
+                while db.execute("SELECT 1 FROM participants WHERE code=? AND pid=?", (code, pid)).fetchone():
+                    pid = _gen_pid()
+                db.execute("INSERT INTO participants (code, pid, data) VALUES (?,?,?)",
+                           (code, pid, json.dumps(_new_participant(pid, nickname), ensure_ascii=False)))
+            self._bump(db, code, p=[pid])
+        self._notify(code)
+        return pid
+
+    def update(self, code, pid, lat, lng, mode):
+        with self._tx() as db:
+            if self._live(db, code) is None:
+                raise RoomError("room_not_found")
+            row = db.execute("SELECT data FROM participants WHERE code=? AND pid=?", (code, pid)).fetchone()
+            if row is None:
+                raise RoomError("participant_not_found")
+            p = json.loads(row[0])
+            _apply_participant_update(p, lat, lng, mode)
+            db.execute("UPDATE participants SET data=? WHERE code=? AND pid=?", (json.dumps(p, ensure_ascii=False), code, pid))
+            ver = self._bump(db, code, p=[pid])
+        self._notify(code)
+        return ver
+
+    def leave(self, code, pid):
+        with self._tx() as db:
+            if self._live(db, code) is None:
+                raise RoomError("room_not_found")
+            db.execute("DELETE FROM participants WHERE code=? AND pid=?", (code, pid))
+            ver = self._bump(db, code, rm=[pid], touch=False)
+        self._notify(code)
+        return ver
+
+    def close(self, code, host_secret):
+        with self._tx() as db:
+            row = self._live(db, code, "host_secret")
+            if row is None:
+                raise RoomError("room_not_found")
+            if host_secret != row[0]:
+                raise RoomError("host_secret_mismatch", 403)
+            self._drop(db, [code])
+        self._notify(code, drop=True)
+
+    def snapshot(self, code):
+        with self._tx(write=False) as db:
+            row = self._live(db, code, "meta, ver")
+            if row is None:
+                return None
+            return {"meta": json.loads(row[0]), "participants": self._parts(db, code), "ver": row[1]}
+
+    def ver(self, code):
+        with self._tx(write=False) as db:
+            row = self._live(db, code)
+        return None if row is None else row[0]
+
+    def wait(self, code, since, timeout):
+        deadline = time.monotonic() + timeout
+        cond = None
+        while True:
+            if self.ver(code) != since:
+                return True
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            if cond is None:
+                cond = self._cond(code)
+            with cond:
+                cond.wait(min(left, ROOM_STORE_POLL_S))
+
+    def state(self, code, lite=False):
+        cols = ", ".join(f"{name}_hash" if lite else name for name in ROOM_BLOBS)
+        with self._tx(write=False) as db:
+            row = self._live(db, code, "meta, ver, " + cols)
+            if row is None:
+                return None
+            parts = self._parts(db, code)
+        out = {"ok": True, "code": code, "meta": json.loads(row[0]), "participants": parts,
+               "centroid": _room_centroid(parts), "ver": row[1]}
+        if lite:
+            out.update({"delta": False, **{f"{name}_hash": h for name, h in zip(ROOM_BLOBS, row[2:])}})
+        else:
+            out.update({name: (json.loads(v) if v else None) for name, v in zip(ROOM_BLOBS, row[2:])})
+        return out
+
+    def delta(self, code, since):
+        with self._tx(write=False) as db:
+            row = self._live(db, code, "ver, " + ", ".join(f"{name}_hash" for name in ROOM_BLOBS))
+            if row is None or since > row[0]:
+                return None
+            hist = db.execute("SELECT ver, p, rm, blobs FROM history WHERE code=? AND ver > ? ORDER BY ver",
+                              (code, since)).fetchall()
+            if len(hist) != row[0] - since:
+                return None
+            parts = self._parts(db, code)
+        changed, removed, blobs = _merge_history((v, json.loads(p), json.loads(rm), json.loads(bl)) for v, p, rm, bl in hist)
+        by_pid = {p["pid"]: p for p in parts}
+        out = {
+            "ok": True, "code": code, "ver": row[0], "base": since, "delta": True,
+            "participants": [by_pid[pid] for pid in changed if pid in by_pid],
+            "removed": sorted(removed), "centroid": _room_centroid(parts),
+        }
+        for name, h in zip(ROOM_BLOBS, row[1:]):
+            out[f"{name}_changed"] = name in blobs
+            out[f"{name}_hash"] = h
+        return out
+
+    def blob(self, code, name):
+        with self._tx(write=False) as db:
+            row = self._live(db, code, f"{name}, {name}_hash")
+        if row is None or row[1] is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set_blob(self, code, name, value, venues=None):
+        # 해시는 쓸 때 한 번 계산해 같이 저장(메모리 백엔드의 _blob_hash와 같은 값)
+        data = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        h = hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+        with self._tx() as db:
+            row = self._live(db, code, name)
+            if row is None:
+                return None
+            if name == "results":
+                self._acquire_venues(db, venues or {}, _venue_ids(value))
+                self._release_venues(db, _venue_ids(json.loads(row[0]) if row[0] else None))
+            db.execute(f"UPDATE rooms SET {name}=?, {name}_hash=? WHERE code=?", (data, h, code))
+            ver = self._bump(db, code, blobs=[name])
+        self._notify(code)
+        return ver
+
+    def venues(self, ids):
+        if not ids:
+            return {}
+        with self._tx(write=False) as db:
+            rows = db.execute(f"SELECT vid, data FROM venues WHERE vid IN ({','.join('?' * len(ids))})", list(ids)).fetchall()
+        return {vid: json.loads(data) for vid, data in rows}
+
+    def info(self):
+        with self._tx(write=False) as db:
+            n = db.execute("SELECT COUNT(*) FROM rooms WHERE expires_at > ?", (_now_ms(),)).fetchone()[0]
+            nv, refs = db.execute("SELECT COUNT(*), COALESCE(SUM(refs), 0) FROM venues").fetchone()
+        return {"backend": self.name, "rooms": n, "path": self.path, "poll_s": ROOM_STORE_POLL_S, **self.stats,
+                "venues": {"venues": nv, "refs": refs}}
+
+ROOM_STORES: Dict[str, Callable[[], RoomStore]] = {
+    "memory": MemoryRoomStore,
+    "sqlite": lambda: SqliteRoomStore(ROOM_STORE_PATH),
+}
+if ROOM_STORE not in ROOM_STORES:
+    raise RuntimeError(f"unknown ROOM_STORE={ROOM_STORE!r} (choose: {', '.join(ROOM_STORES)})")
+STORE: RoomStore = ROOM_STORES[ROOM_STORE]()
+STORE.start()
 
 # ── Geo/Time utils
 R_EARTH = 6371000.0
+SPEEDS_KMH = {"car":40.0, "subway":35.0, "bus":20.0, "walk":5.0}
 
 def haversine_km(lat1,lng1,lat2,lng2):
     dlat = math.radians(lat2-lat1)
     dlng = math.radians(lng2-lng1)
     a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1))*math.cos(math.radians(lat2))*math.sin(dlng/2)**2
-    c = 2*math.atan2(math.sqrt(1-a), math.sqrt(a))
+    c = 2*math.atan2(math.sqrt(a), math.sqrt(1-a))
     return (R_EARTH*c)/1000.0
 
 def _parse_meeting_time(s: str | None) -> datetime:
@@ -93,13 +2087,12 @@ def _parse_meeting_time(s: str | None) -> datetime:
 
 def time_weighted_centroid(points: List[Dict]) -> Dict | None:
     if not points: return None
-    speeds = {"car":40.0, "subway":35.0, "bus":20.0, "walk":5.0}  # km/h
     lat0 = sum(p["lat"] for p in points)/len(points)
     lng0 = sum(p["lng"] for p in points)/len(points)
     cos0 = math.cos(math.radians(lat0))
     swx = swy = sw = 0.0
     for p in points:
-        v = speeds.get(p.get("mode","car"), 40.0)
+        v = SPEEDS_KMH.get(p.get("mode","car"), 40.0)
         w = 1.0/max(v,1.0)  # 느릴수록(시간 비용↑) 가중치↑
         x = (p["lng"]-lng0)*cos0
         y = (p["lat"]-lat0)
@@ -108,39 +2101,349 @@ def time_weighted_centroid(points: List[Dict]) -> Dict | None:
     cy = lat0 + (swy/max(sw,1e-9))
     return {"lat":cy, "lng":cx}
 
+# ── 공간 인덱스 (지하철역 + 조회해 둔 장소)
+# 고정 크기 위경도 격자. ETA 후보를 실제로 만날 수 있는 점(역/장소)으로 붙이는 데 씀
+SPATIAL_CELL_M   = float(os.getenv("SPATIAL_CELL_M") or 500)
+SPATIAL_REF_LAT  = 37.55                                        # 경도 칸 폭 기준 위도(서울)
+VENUE_INDEX_MAX  = int(os.getenv("VENUE_INDEX_MAX") or 50000)
+SUBWAY_DATA_PATH = pathlib.Path(os.getenv("SUBWAY_DATA_PATH") or pathlib.Path(__file__).with_name("data") / "seoul_subway.json")
+
+class GeoGrid:
+    # id → (lat, lng, data). 칸마다 id 집합을 두고, 반경 조회는 반경을 덮는 칸들만 거리 계산
+    def __init__(self, cell_m: float = SPATIAL_CELL_M, max_items: int | None = None):
+        self.cell_m = cell_m
+        self.step_lat = cell_m / 111320.0
+        self.step_lng = self.step_lat / math.cos(math.radians(SPATIAL_REF_LAT))
+        self.max_items = max_items
+        self._cells: Dict[Tuple[int,int], set] = {}
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int,int]:
+        return (int(math.floor(lat / self.step_lat)), int(math.floor(lng / self.step_lng)))
+
+    def put(self, item_id: str, lat: float, lng: float, data: Dict):
+        cell = self._cell(lat, lng)
+        with self._lock:
+            old = self._items.pop(item_id, None)
+            if old is not None:
+                self._cells[old[3]].discard(item_id)
+            self._items[item_id] = (lat, lng, data, cell)
+            self._cells.setdefault(cell, set()).add(item_id)
+            while self.max_items and len(self._items) > self.max_items:
+                vid, (_la, _ln, _d, vcell) = self._items.popitem(last=False)
+                self._cells[vcell].discard(vid)
+
+    def within(self, lat: float, lng: float, radius_m: float, limit: int | None = None) -> List[Tuple[float, str, float, float, Dict]]:
+        # 반경 안의 (거리m, id, lat, lng, data)를 가까운 순으로
+        cy, cx = self._cell(lat, lng)
+        ky = int(math.ceil(radius_m / self.cell_m))
+        kx = int(math.ceil(radius_m / (self.step_lng * 111320.0 * max(math.cos(math.radians(lat)), 1e-6))))
+        out = []
+        with self._lock:
+            for iy in range(cy - ky, cy + ky + 1):
+                for ix in range(cx - kx, cx + kx + 1):
+                    for item_id in self._cells.get((iy, ix), ()):
+                        ilat, ilng, data, _cell = self._items[item_id]
+                        d = haversine_km(lat, lng, ilat, ilng) * 1000.0
+                        if d <= radius_m:
+                            out.append((d, item_id, ilat, ilng, data))
+        out.sort(key=lambda t: t[0])
+        return out[:limit] if limit else out
+
+    def nearest(self, lat: float, lng: float, max_m: float) -> Tuple[float, str, float, float, Dict] | None:
+        r = min(self.cell_m, max_m)
+        while True:
+            hits = self.within(lat, lng, r, limit=1)
+            if hits or r >= max_m:
+                return hits[0] if hits else None
+            r = min(r * 2, max_m)
+
+STATION_INDEX = GeoGrid()
+VENUE_INDEX = GeoGrid(max_items=VENUE_INDEX_MAX)
+
+# ── 지하철 이동시간 모델
+# 노선별 운행 순서 + 역 좌표(SUBWAY_DATA_PATH)로 (역, 노선) 노드 그래프를 만들고, 시작할 때 역 × 역 최단 시간표를 미리 계산
+# 역간 시간은 거리/표정속도 + 정차, 같은 역의 다른 노선으로 갈아타면 환승 시간. 순환선(loops)은 양 끝을 이음
+# ETA = 출발지→가까운 역 도보 + 대기 + 시간표 + 역→도착지 도보(가까운 역 SUBWAY_ACCESS_K개씩 조합 중 최소, 걷는 게 빠르면 도보)
+# 네트워크 호출 없이 칸당 수 µs. subway 참가자의 속도기반 값(_speed_eta_block)을 대신하고,
+# SUBWAY_ETA=local이면 Distance Matrix 대중교통 호출 대신, ETA_PREFILTER면 호출 전 후보 거르기에도 씀
+SUBWAY_ETA          = (os.getenv("SUBWAY_ETA") or "google").strip().lower()   # google: DM transit(실패분만 모델) | local: 항상 모델
+SUBWAY_RUN_KMH      = float(os.getenv("SUBWAY_RUN_KMH") or 42)       # 역간 주행 속도(정차 제외, 가감속 포함)
+SUBWAY_DWELL_MIN    = float(os.getenv("SUBWAY_DWELL_MIN") or 0.5)    # 역마다 정차
+SUBWAY_WAIT_MIN     = float(os.getenv("SUBWAY_WAIT_MIN") or 4)       # 처음 탈 때 기다리는 시간(배차 간격 절반)
+SUBWAY_TRANSFER_MIN = float(os.getenv("SUBWAY_TRANSFER_MIN") or 6)   # 환승 1회(걷기 + 대기)
+SUBWAY_ACCESS_M     = float(os.getenv("SUBWAY_ACCESS_M") or 1500)    # 이 안의 역만 걸어서 타고 내림
+SUBWAY_ACCESS_K     = int(os.getenv("SUBWAY_ACCESS_K") or 3)         # 출발/도착마다 볼 가까운 역 수
+WALK_KMH, WALK_DETOUR = 4.5, 1.3                                     # 도보 속도, 직선 대비 우회 계수
+
+def _walk_min(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    return haversine_km(lat1, lng1, lat2, lng2) * WALK_DETOUR / WALK_KMH * 60
+
+class SubwayModel:
+    # 노드 = (역, 노선). 인접은 CSR 배열(offsets/targets/weights), 시간표는 역 × 역 분(array('f'), 행 우선)
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}      # STATION_INDEX id("S:역") → 역 번호
+        self.n = 0
+        self.table = array("f")
+        self.nodes = 0
+        self.build_ms = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.n > 0
+
+    def build(self, data: Dict):
+        t = time.perf_counter()
+        coords = data.get("stations", {})
+        names = sorted(coords)
+        sid = {name: i for i, name in enumerate(names)}
+        node_st = array("i")
+        adj: List[List[Tuple[int, float]]] = []
+        by_station: Dict[int, List[int]] = {}
+
+        def _node(st: int) -> int:
+            node_st.append(st); adj.append([])
+            by_station.setdefault(st, []).append(len(adj) - 1)
+            return len(adj) - 1
+
+        loops = set(data.get("loops", []))
+        for line, seq in data.get("lines", {}).items():
+            seq = [name for name in seq if name in sid]
+            ns = [_node(sid[name]) for name in seq]
+            pairs = list(zip(ns, ns[1:])) + ([(ns[-1], ns[0])] if line in loops and len(ns) > 2 else [])
+            for u, v in pairs:
+                (la1, ln1), (la2, ln2) = coords[names[node_st[u]]], coords[names[node_st[v]]]
+                w = haversine_km(la1, ln1, la2, ln2) / SUBWAY_RUN_KMH * 60 + SUBWAY_DWELL_MIN
+                adj[u].append((v, w)); adj[v].append((u, w))
+        for ns in by_station.values():
+            for u in ns:
+                adj[u].extend((v, SUBWAY_TRANSFER_MIN) for v in ns if v != u)
+        offsets, targets, weights = array("i", [0]), array("i"), array("f")
+        for edges in adj:
+            for v, w in edges:
+                targets.append(v); weights.append(w)
+            offsets.append(len(targets))
+
+        # 역마다 그 역의 모든 노선 노드에서 동시에 출발하는 다익스트라 → 역별 최소
+        n = len(names)
+        table = array("f", [math.inf]) * (n * n)
+        for s in range(n):
+            dist = [math.inf] * len(adj)
+            heap = []
+            for u in by_station.get(s, ()):
+                dist[u] = 0.0; heap.append((0.0, u))
+            row = s * n
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                st = node_st[u]
+                if d < table[row + st]:
+                    table[row + st] = d
+                for k in range(offsets[u], offsets[u + 1]):
+                    v, nd = targets[k], d + weights[k]
+                    if nd < dist[v]:
+                        dist[v] = nd; heapq.heappush(heap, (nd, v))
+        self.names, self.ids, self.n, self.table, self.nodes = names, {"S:" + name: i for i, name in enumerate(names)}, n, table, len(adj)
+        self.build_ms = (time.perf_counter() - t) * 1000
+
+    def access(self, lat: float, lng: float) -> List[Tuple[int, float]]:
+        # 걸어서 닿는 가까운 역들: [(역 번호, 도보 분)]
+        return [(self.ids[sid_], d / 1000.0 * WALK_DETOUR / WALK_KMH * 60)
+                for d, sid_, _la, _ln, _data in STATION_INDEX.within(lat, lng, SUBWAY_ACCESS_M, SUBWAY_ACCESS_K)
+                if sid_ in self.ids]
+
+    def eta_rows(self, points: List[Tuple[float,float]], cands: List[Tuple[float,float]]) -> List[List[int | None]]:
+        # 출발점 × 후보 분. 양쪽 다 역이 멀고 걸어가기에도 먼 칸은 None(호출 쪽이 평균 속도로)
+        out = [[None] * len(cands) for _ in points]
+        if not self.ready:
+            return out
+        egress = [self.access(clat, clng) for clat, clng in cands]
+        n, T = self.n, self.table
+        for row, (plat, plng) in zip(out, points):
+            acc = self.access(plat, plng)
+            for j, ((clat, clng), eg) in enumerate(zip(cands, egress)):
+                best = math.inf
+                for a, wa in acc:
+                    base = a * n
+                    for b, wb in eg:
+                        t = wa + T[base + b] + wb
+                        if t < best:
+                            best = t
+                walk = _walk_min(plat, plng, clat, clng)
+                if best < math.inf:
+                    row[j] = int(round(min(best + SUBWAY_WAIT_MIN, walk)))
+                elif walk <= SUBWAY_ACCESS_M / 1000.0 * WALK_DETOUR / WALK_KMH * 60:
+                    row[j] = int(round(walk))
+        return out
+
+    def info(self) -> Dict:
+        return {"stations": self.n, "nodes": self.nodes, "table_kb": round(len(self.table) * self.table.itemsize / 1024, 1),
+                "build_ms": round(self.build_ms, 1), "mode": SUBWAY_ETA}
+
+SUBWAY = SubwayModel()
+
+def _load_stations():
+    try:
+        data = json.loads(SUBWAY_DATA_PATH.read_text(encoding="utf-8"))
+    except Exception as e:
+        log.warning("subway data load failed: %s", e)
+        return
+    lines_of: Dict[str, List[str]] = {}
+    for line, names in data.get("lines", {}).items():
+        for name in names:
+            lines_of.setdefault(name, []).append(line)
+    for name, (lat, lng) in data.get("stations", {}).items():
+        STATION_INDEX.put("S:" + name, lat, lng, {"kind": "station", "name": name + "역", "lines": sorted(set(lines_of.get(name, [])))})
+    SUBWAY.build(data)
+    log.info("subway stations indexed: %d (time table %d × %d, %d ms)", len(STATION_INDEX), SUBWAY.n, SUBWAY.n, SUBWAY.build_ms)
+
+_load_stations()
+
+def _index_venues(docs: List[Dict]):
+    # 카카오 검색으로 받아 온 장소를 인덱스에 쌓아 둠(다음 ETA 계산의 스냅 대상)
+    for d in docs:
+        try:
+            VENUE_INDEX.put("K:" + str(d["id"]), float(d["y"]), float(d["x"]),
+                            {"kind": "venue", "id": str(d["id"]), "name": d.get("place_name"),
+                             "category": d.get("category_group_code")})
+        except (KeyError, TypeError, ValueError):
+            continue
+
+def _snap_point(lat: float, lng: float, max_m: float) -> Tuple[float, float, Dict] | None:
+    # 가장 가까운 역/장소(max_m 이내). 없으면 None
+    best = None
+    for index in (STATION_INDEX, VENUE_INDEX):
+        hit = index.nearest(lat, lng, max_m)
+        if hit is not None and (best is None or hit[0] < best[0]):
+            best = hit
+    if best is None:
+        return None
+    d, _id, plat, plng, data = best
+    return plat, plng, {**data, "snap_m": round(d)}
+
+def _nearby_places(lat: float, lng: float, radius_m: float, limit: int) -> List[Dict]:
+    hits = STATION_INDEX.within(lat, lng, radius_m, limit) + VENUE_INDEX.within(lat, lng, radius_m, limit)
+    hits.sort(key=lambda t: t[0])
+    return [{**data, "lat": plat, "lng": plng, "dist_m": round(d)} for d, _id, plat, plng, data in hits[:limit]]
+
 # ── Kakao Local
-def kakao_category_search(lat,lng,category,radius):
+# 같은 동네(KAKAO_CELL_M 격자)·같은 반경 단계·같은 카테고리/검색어는 같은 키 → 동시에 들어오면 업스트림 호출 1번을 나눠 씀
+# 결과는 KAKAO_FRESH_S 동안 그대로, 그 뒤 KAKAO_STALE_S까지는 옛 값을 바로 주고 뒤에서 한 번만 다시 받아 옴
+KAKAO_CACHE_MAX     = int(os.getenv("KAKAO_CACHE_MAX") or 2000)
+KAKAO_FRESH_S       = float(os.getenv("KAKAO_FRESH_S") or 120)
+KAKAO_STALE_S       = float(os.getenv("KAKAO_STALE_S") or 600)
+KAKAO_CELL_M        = float(os.getenv("KAKAO_CELL_M") or 150)        # 검색 중심 양자화 셀 크기(m)
+KAKAO_RADIUS_STEP_M = int(os.getenv("KAKAO_RADIUS_STEP_M") or 100)    # 반경은 이 단위로 올림
+KAKAO_PAGE_SIZE     = 15    # 카카오 로컬 한 쪽 최대 문서 수
+KAKAO_MAX_PAGE      = 45    # 카카오 로컬이 넘겨 주는 마지막 쪽
+KAKAO_CACHE = TTLCache("kakao", KAKAO_CACHE_MAX, persist=False)
+KAKAO_FLIGHT = SingleFlight()
+KAKAO_STATS = {"revalidations": 0, "revalidate_failed": 0}
+
+def _kakao_area(lat: float, lng: float, radius) -> Tuple[float, float, int, str]:
+    # 검색 중심을 셀 중심으로 옮기고 반경을 단계로 올림 → (lat, lng, radius, 셀 키). _geo_cell과 같은 격자 방식
+    step_lat = KAKAO_CELL_M / 111320.0
+    iy = round(float(lat) / step_lat)
+    step_lng = step_lat / max(math.cos(math.radians(iy * step_lat)), 1e-6)
+    ix = round(float(lng) / step_lng)
+    r = max(100, min(int(radius or 2000), 20000))
+    r = min(20000, math.ceil(r / KAKAO_RADIUS_STEP_M) * KAKAO_RADIUS_STEP_M)
+    return round(iy * step_lat, 6), round(ix * step_lng, 6), r, f"{iy}:{ix}"
+
+def _kakao_result(ent: Dict) -> Dict:
+    # 호출 쪽(meeting_suggest)이 항목 dict에 필드를 덧붙이므로 캐시 원본 대신 얕은 복사본을 줌
+    items = ent["items"]
+    return {"ok": True, "items": [dict(d) for d in items], "count": len(items),
+            "is_end": ent.get("is_end", True), "pageable_count": ent.get("pageable_count", len(items))}
+
+def _kakao_fill(key: str, fetch: Callable) -> Dict:
+    res = fetch()
+    if res.get("ok"):
+        KAKAO_CACHE.put(key, {"items": res["items"], "is_end": res["is_end"], "pageable_count": res["pageable_count"],
+                              "fresh_until": time.time() + KAKAO_FRESH_S},
+                        KAKAO_FRESH_S + KAKAO_STALE_S)
+    return res
+
+def _kakao_revalidate(key: str, call: list, fetch: Callable):
+    # call = KAKAO_FLIGHT.try_begin으로 잡아 둔 자리. 그 사이 들어온 같은 키 조회는 이 결과를 기다림
+    try:
+        KAKAO_FLIGHT.lead(key, call, lambda: _kakao_fill(key, fetch))
+    except Exception as e:
+        _stat_add(KAKAO_STATS, revalidate_failed=1)
+        log.warning("kakao revalidate failed (%s): %s", key, e)
+
+def _kakao_cached(key: str, fetch: Callable) -> Dict:
+    ent = KAKAO_CACHE.get(key)
+    if ent is not _MISS:
+        call = KAKAO_FLIGHT.try_begin(key) if time.time() >= ent["fresh_until"] else None
+        if call is not None:
+            # 자리를 잡은 요청만 다시 받아 오기를 예약(동시에 만료를 본 요청이 여럿이어도 한 번)
+            _stat_add(KAKAO_STATS, revalidations=1)
+            _FANOUT.submit(_kakao_revalidate, key, call, fetch)
+        _index_venues(ent["items"])
+        return _kakao_result(ent)
+    res = KAKAO_FLIGHT.do(key, lambda: _kakao_fill(key, fetch))
+    return _kakao_result(res) if res.get("ok") else res
+
+def kakao_category_search(lat,lng,category,radius,page=1):
     if not KAKAO_REST_KEY:
         return {"ok":False, "error":"KAKAO_REST_KEY_not_set"}
-    url = "https://dapi.kakao.com/v2/local/search/category.json"
+    clat, clng, r, cell = _kakao_area(lat, lng, radius)
+    return _kakao_cached(f"cat|{category}|{cell}|{r}|{page}", lambda: _kakao_category_fetch(clat, clng, category, r, page))
+
+def kakao_keyword_search(lat, lng, query, radius, category_group_code=None, page=1):
+    if not KAKAO_REST_KEY:
+        return {"ok": False, "error": "KAKAO_REST_KEY_not_set"}
+    clat, clng, r, cell = _kakao_area(lat, lng, radius)
+    return _kakao_cached(f"kw|{query}|{category_group_code or '-'}|{cell}|{r}|{page}",
+                         lambda: _kakao_keyword_fetch(clat, clng, query, r, category_group_code, page))
+
+def _kakao_page(data: Dict) -> Dict:
+    # meta.is_end: 마지막 쪽인지, meta.pageable_count: 쪽으로 넘겨 받을 수 있는 전체 문서 수(최대 45쪽)
+    docs = data.get("documents", [])
+    meta = data.get("meta") or {}
+    _index_venues(docs)
+    return {"ok": True, "items": docs, "count": len(docs), "is_end": bool(meta.get("is_end", True)),
+            "pageable_count": int(meta.get("pageable_count") or len(docs))}
+
+def _kakao_category_fetch(lat, lng, category, radius, page=1):
+    url = f"{KAKAO_API_BASE}/v2/local/search/category.json"
     params = {
         "category_group_code": category,
         "y": lat, "x": lng,
-        "radius": max(100, min(int(radius or 2000), 20000)),
-        "size": 15, "sort": "distance",
+        "radius": radius,
+        "size": KAKAO_PAGE_SIZE, "page": page, "sort": "distance",
     }
-    r = requests.get(url, params=params, headers={"Authorization": f"KakaoAK {KAKAO_REST_KEY}"}, timeout=10)
+    try:
+        r = _http_get("kakao", url, api="kakao_local", params=params, headers={"Authorization": f"KakaoAK {KAKAO_REST_KEY}"})
+    except UpstreamUnavailable as e:
+        return {"ok":False, "error":"kakao_unavailable", "reason":e.reason}
     if r.status_code != 200:
         return {"ok":False, "error":f"kakao_http_{r.status_code}", "body":r.text}
-    data = r.json()
-    return {"ok":True, "items": data.get("documents",[]), "count": len(data.get("documents",[]))}
+    return _kakao_page(r.json())
 
-def kakao_keyword_search(lat, lng, query, radius, category_group_code=None):
-    if not KAKAO_REST_KEY:
-        return {"ok": False, "error": "KAKAO_REST_KEY_not_set"}
-    url = "https://dapi.kakao.com/v2/local/search/keyword.json"
+def _kakao_keyword_fetch(lat, lng, query, radius, category_group_code=None, page=1):
+    url = f"{KAKAO_API_BASE}/v2/local/search/keyword.json"
     params = {
         "query": query, "x": lng, "y": lat,
-        "radius": max(100, min(int(radius or 2000), 20000)),
-        "size": 15, "sort": "distance",
+        "radius": radius,
+        "size": KAKAO_PAGE_SIZE, "page": page, "sort": "distance",
     }
     if category_group_code:
         params["category_group_code"] = category_group_code
-    r = requests.get(url, params=params, headers={"Authorization": f"KakaoAK {KAKAO_REST_KEY}"}, timeout=10)
+    try:
+        r = _http_get("kakao", url, api="kakao_local", params=params, headers={"Authorization": f"KakaoAK {KAKAO_REST_KEY}"})
+    except UpstreamUnavailable as e:
+        return {"ok": False, "error": "kakao_unavailable", "reason": e.reason}
     if r.status_code != 200:
         return {"ok": False, "error": f"kakao_http_{r.status_code}", "body": r.text}
-    data = r.json()
-    return {"ok": True, "items": data.get("documents", []), "count": len(data.get("documents", []))}
+    return _kakao_page(r.json())
 
 # ── Google Places / Distance Matrix
 def google_type_for(category):
@@ -148,143 +2451,273 @@ def google_type_for(category):
     if category == "CE7": return "cafe"
     return "restaurant"
 
-def google_enrich(name, lat, lng, category):
+# 보강 캐시: 정적 필드(place_id/전화/웹/사진)와 영업시간을 TTL을 달리해 따로 저장
+ENRICH_CACHE_MAX      = int(os.getenv("ENRICH_CACHE_MAX") or 5000)
+ENRICH_HOURS_TTL_S    = int(os.getenv("ENRICH_HOURS_TTL_S") or 6*3600)
+ENRICH_STATIC_TTL_S   = int(os.getenv("ENRICH_STATIC_TTL_S") or 7*24*3600)
+ENRICH_NEGATIVE_TTL_S = int(os.getenv("ENRICH_NEGATIVE_TTL_S") or 24*3600)
+ENRICH_CACHE = TTLCache("enrich", ENRICH_CACHE_MAX)
+
+GOOGLE_STATIC_FIELDS = "formatted_phone_number,international_phone_number,website,photos,url"
+GOOGLE_HOURS_FIELDS = "opening_hours,current_opening_hours"
+
+def _enrich_key(kakao_id, name, lat, lng) -> str:
+    if kakao_id:
+        return f"id:{kakao_id}"
+    return f"nm:{name}@{round(float(lat),4)},{round(float(lng),4)}"
+
+def _google_find_place(name, lat, lng, category) -> str | None:
+    # 반환: place_id, 매칭 없음이면 "", 그 외 실패는 None(캐시하지 않음)
+    resp = _http_get(
+        "google", f"{GOOGLE_API_BASE}/maps/api/place/nearbysearch/json", api="google_nearby",
+        params={"key": GOOGLE_API_KEY, "location": f"{lat},{lng}", "radius": 120, "keyword": name,
+                "type": google_type_for(category)},
+    )
+    if resp.status_code != 200:
+        return None
+    nearby = resp.json()
+    candidates = nearby.get("results", [])
+    if candidates:
+        return candidates[0]["place_id"]
+    return "" if nearby.get("status") in (None, "OK", "ZERO_RESULTS") else None
+
+def _parse_static(result: Dict) -> Dict:
+    photo_url = ""
+    photos = result.get("photos") or []
+    if photos:
+        ref = photos[0].get("photo_reference")
+        if ref:
+            photo_url = f"{GOOGLE_API_BASE}/maps/api/place/photo?maxwidth=640&photo_reference={ref}&key={GOOGLE_API_KEY}"
+    return {
+        "_phone": result.get("formatted_phone_number") or result.get("international_phone_number"),
+        "_website": result.get("website"),
+        "_photo_url": photo_url
+    }
+
+def _parse_hours(result: Dict) -> Dict:
+    cur = result.get("current_opening_hours") or {}
+    reg = result.get("opening_hours") or {}
+    open_now = None
+    if "open_now" in cur: open_now = cur.get("open_now")
+    elif "open_now" in reg: open_now = reg.get("open_now")
+    periods = cur.get("periods") or reg.get("periods")
+    return {
+        "_open_now": open_now,
+        "_weekday_text": cur.get("weekday_text") or reg.get("weekday_text"),
+        "_periods": periods,
+    }
+
+def _compile_hours(hours: Dict) -> Dict:
+    # 영업시간 캐시 항목에 컴파일 구간을 붙여 둠(장소당 한 번). 구간이 없는 예전 캐시 항목도 처음 꺼낼 때 여기서
+    if "_open_intervals" not in hours:
+        periods = hours.get("_periods")
+        hours["_open_intervals"] = _compile_periods(periods) if periods else None
+    return hours
+
+def google_enrich(name, lat, lng, category, kakao_id=None):
+    # 반환: 보강 필드, 매칭/데이터 없음이면 {}, 업스트림 실패(스로틀/차단/오류)면 None → 호출 쪽이 "보강 못 함"으로 구분
+    # _open_intervals(컴파일된 영업시간)는 영업시간 필터용: 호출 쪽이 떼어 내고 응답 항목에는 싣지 않음
     if not GOOGLE_API_KEY:
         return {}
+    key = _enrich_key(kakao_id, name, lat, lng)
+    static = ENRICH_CACHE.get("s:" + key)
+    if static is not _MISS and not static.get("place_id"):
+        return {}  # negative 캐시: 매칭 없음
+    hours = ENRICH_CACHE.get("h:" + key) if static is not _MISS else _MISS
+    if static is not _MISS and hours is not _MISS:
+        return {**{k: v for k, v in static.items() if k != "place_id"}, **_compile_hours(hours)}
     try:
-        gtype = google_type_for(category)
-        nearby = requests.get(
-            "https://maps.googleapis.com/maps/api/place/nearbysearch/json",
-            params={"key": GOOGLE_API_KEY, "location": f"{lat},{lng}", "radius": 120, "keyword": name, "type": gtype},
-            timeout=10
-        ).json()
-        candidates = nearby.get("results", [])
-        if not candidates:
-            return {}
-        place_id = candidates[0]["place_id"]
-        details = requests.get(
-            "https://maps.googleapis.com/maps/api/place/details/json",
-            params={
-                "key": GOOGLE_API_KEY, "place_id": place_id,
-                "fields": "opening_hours,current_opening_hours,formatted_phone_number,international_phone_number,website,photos,url"
-            },
-            timeout=10
-        ).json()
+        if static is _MISS:
+            place_id = _google_find_place(name, lat, lng, category)
+            if place_id is None:
+                return None
+            if not place_id:
+                ENRICH_CACHE.put("s:" + key, {"place_id": ""}, ENRICH_NEGATIVE_TTL_S)
+                return {}
+            fields = GOOGLE_HOURS_FIELDS + "," + GOOGLE_STATIC_FIELDS
+        else:
+            # 정적 필드는 아직 유효 → 영업시간만 다시 조회
+            place_id = static["place_id"]
+            fields = GOOGLE_HOURS_FIELDS
+        resp = _http_get(
+            "google", f"{GOOGLE_API_BASE}/maps/api/place/details/json", api="google_details",
+            params={"key": GOOGLE_API_KEY, "place_id": place_id, "fields": fields},
+        )
+        details = resp.json() if resp.status_code == 200 else {"status": f"HTTP_{resp.status_code}"}
+        if details.get("status") not in (None, "OK"):
+            return None
         result = details.get("result", {}) or {}
+        if static is _MISS:
+            static = {"place_id": place_id, **_parse_static(result)}
+            ENRICH_CACHE.put("s:" + key, static, ENRICH_STATIC_TTL_S)
+        hours = _compile_hours(_parse_hours(result))
+        ENRICH_CACHE.put("h:" + key, hours, ENRICH_HOURS_TTL_S)
+        return {**{k: v for k, v in static.items() if k != "place_id"}, **hours}
+    except UpstreamUnavailable:
+        return None
+    except Exception as e:
+        log.warning("google enrich failed (%s): %r", key, e)
+        return None
 
-        photo_url = ""
-        photos = result.get("photos") or []
-        if photos:
-            ref = photos[0].get("photo_reference")
-            if ref:
-                photo_url = f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=640&photo_reference={ref}&key={GOOGLE_API_KEY}"
-
-        cur = result.get("current_opening_hours") or {}
-        reg = result.get("opening_hours") or {}
-        weekday_text = cur.get("weekday_text") or reg.get("weekday_text")
-        periods = cur.get("periods") or reg.get("periods")
-        open_now = None
-        if "open_now" in cur: open_now = cur.get("open_now")
-        elif "open_now" in reg: open_now = reg.get("open_now")
-
-        return {
-            "_open_now": open_now,
-            "_weekday_text": weekday_text,
-            "_periods": periods,
-            "_phone": result.get("formatted_phone_number") or result.get("international_phone_number"),
-            "_website": result.get("website"),
-            "_photo_url": photo_url
-        }
-    except Exception:
-        return {}
+# Distance Matrix 요청당 한도 (origins ≤25, destinations ≤25, elements ≤100)
+DM_MAX_ORIGINS = 25
+DM_MAX_DESTS = 25
+DM_MAX_ELEMENTS = 100
 
-def google_distance_matrix(origins: List[Tuple[float,float]],
-                           dest: Tuple[float,float],
-                           mode: str,
-                           transit_mode: str | None,
-                           departure_time_unix: int) -> List[int | None]:
-    if not GOOGLE_API_KEY:
-        return [None] * len(origins)
-    durations: List[int | None] = []
+def _dm_plan(n_orig: int, n_dest: int) -> Tuple[int, int]:
+    # 요청 수가 최소가 되는 (origin 청크, destination 청크) 크기
+    best = None
+    for oc in range(1, min(n_orig, DM_MAX_ORIGINS) + 1):
+        dc = max(1, min(DM_MAX_DESTS, DM_MAX_ELEMENTS // oc, n_dest))
+        reqs = math.ceil(n_orig / oc) * math.ceil(n_dest / dc)
+        if best is None or reqs < best[0]:
+            best = (reqs, oc, dc)
+    return best[1], best[2]
+
+def _even_chunks(seq: list, size: int) -> List[list]:
+    # 마지막 청크만 작아지지 않도록 고르게 분할
+    if not seq: return []
+    k = math.ceil(len(seq) / size)
+    q, r = divmod(len(seq), k)
+    out, i = [], 0
+    for j in range(k):
+        n = q + (1 if j < r else 0)
+        out.append(seq[i:i+n]); i += n
+    return out
+
+_STATS_LOCK = threading.Lock()
+
+def _stat_add(stats: Dict | None, **kw):
+    if stats is None: return
+    with _STATS_LOCK:
+        for k, v in kw.items():
+            stats[k] = stats.get(k, 0) + v
+
+def _dm_tasks(origins: List[Tuple[float,float]],
+              dests: List[Tuple[float,float]],
+              mode: str,
+              transit_mode: str | None,
+              departure_time_unix: int,
+              stats: Dict | None = None) -> List[Callable]:
+    # 요청 블록별 작업. 각 작업은 [(origin_idx, dest_idx, 분), ...] 반환
     base_params = {
         "key": GOOGLE_API_KEY,
-        "destinations": f"{dest[0]},{dest[1]}",
         "mode": mode,
         "departure_time": departure_time_unix
     }
     if mode == "transit" and transit_mode:
         base_params["transit_mode"] = transit_mode
 
-    def _one_chunk(chunk: List[Tuple[float,float]]):
+    def _one_block(oi: List[int], di: List[int]):
         params = base_params.copy()
-        params["origins"] = "|".join([f"{lat},{lng}" for (lat,lng) in chunk])
-        resp = requests.get("https://maps.googleapis.com/maps/api/distancematrix/json", params=params, timeout=10)
+        params["origins"] = "|".join(f"{origins[i][0]:.6f},{origins[i][1]:.6f}" for i in oi)
+        params["destinations"] = "|".join(f"{dests[j][0]:.6f},{dests[j][1]:.6f}" for j in di)
+        _stat_add(stats, requests=1, elements=len(oi) * len(di))
+        resp = _http_get("google", f"{GOOGLE_API_BASE}/maps/api/distancematrix/json",
+                         api="google_distance_matrix", elements=len(oi) * len(di), params=params)
         if resp.status_code != 200:
-            return [None]*len(chunk)
+            return None
         data = resp.json()
+        if data.get("status") not in (None, "OK"):
+            return None   # OVER_QUERY_LIMIT 등 → 이 블록은 실패(호출 쪽이 속도기반으로 메움)
+        cells = []
         rows = data.get("rows", [])
-        out: List[int | None] = []
-        for row in rows:
-            elements = (row or {}).get("elements", [])
-            el0 = elements[0] if elements else {}
-            if el0.get("status") != "OK":
-                out.append(None); continue
-            dur = (el0.get("duration_in_traffic") or el0.get("duration") or {}).get("value")
-            out.append(int(round((dur or 0)/60)) if dur is not None else None)
-        return out
+        for i, row in zip(oi, rows):
+            for j, el in zip(di, (row or {}).get("elements", [])):
+                if (el or {}).get("status") != "OK":
+                    continue
+                dur = (el.get("duration_in_traffic") or el.get("duration") or {}).get("value")
+                if dur is not None:
+                    cells.append((i, j, int(round(dur / 60))))
+        return cells
 
-    i = 0
-    while i < len(origins):
-        chunk = origins[i:i+25]  # API limit
-        durations.extend(_one_chunk(chunk))
-        i += 25
-    return durations
+    oc, dc = _dm_plan(len(origins), len(dests))
+    return [(lambda oi=oi, di=di: _one_block(oi, di))
+            for oi in _even_chunks(list(range(len(origins))), oc)
+            for di in _even_chunks(list(range(len(dests))), dc)]
 
 # ── Opening-hours helpers
-def _google_day_from_py(py_weekday: int) -> int:
-    return (py_weekday + 1) % 7
-
-def _dt_for_google_day(base_date: datetime, gday: int, hhmm: str) -> datetime:
-    g_base = _google_day_from_py(base_date.weekday())
-    delta_days = gday - g_base
-    d = base_date + timedelta(days=delta_days)
-    hh = int(hhmm[:2]) if hhmm else 0
-    mm = int(hhmm[2:]) if hhmm else 0
-    return datetime(d.year, d.month, d.day, hh, mm, 0)
-
-def _minutes_open_after(meeting_dt: datetime, periods: list) -> tuple | None:
-    best = None
+# Google periods를 보강/캐시 시점에 한 번 "주 단위 분" 구간으로 컴파일(일요일 00:00 = 0, Google day와 같은 기준)
+# 구간은 정렬·병합된 평평한 리스트 [s0, e0, s1, e1, ...] → "T에 열려 있나/몇 분 남았나"는 bisect 한 번
+# 밤샘·주 경계(토→일)는 e가 다음 주로 넘어가면 둘로 나눠 담고, 조회할 때 주 끝과 주 처음이 붙어 있으면 이어서 셈
+WEEK_MIN = 7 * 24 * 60
+
+def _hhmm_min(hhmm: str) -> int:
+    return int(hhmm[:2]) * 60 + int(hhmm[2:4]) if hhmm else 0
+
+def _week_minute(dt: datetime) -> int:
+    return ((dt.weekday() + 1) % 7) * 1440 + dt.hour * 60 + dt.minute
+
+def _compile_periods(periods: list) -> List[int]:
+    spans = []
     for p in periods or []:
         op = p.get("open") or {}
         cl = p.get("close") or {}
         if "day" not in op or "time" not in op:
             continue
-        g_open_day = int(op["day"])
-        open_dt = _dt_for_google_day(meeting_dt, g_open_day, str(op["time"]))
-        if "day" in cl and "time" in cl:
-            g_close_day = int(cl["day"])
-            close_dt = _dt_for_google_day(meeting_dt, g_close_day, str(cl["time"]))
-            if close_dt <= open_dt:  # 밤샘
-                close_dt += timedelta(days=1)
+        try:
+            s = int(op["day"]) * 1440 + _hhmm_min(str(op["time"]))
+            if "day" in cl and "time" in cl:
+                e = int(cl["day"]) * 1440 + _hhmm_min(str(cl["time"]))
+                if e <= s:   # 밤샘/주 경계
+                    e += WEEK_MIN
+            elif len(periods) == 1 and s == 0:
+                e = s + WEEK_MIN   # 닫는 시각 없는 일요일 00:00 하나 = 24시간 영업
+            else:
+                e = s + 1440
+        except (TypeError, ValueError):
+            continue
+        dur = min(e - s, WEEK_MIN)
+        s %= WEEK_MIN
+        e = s + dur
+        if e > WEEK_MIN:
+            spans.append((s, WEEK_MIN)); spans.append((0, e - WEEK_MIN))
         else:
-            close_dt = open_dt + timedelta(hours=24)
-        if open_dt <= meeting_dt < close_dt:
-            mins = int((close_dt - meeting_dt).total_seconds() // 60)
-            if (best is None) or (mins > best[0]):
-                best = (mins, close_dt)
-    return best
+            spans.append((s, e))
+    spans.sort()
+    merged: List[List[int]] = []
+    for s, e in spans:
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return [x for span in merged for x in span]
+
+def _open_minutes_left(iv: List[int], t: int) -> int | None:
+    # t(주 단위 분)에 열려 있으면 닫을 때까지 남은 분(항상 영업이면 WEEK_MIN), 닫혀 있으면 None
+    i = bisect.bisect_right(iv, t)
+    if i % 2 == 0:
+        return None
+    end = iv[i]
+    if end == WEEK_MIN and iv[0] == 0:
+        if len(iv) == 2:
+            return WEEK_MIN
+        end += iv[1]   # 토요일 밤 → 일요일 새벽으로 이어짐
+    return end - t
+
+def _open_minutes_batch(ivs: List[List[int] | None], meeting_dt: datetime) -> List[int | None | bool]:
+    # 여러 장소를 같은 모임시각 하나로 한꺼번에: 구간 없음(영업시간 모름)은 False, 닫힘은 None, 열림은 남은 분
+    t = _week_minute(meeting_dt)
+    return [False if not iv else _open_minutes_left(iv, t) for iv in ivs]
 
 # ─────────────────────────────────────────────────────────────────────────────
 # ⬇ API ROUTES (정적 서빙보다 위) ⬇
 # ─────────────────────────────────────────────────────────────────────────────
 @app.route("/api/health", methods=["GET", "HEAD"])
 def health():
+    store_info = STORE.info()
     payload = {
         "ok": True,
         "ts": _now_ms(),
         "kakao_rest_key": bool(KAKAO_REST_KEY),
         "google_key": bool(GOOGLE_API_KEY),
         "static_dir": STATIC_DIR,
+        "rooms": store_info["rooms"],
+        "room_store": store_info,
+        "jobs": _jobs_info(),
+        "upstreams": {name: g.info() for name, g in GUARDS.items()},
+        "quota": QUOTA.info(),
+        "subway_model": SUBWAY.info(),
     }
     resp = make_response(jsonify(payload), 200)
     resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
@@ -295,6 +2728,62 @@ def health():
 def _health_alias():
     return health()
 
+@app.route("/api/cache/stats")
+def cache_stats():
+    return jsonify({"ok": True, "enrich": ENRICH_CACHE.info(), "travel_time": TT_CACHE.info(),
+                    "kakao": {**KAKAO_CACHE.info(), "flight": dict(KAKAO_FLIGHT.stats), **KAKAO_STATS},
+                    "spatial": {"stations": len(STATION_INDEX), "venues": len(VENUE_INDEX),
+                                "venues_max": VENUE_INDEX_MAX, "cell_m": SPATIAL_CELL_M}})
+
+# ── Metrics 노출
+def _persisted_bytes() -> int:
+    if STORE.name == "memory":
+        paths = [ROOMS_DAT_PATH, ROOMS_PATH, ROOMS_LOG_PATH, ROOM_LOG.old_path]
+    else:
+        paths = [pathlib.Path(ROOM_STORE_PATH), pathlib.Path(ROOM_STORE_PATH + "-wal")]
+    return sum(p.stat().st_size for p in paths if p.exists())
+
+METRICS.gauge("meetpoint_rooms", "Live rooms", lambda: STORE.info()["rooms"])
+METRICS.gauge("meetpoint_persisted_state_bytes", "Room state on disk (snapshot + log, or SQLite file + WAL)", _persisted_bytes)
+METRICS.gauge("meetpoint_rooms_resident", "Rooms held in memory (the rest are read from rooms.dat on first access)",
+              lambda: ROOMS.info()["resident"])
+METRICS.gauge("meetpoint_venues", "Interned venue records", lambda: STORE.info()["venues"]["venues"])
+METRICS.gauge("meetpoint_jobs_inflight", "Async jobs queued or running", lambda: len(_JOBS_INFLIGHT))
+METRICS.gauge("meetpoint_cache_items", "In-memory cache entries",
+              lambda: {(("cache", c.ns),): c.info()["size"] for c in (KAKAO_CACHE, ENRICH_CACHE, TT_CACHE)})
+METRICS.gauge("meetpoint_upstream_circuit_open", "1 while the upstream circuit breaker is open",
+              lambda: {(("upstream", name),): int(gd.breaker.is_open()) for name, gd in GUARDS.items()})
+
+@app.before_request
+def _metrics_begin():
+    g.t0 = time.perf_counter()
+    _TIMINGS.set([])
+
+@app.after_request
+def _metrics_end(resp):
+    if not request.path.startswith("/api/"):
+        return resp
+    el = time.perf_counter() - g.get("t0", time.perf_counter())
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    METRICS.inc("meetpoint_http_requests_total", route=route, method=request.method, status=str(resp.status_code))
+    METRICS.observe("meetpoint_http_request_seconds", el, route=route)
+    if SERVER_TIMING or request.args.get("timing") in ("1", "true"):
+        resp.headers["Server-Timing"] = _server_timing(_TIMINGS.get() or [], el)
+    return resp
+
+def _server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    # 같은 단계는 합쳐서(병렬로 돈 작업은 합이 벽시계보다 클 수 있음) 처음 나온 순서대로, 마지막에 total
+    agg: Dict[str, List[float]] = {}
+    for stage, el in timings:
+        a = agg.setdefault(stage, [0.0, 0])
+        a[0] += el; a[1] += 1
+    parts = [f'{stage};dur={a[0] * 1000:.1f};desc="x{a[1]}"' for stage, a in agg.items()]
+    return ", ".join(parts + [f"total;dur={total * 1000:.1f}"])
+
+@app.route("/api/metrics")
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/api/config")
 def config():
     return jsonify({"kakao_js_key": KAKAO_JS_KEY, "google_key_present": bool(GOOGLE_API_KEY)})
@@ -307,49 +2796,39 @@ def room_create():
     purpose = (body.get("purpose") or "").strip()
     meeting_time = (body.get("meetingTime") or "").strip()
 
-    code = _gen_code()
-    while code in ROOMS: code = _gen_code()
     expires_at = _now_ms() + ttl*60*1000
     host_secret = "HS_" + _gen_code(8)
+    meta = {"purpose": purpose, "meetingTime": meeting_time}
 
-    ROOMS[code] = {
-        "code": code,
+    code = STORE.create({
+        "code": None,
         "created_at": _now_ms(),
         "expires_at": expires_at,
-        "meta": {"purpose": purpose, "meetingTime": meeting_time},
+        "meta": meta,
         "participants": {},
         "ver": 0,
         "results": None,
         "host_secret": host_secret,
         "eta": None,
-    }
-    _cleanup_and_save()
+        "job": None,
+        "ttl_ms": ttl*60*1000,
+    })
 
     join_url = request.host_url.rstrip("/") + "/?code=" + code
     log.info("room created code=%s join=%s", code, join_url)
     return jsonify({"ok": True, "code": code, "expiresAt": expires_at,
-                    "meta": ROOMS[code]["meta"], "joinUrl": join_url, "hostSecret": host_secret})
+                    "meta": meta, "joinUrl": join_url, "hostSecret": host_secret})
+
+@app.errorhandler(RoomError)
+def _room_error(e: RoomError):
+    return jsonify({"ok": False, "error": e.error}), e.status
 
 @app.route("/api/room/join", methods=["POST"])
 def room_join():
     body = request.get_json(silent=True) or {}
     code = (body.get("code") or "").upper()
     nickname = (body.get("nickname") or "익명").strip()
-    pid = body.get("pid")
-
-    if code not in ROOMS:
-        return jsonify({"ok": False, "error": "room_not_found"}), 404
-
-    if pid and pid in ROOMS[code]["participants"]:
-        ROOMS[code]["participants"][pid]["nickname"] = nickname
-        ROOMS[code]["ver"] += 1
-        _cleanup_and_save()
-        return jsonify({"ok": True, "pid": pid})
-
-    pid = _gen_pid()
-    ROOMS[code]["participants"][pid] = {"pid": pid, "nickname": nickname, "mode": "car", "lat": None, "lng": None, "updated_at": 0}
-    ROOMS[code]["ver"] += 1
-    _cleanup_and_save()
+    pid = STORE.join(code, nickname, body.get("pid"))
     return jsonify({"ok": True, "pid": pid})
 
 @app.route("/api/room/update", methods=["POST"])
@@ -357,64 +2836,285 @@ def room_update():
     body = request.get_json(silent=True) or {}
     code = (body.get("code") or "").upper()
     pid = body.get("pid")
-    if code not in ROOMS:
-        return jsonify({"ok": False, "error": "room_not_found"}), 404
-    p = ROOMS[code]["participants"].get(pid)
-    if not p:
-        return jsonify({"ok": False, "error": "participant_not_found"}), 404
     try:
-        if body.get("lat") is not None: p["lat"] = float(body.get("lat"))
-        if body.get("lng") is not None: p["lng"] = float(body.get("lng"))
+        lat = float(body["lat"]) if body.get("lat") is not None else None
+        lng = float(body["lng"]) if body.get("lng") is not None else None
     except Exception:
+        lat = lng = math.nan
+    if (lat is not None and math.isnan(lat)) or (lng is not None and math.isnan(lng)):
         return jsonify({"ok": False, "error": "bad_latlng"}), 400
-    mode = body.get("mode")
-    if mode in ("car","bus","subway","walk"): p["mode"] = mode
-    p["updated_at"] = _now_ms()
-    ROOMS[code]["ver"] += 1
-    _cleanup_and_save()
+    STORE.update(code, pid, lat, lng, body.get("mode"))
     return jsonify({"ok": True})
 
 @app.route("/api/room/leave", methods=["POST"])
 def room_leave():
     body = request.get_json(silent=True) or {}
     code = (body.get("code") or "").upper()
-    pid = body.get("pid")
-    if code not in ROOMS:
-        return jsonify({"ok": False, "error": "room_not_found"}), 404
-    ROOMS[code]["participants"].pop(pid, None)
-    ROOMS[code]["ver"] += 1
-    _cleanup_and_save()
+    STORE.leave(code, body.get("pid"))
     return jsonify({"ok": True})
 
 @app.route("/api/room/close", methods=["POST"])
 def room_close():
     body = request.get_json(silent=True) or {}
     code = (body.get("code") or "").upper()
-    host_secret = (body.get("hostSecret") or "").strip()
-    if code not in ROOMS:
-        return jsonify({"ok": False, "error": "room_not_found"}), 404
-    if host_secret != ROOMS[code].get("host_secret"):
-        return jsonify({"ok": False, "error": "host_secret_mismatch"}), 403
-    ROOMS.pop(code, None)
-    _cleanup_and_save()
+    STORE.close(code, (body.get("hostSecret") or "").strip())
+    _drop_room_solve(code)
     return jsonify({"ok": True})
 
+def _state_etag(code: str, ver: int, lite: bool, full: bool = False) -> str:
+    return f'"{code}-{ver}-{"d" if lite else "m" if full else "f"}"'
+
 @app.route("/api/room/state")
 def room_state():
     code = (request.args.get("code") or "").upper()
-    if code not in ROOMS:
+    if STORE.ver(code) is None:
         return jsonify({"ok": False, "error": "room_not_found"}), 404
-    room = ROOMS[code]
-    plist = list(room["participants"].values())
-    pts = [{"lat":p["lat"],"lng":p["lng"],"mode":p["mode"]} for p in plist if isinstance(p.get("lat"),(int,float)) and isinstance(p.get("lng"),(int,float))]
-    centroid = time_weighted_centroid(pts) if pts else None
-    return jsonify({
-        "ok": True, "code": code, "meta": room["meta"],
-        "participants": plist, "centroid": centroid,
-        "ver": room["ver"], "results": room["results"], "eta": room.get("eta")
-    })
+    # delta=1: 큰 값은 해시로, since가 있으면 그 이후 변경분만
+    # full=1: results의 vid에 장소 레코드를 붙여 줌(기본은 vid와 방별 값만)
+    lite = request.args.get("delta") in ("1", "true")
+    full = not lite and request.args.get("full") in ("1", "true")
+    # since=<ver>: ver가 바뀔 때까지(최대 wait초) 응답을 보류하는 long-poll
+    since = request.args.get("since", type=int)
+    if since is not None and STORE.ver(code) == since:
+        wait = min(max(request.args.get("wait", default=LONGPOLL_MAX_S, type=float), 0.0), LONGPOLL_MAX_S)
+        if not STORE.wait(code, since, wait) and not request.if_none_match:
+            return jsonify({"ok": True, "code": code, "ver": since, "unchanged": True})
+    ver = STORE.ver(code)
+    if ver is None:
+        return jsonify({"ok": False, "error": "room_not_found"}), 404
+    etag = _state_etag(code, ver, lite, full)
+    if request.if_none_match and request.if_none_match.contains_weak(etag.strip('"')):
+        resp = make_response("", 304)
+        resp.headers["ETag"] = etag
+        return resp
+    payload = (STORE.delta(code, since) if lite and since is not None else None) or STORE.state(code, lite)
+    if payload is None:
+        return jsonify({"ok": False, "error": "room_not_found"}), 404
+    if full and payload.get("results"):
+        payload = {**payload, "results": _materialize_results(payload["results"], STORE.venues(_venue_ids(payload["results"])))}
+    resp = make_response(jsonify(payload))
+    resp.headers["ETag"] = _state_etag(code, payload["ver"], lite, full)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+@app.route("/api/room/blob")
+def room_blob():
+    # 내용 해시로 주소가 정해지는 값이라 해시가 맞으면 오래 캐시해도 됨
+    code = (request.args.get("code") or "").upper()
+    name = request.args.get("name") or ""
+    want = request.args.get("hash") or ""
+    if name not in ROOM_BLOBS:
+        return jsonify({"ok": False, "error": "blob_not_found"}), 404
+    value, cur = STORE.blob(code, name) or (None, None)
+    if cur is None or cur != want:
+        return jsonify({"ok": False, "error": "blob_not_found", "hash": cur}), 404
+    etag = f'"{cur}"'
+    if request.if_none_match and request.if_none_match.contains_weak(cur):
+        resp = make_response("", 304)
+    else:
+        if name == "results":
+            # vid가 내용 해시를 담고 있어 붙인 레코드까지 blob 해시 하나로 정해짐
+            value = _materialize_results(value, STORE.venues(_venue_ids(value)))
+        resp = make_response(jsonify(value))
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "private, max-age=86400, immutable"
+    return resp
+
+@app.route("/api/room/events")
+def room_events():
+    # SSE: ver가 바뀔 때마다 event: state 로 상태 전송, 방이 사라지면 event: closed
+    # delta=1이면 첫 이벤트는 lite 스냅샷, 이후는 변경분
+    code = (request.args.get("code") or "").upper()
+    if STORE.ver(code) is None:
+        return jsonify({"ok": False, "error": "room_not_found"}), 404
+    lite = request.args.get("delta") in ("1", "true")
+    last = request.headers.get("Last-Event-ID", type=int)
+    if last is None:
+        last = request.args.get("since", type=int)
+
+    def _gen(since):
+        yield "retry: 3000\n\n"
+        while True:
+            if since is not None and not STORE.wait(code, since, SSE_KEEPALIVE_S):
+                yield ": keepalive\n\n"
+                continue
+            payload = None
+            if lite and since is not None:
+                payload = STORE.delta(code, since)
+            if payload is None:
+                payload = STORE.state(code, lite)
+            if payload is None:
+                yield "event: closed\ndata: {}\n\n"
+                return
+            since = payload["ver"]
+            yield f"id: {since}\nevent: state\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    resp = Response(stream_with_context(_gen(last)), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# ── 비동기 작업
+# async=true(본문) 또는 ?async=1이면 작업 id만 바로 돌려주고, 풀이는 별도 스레드 풀에서 실행 → 요청 스레드를 오래 잡지 않음
+# 진행 상황은 /api/job/<id>와 방 blob "job"으로 알리고, 결과는 동기 요청과 똑같이 방 eta/results에 저장
+# 같은 방·같은 요청(본문 + 참가자 상태)이 이미 진행 중이면 새로 만들지 않고 그 작업을 같이 씀
+JOB_WORKERS       = int(os.getenv("JOB_WORKERS") or 4)              # 동시에 도는 작업 수
+JOB_QUEUE_MAX     = int(os.getenv("JOB_QUEUE_MAX") or 64)           # 대기 + 실행 중 작업 상한(넘으면 429)
+JOB_DEADLINE_S    = float(os.getenv("JOB_DEADLINE_S") or 60)        # 작업 1건 전체 마감
+JOB_TTL_S         = float(os.getenv("JOB_TTL_S") or 600)            # 끝난 작업을 조회용으로 들고 있는 시간
+JOB_PUBLISH_MIN_S = float(os.getenv("JOB_PUBLISH_MIN_S") or 0.5)    # 방으로 진행 상황을 보내는 최소 간격
+
+_JOB_POOL = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+class Job:
+    # state: queued → running → done | error. result/status는 동기 응답과 같은 (본문, HTTP 상태)
+    def __init__(self, kind: str, room: str, key: str):
+        self.id = "J" + "".join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+        self.kind, self.room, self.key = kind, room, key
+        self.state = "queued"
+        self.stage: str | None = None
+        self.progress: Dict = {}
+        self.result: Dict | None = None
+        self.status = 202
+        self.shared = 1   # 이 작업을 받아 간 요청 수(중복 제출 포함)
+        self.created = _now_ms()
+        self.finished: int | None = None
+        self._published = 0.0
+
+    def view(self, with_result: bool = False) -> Dict:
+        # _JOBS_LOCK 안에서 호출(작업 스레드가 진행/결과를 바꾸는 중에 반쯤 바뀐 레코드를 내보내지 않게)
+        out = {"id": self.id, "kind": self.kind, "room": self.room or None, "state": self.state,
+               "stage": self.stage, "progress": dict(self.progress), "shared": self.shared,
+               "created": self.created, "finished": self.finished}
+        if with_result and self.result is not None:
+            out.update(result=self.result, status=self.status)
+        return out
+
+    def report(self, stage: str, **fields):
+        with _JOBS_LOCK:
+            self.stage = stage
+            self.progress.update(fields)
+        self.publish()
+
+    def publish(self, force: bool = False):
+        # 보고마다 방 ver가 오르지 않게 간격을 둠(상태 전환은 항상 보냄)
+        if not self.room:
+            return
+        now = time.monotonic()
+        if not force and now - self._published < JOB_PUBLISH_MIN_S:
+            return
+        self._published = now
+        with _JOBS_LOCK:
+            view = self.view()
+        try:
+            STORE.set_blob(self.room, "job", view)
+        except Exception as e:
+            log.warning("job %s progress publish failed: %s", self.id, e)
+
+_JOBS: "OrderedDict[str, Job]" = OrderedDict()
+_JOBS_INFLIGHT: Dict[str, Job] = {}
+_JOBS_LOCK = threading.Lock()
+JOB_STATS = {"submitted": 0, "deduped": 0, "rejected": 0, "done": 0, "failed": 0}
+
+def _job_key(kind: str, body: Dict, snap: Dict | None) -> str:
+    # 방이면 참가자/메타까지 키에 넣음 → 그 사이 누가 움직였으면 새 작업
+    base = {"kind": kind, "body": {k: v for k, v in body.items() if k != "async"}}
+    if snap is not None:
+        base["room"] = {"meta": snap["meta"], "participants": snap["participants"]}
+    return hashlib.sha1(json.dumps(base, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _sweep_jobs():
+    # _JOBS_LOCK 안에서 호출
+    cutoff = _now_ms() - JOB_TTL_S * 1000
+    for jid in [jid for jid, j in _JOBS.items() if j.finished is not None and j.finished < cutoff]:
+        del _JOBS[jid]
+
+def _run_job(job: Job, fn: Callable, body: Dict):
+    with _JOBS_LOCK:
+        job.state = "running"
+    job.publish(force=True)
+    token = _PROGRESS.set(job)
+    try:
+        with _deadline(JOB_DEADLINE_S):
+            result, status = fn(body)
+    except Exception as e:
+        log.exception("job %s (%s) failed: %s", job.id, job.kind, e)
+        result, status = {"ok": False, "error": "job_failed"}, 500
+    finally:
+        _PROGRESS.reset(token)
+    with _JOBS_LOCK:
+        job.result, job.status = result, status
+        job.state = "done" if status < 400 else "error"
+        job.finished = _now_ms()
+        if _JOBS_INFLIGHT.get(job.key) is job:
+            del _JOBS_INFLIGHT[job.key]
+        JOB_STATS["done" if status < 400 else "failed"] += 1
+    job.publish(force=True)
+    log.info("job %s %s room=%s state=%s shared=%d took_ms=%d", job.id, job.kind, job.room or "-",
+             job.state, job.shared, job.finished - job.created)
+
+def _submit_job(kind: str, fn: Callable, body: Dict) -> Tuple[Job | None, bool]:
+    # 반환: (작업, 진행 중인 작업을 같이 쓰게 됐는지). 자리가 없으면 (None, False)
+    room = (body.get("roomCode") or "").upper()
+    snap = STORE.snapshot(room) if room else None
+    key = _job_key(kind, body, snap)
+    with _JOBS_LOCK:
+        _sweep_jobs()
+        job = _JOBS_INFLIGHT.get(key)
+        if job is not None:
+            job.shared += 1
+            JOB_STATS["deduped"] += 1
+            return job, True
+        if len(_JOBS_INFLIGHT) >= JOB_QUEUE_MAX:
+            JOB_STATS["rejected"] += 1
+            return None, False
+        job = Job(kind, room if snap is not None else "", key)
+        _JOBS[job.id] = job
+        _JOBS_INFLIGHT[key] = job
+        JOB_STATS["submitted"] += 1
+    job.publish(force=True)
+    _JOB_POOL.submit(_run_job, job, fn, body)
+    return job, False
+
+def _jobs_info() -> Dict:
+    with _JOBS_LOCK:
+        return {"workers": JOB_WORKERS, "queue_max": JOB_QUEUE_MAX, "inflight": len(_JOBS_INFLIGHT),
+                "tracked": len(_JOBS), **JOB_STATS}
+
+def _job_or_run(kind: str, fn: Callable):
+    # fn(body) -> (응답 본문, HTTP 상태). 동기면 요청 마감 안에서 바로 실행
+    body = request.get_json(silent=True) or {}
+    if body.get("async") is True or request.args.get("async") in ("1", "true"):
+        job, shared = _submit_job(kind, fn, body)
+        if job is None:
+            resp = make_response(jsonify({"ok": False, "error": "busy"}), 429)
+            resp.headers["Retry-After"] = "2"
+            return resp
+        with _JOBS_LOCK:
+            view = job.view()
+        return jsonify({"ok": True, "job": view, "deduped": shared, "poll": f"/api/job/{job.id}"}), 202
+    with _deadline():
+        out, status = fn(body)
+    return jsonify(out), status
+
+@app.route("/api/job/<job_id>")
+def job_status(job_id):
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        view = None if job is None else job.view(with_result=True)
+    if view is None:
+        return jsonify({"ok": False, "error": "job_not_found"}), 404
+    return jsonify({"ok": True, "job": view})
 
 # ── ETA-midpoint
+# _group_modes 키 → (Distance Matrix mode, transit_mode)
+DM_GROUP_MODES = {
+    "driving": ("driving", None),
+    "walking": ("walking", None),
+    "transit_bus": ("transit", "bus"),
+    "transit_subway": ("transit", "subway"),
+}
+
 def _group_modes(participants: List[Dict]):
     g = {"driving": [], "walking": [], "transit_bus": [], "transit_subway": []}
     for idx, p in enumerate(participants):
@@ -434,63 +3134,482 @@ def _group_modes(participants: List[Dict]):
             g["driving"].append((idx, lat, lng))
     return g
 
-def _etas_for_destination(participants: List[Dict], dest_lat: float, dest_lng: float, depart_unix: int) -> List[int | None]:
-    if GOOGLE_API_KEY:
-        groups = _group_modes(participants)
-        etas: List[int | None] = [None] * len(participants)
-
-        def fill(indices_with_coords, mode, transit_mode=None):
-            if not indices_with_coords: return
-            origins = [(lat,lng) for (_,lat,lng) in indices_with_coords]
-            mins = google_distance_matrix(origins, (dest_lat,dest_lng), mode, transit_mode, depart_unix)
-            for (i, _lat, _lng), m in zip(indices_with_coords, mins):
-                etas[i] = m
-
-        fill(groups["driving"], "driving", None)
-        fill(groups["walking"], "walking", None)
-        fill(groups["transit_bus"], "transit", "bus")
-        fill(groups["transit_subway"], "transit", "subway")
-
-        # 누락값은 속도기반 보정
-        speeds = {"car":40.0, "subway":35.0, "bus":20.0, "walk":5.0}
-        for i, e in enumerate(etas):
-            if e is None:
-                p = participants[i]
-                d_km = haversine_km(p["lat"], p["lng"], dest_lat, dest_lng)
-                v = speeds.get(p.get("mode","car"), 40.0)
-                etas[i] = int(round((d_km / max(v,1e-9)) * 60))
-        return etas
-
-    # Google 키 없으면 속도기반
-    speeds = {"car":40.0, "subway":35.0, "bus":20.0, "walk":5.0}
+# 이동시간 캐시: (출발 셀, 도착 셀, mode, transit_mode, 요일+시간 버킷) → 분
+TT_CACHE_MAX  = int(os.getenv("TT_CACHE_MAX") or 200000)
+TT_CELL_M     = float(os.getenv("TT_CELL_M") or 100)       # 좌표 양자화 셀 크기(m)
+TT_BUCKET_MIN = int(os.getenv("TT_BUCKET_MIN") or 15)      # 출발시각 버킷(분)
+TT_TTL_S = {
+    "driving": int(os.getenv("TT_TTL_DRIVING_S") or 6*3600),
+    "transit": int(os.getenv("TT_TTL_TRANSIT_S") or 24*3600),
+    "walking": int(os.getenv("TT_TTL_WALKING_S") or 7*24*3600),
+}
+TT_CACHE = TTLCache("tt", TT_CACHE_MAX, persist=(os.getenv("TT_CACHE_PERSIST", "1") != "0"))
+
+def _geo_cell(lat: float, lng: float) -> str:
+    step_lat = TT_CELL_M / 111320.0
+    iy = round(lat / step_lat)
+    step_lng = step_lat / max(math.cos(math.radians(iy * step_lat)), 1e-6)
+    return f"{iy}:{round(lng / step_lng)}"
+
+def _depart_bucket(depart_unix: int) -> str:
+    # depart_unix는 모임시각(로컬)을 UTC로 간주해 만든 값 → 같은 요일/시간대끼리 묶임
+    dt = datetime.fromtimestamp(depart_unix, tz=timezone.utc)
+    return f"{dt.weekday()}:{(dt.hour * 60 + dt.minute) // TT_BUCKET_MIN}"
+
+def _tt_key(ocell: str, dcell: str, mode: str, transit_mode: str | None, bucket: str) -> str:
+    return f"{ocell}|{dcell}|{mode}|{transit_mode or '-'}|{bucket}"
+
+def _speed_eta_min(p: Dict, dest_lat: float, dest_lng: float) -> int:
+    d_km = haversine_km(p["lat"], p["lng"], dest_lat, dest_lng)
+    v = SPEEDS_KMH.get(p.get("mode","car"), 40.0)
+    return int(round((d_km / max(v,1e-9)) * 60))
+
+def _speed_eta_block(participants: List[Dict], cands: List[Tuple[float,float]]):
+    # 참가자 × 후보 속도기반 ETA(분). numpy면 거리·속도 행렬을 한 번에 계산해 ndarray로 돌려줌
+    # subway 참가자 행은 지하철 모델 값으로 덮어씀(역도 멀고 걷기에도 먼 칸만 평균 속도로 남음)
+    if _np is None or not participants or not cands:
+        out = [[_speed_eta_min(p, clat, clng) for (clat, clng) in cands] for p in participants]
+    else:
+        P = _np.radians(_np.array([(p["lat"], p["lng"]) for p in participants], dtype=float))
+        C = _np.radians(_np.array(cands, dtype=float))
+        plat, plng = P[:, 0:1], P[:, 1:2]
+        a = (_np.sin((C[:, 0] - plat) / 2) ** 2
+             + _np.cos(plat) * _np.cos(C[:, 0]) * _np.sin((C[:, 1] - plng) / 2) ** 2)
+        km = 2 * _np.arctan2(_np.sqrt(a), _np.sqrt(1 - a)) * (R_EARTH / 1000.0)
+        v = _np.array([max(SPEEDS_KMH.get(p.get("mode","car"), 40.0), 1e-9) for p in participants])
+        out = _np.rint(km / v[:, None] * 60).astype(_np.int64)
+    subway = [i for i, p in enumerate(participants) if p.get("mode") == "subway"]
+    if subway and cands and SUBWAY.ready:
+        rows = SUBWAY.eta_rows([(participants[i]["lat"], participants[i]["lng"]) for i in subway], cands)
+        for i, row in zip(subway, rows):
+            for j, m in enumerate(row):
+                if m is not None:
+                    out[i][j] = m
+    return out
+
+def _eta_matrix_steps(participants: List[Dict], cands: List[Tuple[float,float]], depart_unix: int,
+                      stats: Dict | None = None):
+    # 참가자 × 후보 ETA(분) 행렬. 모드 그룹마다 후보 전체를 한꺼번에 요청
+    # 키가 없으면 속도기반 행렬(numpy면 ndarray)을 그대로 돌려줌
+    if not (GOOGLE_API_KEY and cands):
+        return _speed_eta_block(participants, cands)
+    if not GUARDS["google"].available():
+        # 브레이커가 열려 있으면 호출 없이 바로 속도기반
+        _stat_add(stats, partial=1, degraded=1)
+        return _speed_eta_block(participants, cands)
+    etas: List[List[int | None]] = [[None] * len(cands) for _ in participants]
+    # 캐시를 먼저 보고, miss 난 (참가자, 후보)만 모아 모든 모드 그룹을 한 번에 병렬 요청
+    groups = _group_modes(participants)
+    bucket = _depart_bucket(depart_unix)
+    dcells = [_geo_cell(clat, clng) for (clat, clng) in cands]
+    tasks, owners = [], []
+    hits = 0
+    for key, (mode, transit_mode) in DM_GROUP_MODES.items():
+        if key == "transit_subway" and SUBWAY_ETA == "local" and SUBWAY.ready:
+            # 지하철은 로컬 모델로: 호출 없이 아래 누락값 보정(_speed_eta_block)에서 채워짐
+            _stat_add(stats, subway_local=len(groups[key]) * len(cands))
+            continue
+        # 누락 후보 집합이 같은 참가자끼리 한 블록으로 묶음
+        by_missing: Dict[tuple, list] = {}
+        for (i, lat, lng) in groups[key]:
+            ocell = _geo_cell(lat, lng)
+            missing = []
+            for j, dcell in enumerate(dcells):
+                m = TT_CACHE.get(_tt_key(ocell, dcell, mode, transit_mode, bucket))
+                if m is _MISS:
+                    missing.append(j)
+                else:
+                    etas[i][j] = m; hits += 1
+            if missing:
+                by_missing.setdefault(tuple(missing), []).append((i, lat, lng, ocell))
+        if len(by_missing) > 1:
+            # 누락 집합이 제각각이면 합집합 한 블록이 요청 수가 더 적을 수 있음
+            def _n_req(n_o, n_d):
+                oc, dc = _dm_plan(n_o, n_d)
+                return math.ceil(n_o / oc) * math.ceil(n_d / dc)
+            exact = sum(_n_req(len(ms), len(mi)) for mi, ms in by_missing.items())
+            union = tuple(sorted(set().union(*by_missing)))
+            members_all = [m for ms in by_missing.values() for m in ms]
+            if _n_req(len(members_all), len(union)) < exact:
+                by_missing = {union: members_all}
+        for missing, members in by_missing.items():
+            origins = [(lat,lng) for (_,lat,lng,_) in members]
+            dests = [cands[j] for j in missing]
+            for t in _dm_tasks(origins, dests, mode, transit_mode, depart_unix, stats):
+                tasks.append(_spanned(f"dm_{key}", t)); owners.append((members, missing, mode, transit_mode))
+    _stat_add(stats, cache_hits=hits)
+    results, partial = yield _Calls(tasks)
+    if partial or any(r is None for r in results):
+        _stat_add(stats, partial=1)
+    fresh: Dict[str, list] = {}
+    for (members, missing, mode, transit_mode), cells in zip(owners, results):
+        for oi, dj, m in cells or []:
+            i, _lat, _lng, ocell = members[oi]
+            j = missing[dj]
+            etas[i][j] = m
+            fresh.setdefault(mode, []).append((_tt_key(ocell, dcells[j], mode, transit_mode, bucket), m))
+    for mode, items in fresh.items():
+        TT_CACHE.put_many(items, TT_TTL_S.get(mode, TT_TTL_S["driving"]))
+
+    # 누락값은 속도기반 보정
+    if any(None in row for row in etas):
+        fallback = _speed_eta_block(participants, cands)
+        for row, fb in zip(etas, fallback):
+            for j, m in enumerate(row):
+                if m is None:
+                    row[j] = int(fb[j])
+    return etas
+
+def _rank_candidates(cands: List[Tuple[float,float]], etas, top_n: int) -> List[Dict]:
+    # (max, sum) 오름차순 상위 top_n만 dict로 만듦(avg = sum/n이라 순서에 영향 없음). 정렬은 안정적이라 동점은 후보 순서대로
+    n = max(len(etas), 1)
+    if _np is not None and len(cands):
+        E = _np.asarray(etas, dtype=_np.int64).reshape(len(etas), len(cands))
+        mx, sm = E.max(axis=0), E.sum(axis=0)
+        order = _np.lexsort((sm, mx))[:top_n].tolist()
+        cols = [E[:, j].tolist() for j in order]
+    else:
+        cols_all = list(zip(*etas))
+        mx = [max(c) for c in cols_all]
+        sm = [sum(c) for c in cols_all]
+        order = heapq.nsmallest(top_n, range(len(cands)), key=lambda j: (mx[j], sm[j]))
+        cols = [list(cols_all[j]) for j in order]
     out = []
-    for p in participants:
-        d_km = haversine_km(p["lat"], p["lng"], dest_lat, dest_lng)
-        v = speeds.get(p.get("mode","car"), 40.0)
-        out.append(int(round((d_km / max(v,1e-9)) * 60)))
+    for j, col in zip(order, cols):
+        total = int(sm[j])
+        out.append({"lat":cands[j][0], "lng":cands[j][1], "etas":col, "sum":total, "max":int(mx[j]), "avg":total / n})
     return out
 
+# 후보 밀도: 1단계는 반경 안 링 × 링당 점, 2단계는 상위 후보 주변 링 × 링당 점
+# Google 키 없이 속도기반으로만 풀 때는 평가가 싸므로 링/점 수에 ETA_LOCAL_DENSITY를 곱함
+ETA_RINGS           = int(os.getenv("ETA_RINGS") or 3)
+ETA_PER_RING        = int(os.getenv("ETA_PER_RING") or 16)
+ETA_REFINE_RINGS    = int(os.getenv("ETA_REFINE_RINGS") or 2)
+ETA_REFINE_PER_RING = int(os.getenv("ETA_REFINE_PER_RING") or 12)
+ETA_LOCAL_DENSITY   = int(os.getenv("ETA_LOCAL_DENSITY") or 2)
+
+def _candidate_density(remote: bool | None = None) -> Tuple[int, int, int, int]:
+    if remote is None:
+        remote = bool(GOOGLE_API_KEY)
+    k = 1 if remote else max(1, ETA_LOCAL_DENSITY)
+    return ETA_RINGS * k, ETA_PER_RING * k, ETA_REFINE_RINGS * k, ETA_REFINE_PER_RING * k
+
+def _offset_latlng(lat: float, lng: float, d_m: float, bearing_deg: float) -> Tuple[float,float]:
+    d = d_m / R_EARTH
+    br = math.radians(bearing_deg)
+    lat1 = math.radians(lat); lng1 = math.radians(lng)
+    lat2 = math.asin(math.sin(lat1)*math.cos(d) + math.cos(lat1)*math.sin(d)*math.cos(br))
+    lng2 = lng1 + math.atan2(math.sin(br)*math.sin(d)*math.cos(lat1), math.cos(d)-math.sin(lat1)*math.sin(lat2))
+    return (math.degrees(lat2), math.degrees(lng2))
+
 def _gen_candidates(center_lat: float, center_lng: float, radius_m: int, rings=3, per_ring=16) -> List[Tuple[float,float]]:
     out = [(center_lat, center_lng)]
     if radius_m <= 0:
         return out
-    def offset_latlng(lat, lng, d_m, bearing_deg):
-        d = d_m / R_EARTH
-        br = math.radians(bearing_deg)
-        lat1 = math.radians(lat); lng1 = math.radians(lng)
-        lat2 = math.asin(math.sin(lat1)*math.cos(d) + math.cos(lat1)*math.sin(d)*math.cos(br))
-        lng2 = lng1 + math.atan2(math.sin(br)*math.sin(d)*math.cos(lat1), math.cos(d)-math.sin(lat1)*math.sin(lat2))
-        return (math.degrees(lat2), math.degrees(lng2))
     for r in range(1, rings+1):
         dist = radius_m * (r / rings)
         for k in range(per_ring):
             brg = (360.0 * k) / per_ring
-            out.append(offset_latlng(center_lat, center_lng, dist, brg))
+            out.append(_offset_latlng(center_lat, center_lng, dist, brg))
     return out
 
+# ── ETA 탐색 전략
+# 목적함수: 후보 지점의 (최대 ETA, ETA 합) 사전식 최소화. 평가 1회 = 후보 1곳 × 참가자 전원의 ETA
+ETA_SEARCH           = (os.getenv("ETA_SEARCH") or "grid").strip().lower()   # 기본 전략
+ETA_EVAL_BUDGET      = int(os.getenv("ETA_EVAL_BUDGET") or 0)                 # 0이면 전략별 기본 예산
+ETA_PATTERN_MIN_STEP_M = float(os.getenv("ETA_PATTERN_MIN_STEP_M") or 50)     # pattern: 이보다 보폭이 작아지면 종료
+ETA_SURROGATE_BATCH  = int(os.getenv("ETA_SURROGATE_BATCH") or 8)             # surrogate: 한 번에 실제 평가할 후보 수
+ETA_SNAP             = os.getenv("ETA_SNAP", "1") != "0"                      # 후보를 가까운 역/장소로 붙여서 평가
+ETA_SNAP_MAX_M       = float(os.getenv("ETA_SNAP_MAX_M") or 600)              # 이보다 먼 후보는 붙일 곳이 없는 것으로 봄
+ETA_PREFILTER        = int(os.getenv("ETA_PREFILTER") or 0)                   # >0: 업스트림 평가 전 로컬 추정(지하철 모델 포함)으로 배치마다 상위 N만 남김
+
+def _objective(s: Dict) -> Tuple[int, int]:
+    return (s["max"], s["sum"])
+
+class EtaObjective:
+    # 탐색 전략이 쓰는 평가기. 같은 점은 다시 평가하지 않고, budget(평가 후보 수)을 넘는 후보는 잘라냄
+    # eta_fn(participants, cands, depart_unix, stats) → 행렬을 바로 돌려주는 동기 함수(벤치마크에서 합성 제공자로 바꿔 끼움). 없으면 _eta_matrix_steps로 업스트림 평가
+    # evaluate와 탐색 전략은 단계 제너레이터(_run/_arun으로 실행)
+    # snap=True면 후보를 ETA_SNAP_MAX_M 안의 가장 가까운 역/장소로 옮겨 평가(같은 곳으로 모이면 한 번만)
+    # on_eval(new, etas)는 실제로 평가한 후보와 참가자 × 후보 ETA 전체를 받음(방별 증분 재계산용 기록)
+    # prefilter(기본 ETA_PREFILTER)>0이고 평가가 업스트림 호출이면, 배치마다 _speed_eta_block 추정 상위 prefilter개만 평가
+    def __init__(self, participants: List[Dict], depart_unix: int, stats: Dict | None = None,
+                 budget: int | None = None, eta_fn: Callable = None, snap: bool = False,
+                 on_eval: Callable | None = None, prefilter: int | None = None):
+        self.participants = participants
+        self.depart_unix = depart_unix
+        self.stats = stats
+        self.budget = budget
+        self.eta_fn = eta_fn
+        self.remote = bool(GOOGLE_API_KEY) if eta_fn is None else True   # 평가가 업스트림 호출인지(후보 밀도 결정)
+        self.evaluations = 0
+        self.batches: List[int] = []
+        self.best: Dict | None = None
+        self.snap = snap
+        self.snapped = 0   # 스냅으로 합쳐지거나 붙일 곳이 없어 빠진 후보 수
+        self.prefilter = ETA_PREFILTER if prefilter is None else prefilter
+        self.prefiltered = 0   # 로컬 추정으로 걸러져 평가하지 않은 후보 수
+        self._places: Dict[Tuple[float,float], Dict] = {}
+        self._seen: set = set()
+        self.on_eval = on_eval
+
+    def mark_seen(self, cands: List[Tuple[float,float]], places: Dict | None = None):
+        # 이미 다른 곳에서 평가한 후보는 다시 평가하지 않음(예산도 안 씀)
+        for c in cands:
+            self._seen.add((round(c[0], 6), round(c[1], 6)))
+        if places:
+            self._places.update(places)
+
+    def snap_points(self, cands: List[Tuple[float,float]]) -> List[Tuple[float,float]]:
+        # 붙일 곳이 없는 후보는 버림. 탐색 전체에서 하나도 못 붙였으면 호출 쪽이 snap=False로 다시 풂
+        if not self.snap:
+            return cands
+        out, seen = [], set()
+        for lat, lng in cands:
+            hit = _snap_point(lat, lng, ETA_SNAP_MAX_M)
+            if hit is None:
+                continue
+            k = (round(hit[0], 6), round(hit[1], 6))
+            if k in seen:
+                continue
+            seen.add(k)
+            self._places[k] = hit[2]
+            out.append((hit[0], hit[1]))
+        self.snapped += len(cands) - len(out)
+        return out
+
+    def left(self) -> int | None:
+        return None if self.budget is None else max(0, self.budget - self.evaluations)
+
+    def evaluate(self, cands: List[Tuple[float,float]], top_n: int | None = None) -> List[Dict]:
+        # 새로 평가한 후보 중 상위 top_n(기본 전부)을 목적함수 순으로. 한 번의 eta_fn 호출로 묶어 평가
+        new = []
+        with _span("candidates"):
+            for c in self.snap_points(cands):
+                k = (round(c[0], 6), round(c[1], 6))
+                if k not in self._seen:
+                    self._seen.add(k); new.append(c)
+            if self.remote and 0 < self.prefilter < len(new):
+                est = _speed_eta_block(self.participants, new)
+                keep = _rank_candidates(new, est, self.prefilter)
+                self.prefiltered += len(new) - len(keep)
+                new = [(s["lat"], s["lng"]) for s in keep]
+        if self.budget is not None:
+            new = new[:self.left()]
+        if not new:
+            return []
+        _progress("scoring", scored=self.evaluations, batch=len(new), budget=self.budget)
+        with _span("eta_fetch"):
+            if self.eta_fn is None:
+                etas = yield from _eta_matrix_steps(self.participants, new, self.depart_unix, self.stats)
+            else:
+                etas = self.eta_fn(self.participants, new, self.depart_unix, self.stats)
+        if self.on_eval is not None:
+            self.on_eval(new, etas)
+        self.evaluations += len(new)
+        self.batches.append(len(new))
+        _progress(f"batch {len(self.batches)} done", scored=self.evaluations, batch=len(new), budget=self.budget)
+        with _span("scoring"):
+            ranked = _rank_candidates(new, etas, top_n or len(new))
+        for s in ranked:
+            place = self._places.get((round(s["lat"], 6), round(s["lng"], 6)))
+            if place is not None:
+                s["place"] = place
+        if ranked and (self.best is None or _objective(ranked[0]) < _objective(self.best)):
+            self.best = ranked[0]
+        return ranked
+
+def _search_grid(obj: EtaObjective, seed: Dict, radius: int, top_n: int, two_stage: bool = True) -> Dict | None:
+    # 기준선: 반경 안 링 격자 → 상위 top_n 주변을 더 촘촘한 링으로 한 번 더
+    rings, per_ring, refine_rings, refine_per_ring = _candidate_density(obj.remote)
+    top = yield from obj.evaluate(_gen_candidates(seed["lat"], seed["lng"], radius_m=radius, rings=rings, per_ring=per_ring), top_n)
+    if two_stage and top:
+        cand2 = []
+        for t in top:
+            cand2.extend(_gen_candidates(t["lat"], t["lng"], radius_m=max(200, radius//4),
+                                         rings=refine_rings, per_ring=refine_per_ring))
+        yield from obj.evaluate(cand2, 1)
+    return obj.best
+
+def _search_pattern(obj: EtaObjective, seed: Dict, radius: int, top_n: int, two_stage: bool = True,
+                    step_m: float | None = None, directions: int = 8) -> Dict | None:
+    # 축소 패턴 탐색: 현재 최적점 주변 8방향을 한 묶음으로 평가 → 나아지면 그리로 이동, 아니면 보폭 절반
+    if obj.best is None:
+        # 스냅 중이면 시작점 근처에 붙일 곳이 없을 수 있으니 반경 안 거친 링에서 시작
+        start = [(seed["lat"], seed["lng"])]
+        if obj.snap:
+            start = _gen_candidates(seed["lat"], seed["lng"], radius_m=radius, rings=2, per_ring=8)
+        yield from obj.evaluate(start)
+    step = step_m or radius / 2
+    while obj.best is not None and step >= ETA_PATTERN_MIN_STEP_M and obj.left() != 0:
+        cur = obj.best
+        yield from obj.evaluate([_offset_latlng(cur["lat"], cur["lng"], step, 360.0 * k / directions) for k in range(directions)], 1)
+        if obj.best is cur:
+            step /= 2
+    return obj.best
+
+def _search_surrogate(obj: EtaObjective, seed: Dict, radius: int, top_n: int, two_stage: bool = True) -> Dict | None:
+    # 속도기반 ETA(호출 없음)를 대리 모델로 조밀한 격자를 순위 매기고, 유망한 후보만 실제로 평가
+    # 실제 평가가 쌓이면 참가자별로 실제 ≈ a + b × 속도기반 을 최소제곱으로 맞춰 대리 모델을 보정하고 반복
+    # 예산의 절반은 남겨 두었다가 최적점 주변을 격자 간격부터 패턴 탐색으로 다듬음
+    rings, per_ring, _, _ = _candidate_density(obj.remote)
+    rings, per_ring = rings * 2, per_ring * 2
+    grid = obj.snap_points(_gen_candidates(seed["lat"], seed["lng"], radius_m=radius, rings=rings, per_ring=per_ring))
+    base = [[float(x) for x in row] for row in _speed_eta_block(obj.participants, grid)]
+    n_p, n_g = len(base), len(grid)
+    fit = [(0.0, 1.0)] * n_p
+    real: Dict[int, List[int]] = {}
+    index = {(round(la, 6), round(ln, 6)): j for j, (la, ln) in enumerate(grid)}
+    refine_share = 0.5 if obj.budget is not None else 0.0
+    stop_at = None if obj.budget is None else obj.budget - int(obj.budget * refine_share)
+    while obj.left() != 0 and (stop_at is None or obj.evaluations < stop_at):
+        pred = []
+        for j in range(n_g):
+            if j in real: continue
+            col = [fit[i][0] + fit[i][1] * base[i][j] for i in range(n_p)]
+            pred.append((max(col), sum(col), j))
+        if not pred:
+            break
+        batch = ETA_SURROGATE_BATCH if stop_at is None else min(ETA_SURROGATE_BATCH, stop_at - obj.evaluations)
+        picks = [j for _m, _s, j in heapq.nsmallest(batch, pred)]
+        got = yield from obj.evaluate([grid[j] for j in picks])
+        for s in got:
+            j = index.get((round(s["lat"], 6), round(s["lng"], 6)))
+            if j is not None: real[j] = s["etas"]
+        for j in picks:
+            real.setdefault(j, None)   # 예산 초과/중복으로 못 본 점은 다시 고르지 않음
+        if not got:
+            break
+        pts = [(j, r) for j, r in real.items() if r is not None]
+        for i in range(n_p):
+            xs = [base[i][j] for j, _r in pts]; ys = [r[i] for _j, r in pts]
+            mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+            var = sum((x - mx) ** 2 for x in xs)
+            if var > 1e-9:
+                b = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var
+                fit[i] = (my - b * mx, b)
+            else:
+                fit[i] = (0.0, my / mx if mx > 1e-9 else 1.0)
+    if obj.best is not None and obj.left() != 0:
+        yield from _search_pattern(obj, seed, radius, top_n, step_m=radius / rings)
+    return obj.best
+
+# 이름 → (전략 함수, 기본 예산: None이면 무제한). 전략 함수는 단계 제너레이터이고 반환값이 최적점
+SEARCH_STRATEGIES: Dict[str, Tuple[Callable, int | None]] = {
+    "grid": (_search_grid, None),
+    "pattern": (_search_pattern, 64),
+    "surrogate": (_search_surrogate, 48),
+}
+
+# ── 방별 증분 재계산
+# 방마다 참가자 × 후보 ETA 행렬을 참가자 서명(pid, 좌표, 모드)별 행으로 들고 있음
+# 한 명이 움직이거나 들어오면 그 사람 행만 저장된 후보 전체에 대해 다시 구하고, 나간 사람 행은 버린 뒤 순위만 다시 매김
+ETA_SOLVE_CACHE_MAX   = int(os.getenv("ETA_SOLVE_CACHE_MAX") or 1000)    # 행렬을 들고 있을 방 수(LRU, 0이면 끔)
+ETA_RESOLVE_BUDGET    = int(os.getenv("ETA_RESOLVE_BUDGET") or 16)       # 재계산 후 최적점 주변을 다듬는 평가 수
+ETA_RESOLVE_MAX_CANDS = int(os.getenv("ETA_RESOLVE_MAX_CANDS") or 400)   # 방별 후보 수 상한(넘으면 하위 후보부터 버림)
+
+def _participant_sig(i: int, p: Dict) -> tuple:
+    return (p.get("pid") or i, round(p["lat"], 6), round(p["lng"], 6), p.get("mode","car"))
+
+class RoomSolve:
+    # key = (반경, 전략, 예산, 스냅, 2단계 여부, 출발 버킷, 업스트림 사용 여부). 키가 바뀌면 행렬을 버리고 처음부터 풂
+    # rows[sig][j] = 그 참가자의 cands[j]까지 ETA(분). 호출 쪽이 lock을 잡고 씀
+    def __init__(self, key: tuple):
+        self.key = key
+        self.ver: int | None = None
+        self.snap = False
+        self.cands: List[Tuple[float,float]] = []
+        self.places: Dict[Tuple[float,float], Dict] = {}
+        self.rows: Dict[tuple, List[int]] = {}
+        self.lock = threading.Lock()
+
+    def reset(self, sigs: List[tuple]):
+        self.cands, self.places = [], {}
+        self.rows = {s: [] for s in sigs}
+
+    def record(self, sigs: List[tuple], new: List[Tuple[float,float]], etas):
+        # 새로 평가한 후보 열을 덧붙임(etas는 sigs 순서의 참가자 × new)
+        self.cands.extend(new)
+        for s, row in zip(sigs, etas):
+            self.rows[s].extend(int(m) for m in row)
+
+    def sync(self, participants: List[Dict], sigs: List[tuple], depart_unix: int, stats: Dict | None = None):
+        # 사라진 서명의 행은 버리고, 새 서명의 행만 저장된 후보 전체에 대해 한 번에 계산(단계 제너레이터, 반환값은 행 수 집계)
+        keep = set(sigs)
+        dropped = [s for s in self.rows if s not in keep]
+        for s in dropped:
+            del self.rows[s]
+        missing = [i for i, s in enumerate(sigs) if s not in self.rows]
+        if missing:
+            etas = yield from _eta_matrix_steps([participants[i] for i in missing], self.cands, depart_unix, stats)
+            for i, row in zip(missing, etas):
+                self.rows[sigs[i]] = [int(m) for m in row]
+        return {"rows_reused": len(sigs) - len(missing), "rows_computed": len(missing), "rows_dropped": len(dropped)}
+
+    def matrix(self, sigs: List[tuple]) -> List[List[int]]:
+        return [self.rows[s] for s in sigs]
+
+    def trim(self, sigs: List[tuple], limit: int):
+        # 상한을 넘으면 현재 참가자 기준 (max, sum) 상위 후보만 남김
+        if limit <= 0 or len(self.cands) <= limit:
+            return
+        E = self.matrix(sigs)
+        order = heapq.nsmallest(limit, range(len(self.cands)),
+                                key=lambda j: (max(r[j] for r in E), sum(r[j] for r in E)))
+        keep = sorted(order)
+        self.cands = [self.cands[j] for j in keep]
+        self.rows = {s: [r[j] for j in keep] for s, r in zip(sigs, E)}
+        live = {(round(la, 6), round(ln, 6)) for la, ln in self.cands}
+        self.places = {k: v for k, v in self.places.items() if k in live}
+
+_ROOM_SOLVES: "OrderedDict[str, RoomSolve]" = OrderedDict()
+_ROOM_SOLVES_LOCK = threading.Lock()
+
+def _room_solve(code: str, key: tuple) -> RoomSolve:
+    # 같은 키로 풀어 둔 게 있으면 그걸, 아니면 빈 것으로 교체
+    with _ROOM_SOLVES_LOCK:
+        solve = _ROOM_SOLVES.get(code)
+        if solve is None or solve.key != key:
+            solve = _ROOM_SOLVES[code] = RoomSolve(key)
+        _ROOM_SOLVES.move_to_end(code)
+        while len(_ROOM_SOLVES) > ETA_SOLVE_CACHE_MAX:
+            _ROOM_SOLVES.popitem(last=False)
+        return solve
+
+def _drop_room_solve(code: str):
+    with _ROOM_SOLVES_LOCK:
+        _ROOM_SOLVES.pop(code, None)
+
+def _resolve_room(solve: RoomSolve, participants: List[Dict], sigs: List[tuple], depart_unix: int,
+                  stats: Dict | None, seed: Dict, radius: int):
+    # 반환값: (평가기, 최적점, 재계산 집계)
+    # 저장된 후보로 다시 순위를 매기고, 행이 바뀌었으면 새 시작점과 최적점 주변만 작은 예산으로 다듬음
+    n0 = len(solve.cands)
+    counts = yield from solve.sync(participants, sigs, depart_unix, stats)
+    best = _rank_candidates(solve.cands, solve.matrix(sigs), 1)[0]
+    place = solve.places.get((round(best["lat"], 6), round(best["lng"], 6)))
+    if place is not None:
+        best["place"] = place
+    obj = EtaObjective(participants, depart_unix, stats, budget=ETA_RESOLVE_BUDGET, snap=solve.snap,
+                       on_eval=lambda new, etas: solve.record(sigs, new, etas))
+    obj.mark_seen(solve.cands, solve.places)
+    obj.best = best
+    if counts["rows_computed"] or counts["rows_dropped"]:
+        # 시작점이 옮겨 갔을 수 있으니 새 시작점 둘레의 거친 링부터(이미 본 후보는 건너뜀)
+        yield from obj.evaluate(_gen_candidates(seed["lat"], seed["lng"], radius_m=radius, rings=2, per_ring=8))
+        yield from _search_pattern(obj, best, radius, 1, step_m=max(2 * ETA_PATTERN_MIN_STEP_M, radius / 4))
+    solve.places.update(obj._places)
+    return obj, obj.best, dict(counts, new_candidates=len(solve.cands) - n0)
+
 @app.route("/api/eta-centroid", methods=["POST"])
 def eta_centroid():
-    body = request.get_json(silent=True) or {}
+    return _job_or_run("eta", _eta_centroid)
+
+def _eta_centroid(body: Dict) -> Tuple[Dict, int]:
+    return _run(_eta_centroid_steps(body))
+
+def _eta_centroid_steps(body: Dict):
+    # 반환값: (응답 본문, HTTP 상태)
     room_code = (body.get("roomCode") or "").upper()
     radius = int(body.get("searchRadius") or 2000)
     topN = max(1, int(body.get("includeTopN") or 5))
@@ -498,10 +3617,14 @@ def eta_centroid():
 
     participants = []
     meta = {}
-    if room_code and room_code in ROOMS:
-        room = ROOMS[room_code]
-        meta = room.get("meta") or {}
-        for p in room["participants"].values():
+    in_room = False
+    room_ver = None
+    snap = (yield _Blocking(lambda: STORE.snapshot(room_code))) if room_code else None
+    if snap is not None:
+        in_room = True
+        meta = snap["meta"]
+        room_ver = snap.get("ver")
+        for p in snap["participants"]:
             try:
                 lat = float(p["lat"]); lng = float(p["lng"])
                 if not math.isfinite(lat) or not math.isfinite(lng): continue
@@ -509,7 +3632,7 @@ def eta_centroid():
                                      "pid":p.get("pid"), "nickname":p.get("nickname")})
             except Exception:
                 pass
-    else:
+    if not in_room:
         for p in body.get("participants") or []:
             try:
                 lat = float(p["lat"]); lng = float(p["lng"])
@@ -518,43 +3641,69 @@ def eta_centroid():
                 pass
 
     if not participants:
-        return jsonify({"ok": False, "error": "no_points"}), 400
+        return {"ok": False, "error": "no_points"}, 400
 
     seed = time_weighted_centroid(participants) or {"lat":participants[0]["lat"], "lng":participants[0]["lng"]}
     depart_dt = _parse_meeting_time(meta.get("meetingTime"))
     depart_unix = int(depart_dt.replace(tzinfo=timezone.utc).timestamp())
 
-    # 1단계: 거친 탐색
-    cand1 = _gen_candidates(seed["lat"], seed["lng"], radius_m=radius, rings=3, per_ring=16)
-    scores1 = []
-    for (clat, clng) in cand1:
-        etas = _etas_for_destination(participants, clat, clng, depart_unix)
-        total = sum(etas); mx = max(etas); avg = total / max(len(etas),1)
-        scores1.append({"lat":clat, "lng":clng, "etas":etas, "sum":total, "max":mx, "avg":avg})
-    scores1.sort(key=lambda x: (x["max"], x["sum"], x["avg"]))
-    top = scores1[:topN]
-
-    # 2단계: 상위 후보 주변 미세 탐색
-    cand2 = []
-    scores2 = []
-    if two_stage and top:
-        for t in top:
-            cand2.extend(_gen_candidates(t["lat"], t["lng"], radius_m=max(200, radius//4), rings=2, per_ring=12))
-        seen = set(); uniq = []
-        for a,b in cand2:
-            k = (round(a,6), round(b,6))
-            if k in seen: continue
-            seen.add(k); uniq.append((a,b))
-        cand2 = uniq
-        for (clat, clng) in cand2:
-            etas = _etas_for_destination(participants, clat, clng, depart_unix)
-            total = sum(etas); mx = max(etas); avg = total / max(len(etas),1)
-            scores2.append({"lat":clat, "lng":clng, "etas":etas, "sum":total, "max":mx, "avg":avg})
-        scores2.sort(key=lambda x: (x["max"], x["sum"], x["avg"]))
-        best = scores2[0] if scores2 else top[0]
-        stage2_count = len(cand2)
+    # 탐색 전략(기본 grid: 거친 링 격자 → 상위 후보 주변 미세 탐색)
+    strategy = (body.get("strategy") or ETA_SEARCH).strip().lower()
+    if strategy not in SEARCH_STRATEGIES:
+        return {"ok": False, "error": "unknown_strategy", "strategies": sorted(SEARCH_STRATEGIES)}, 400
+    search_fn, default_budget = SEARCH_STRATEGIES[strategy]
+    budget = int(body.get("evalBudget") or ETA_EVAL_BUDGET or 0) or default_budget
+    dm_stats = {"requests": 0, "elements": 0, "cache_hits": 0, "partial": 0}
+    snap = bool(body.get("snap") if body.get("snap") is not None else ETA_SNAP)
+
+    # 방이면 직전 풀이의 참가자 × 후보 행렬을 이어 씀(바뀐 참가자 행과 새 후보만 계산)
+    solve = None
+    if in_room and ETA_SOLVE_CACHE_MAX > 0 and body.get("incremental") is not False:
+        solve = _room_solve(room_code, (radius, strategy, budget, snap, two_stage, _depart_bucket(depart_unix), bool(GOOGLE_API_KEY)))
+    sigs = [_participant_sig(i, p) for i, p in enumerate(participants)]
+    incremental = None
+    _progress("solve", strategy=strategy, participants=len(participants), budget=budget)
+    if solve is not None:
+        yield _Acquire(solve.lock)
+    try:
+        with _span("search"):
+            if solve is not None and solve.cands:
+                base_ver = solve.ver
+                obj, best, incremental = yield from _resolve_room(solve, participants, sigs, depart_unix, dm_stats, seed, radius)
+                snap = solve.snap
+                incremental.update(base_ver=base_ver, ver=room_ver)
+            else:
+                on_eval = None
+                if solve is not None:
+                    solve.reset(sigs)
+                    on_eval = lambda new, etas: solve.record(sigs, new, etas)
+                obj = EtaObjective(participants, depart_unix, dm_stats, budget=budget, snap=snap, on_eval=on_eval)
+                best = yield from search_fn(obj, seed, radius, topN, two_stage)
+                if best is None and snap:
+                    # 반경 안에 역/장소가 하나도 없으면 격자점 그대로
+                    snap = False
+                    obj = EtaObjective(participants, depart_unix, dm_stats, budget=budget, on_eval=on_eval)
+                    best = yield from search_fn(obj, seed, radius, topN, two_stage)
+                if solve is not None:
+                    solve.snap = snap
+                    solve.places.update(obj._places)
+            if solve is not None:
+                solve.ver = room_ver
+                solve.trim(sigs, ETA_RESOLVE_MAX_CANDS)
+    finally:
+        if solve is not None:
+            solve.lock.release()
+    if solve is not None and dm_stats["partial"]:
+        # 업스트림 일부가 실패해 속도기반으로 메운 행이 섞였으면 이어 쓰지 않음
+        _drop_room_solve(room_code)
+    if best is None:
+        return {"ok": False, "error": "no_candidates"}, 400
+    if incremental is None:
+        stage1_count = obj.batches[0] if obj.batches else 0
+        stage2_count = obj.evaluations - stage1_count
     else:
-        best = top[0]; stage2_count = 0
+        # 이어 푼 경우 1단계(전체 격자)는 없음: 이번에 평가한 후보는 모두 저장된 후보 주변 다듬기. 재계산 집계는 incremental에
+        stage1_count, stage2_count = 0, obj.evaluations
 
     # 참가자별 ETA 리포트
     participants_eta = []
@@ -570,112 +3719,260 @@ def eta_centroid():
     payload = {
         "ok": True,
         "seed": {"lat": seed["lat"], "lng": seed["lng"]},
-        "best": {"lat": best["lat"], "lng": best["lng"]},
-        "candidate_count_stage1": len(cand1),
+        "best": {"lat": best["lat"], "lng": best["lng"], "place": best.get("place")},
+        "nearby": _nearby_places(best["lat"], best["lng"], ETA_SNAP_MAX_M, 5),
+        "candidate_count_stage1": stage1_count,
         "candidate_count_stage2": stage2_count,
         "participants_eta": participants_eta,
-        "ranking": "max_then_sum"
+        "ranking": "max_then_sum",
+        "search": {"strategy": strategy, "budget": budget, "evaluations": obj.evaluations,
+                   "batches": len(obj.batches), "snap": snap, "snapped": obj.snapped, "prefiltered": obj.prefiltered,
+                   "objective": {"max": best["max"], "sum": best["sum"]}},
+        "upstream": {"distance_matrix_requests": dm_stats["requests"],
+                     "distance_matrix_elements": dm_stats["elements"],
+                     "distance_matrix_cache_hits": dm_stats["cache_hits"],
+                     "subway_model_elements": dm_stats.get("subway_local", 0),
+                     "degraded": bool(dm_stats.get("degraded"))},
+        "partial": bool(dm_stats["partial"]),
+        "incremental": incremental,
     }
+    log.info("eta-centroid room=%s participants=%d strategy=%s incremental=%s evaluations=%d dm_requests=%d dm_elements=%d cache_hits=%d",
+             room_code or "-", len(participants), strategy, incremental is not None, obj.evaluations,
+             dm_stats["requests"], dm_stats["elements"], dm_stats["cache_hits"])
 
-    if room_code in ROOMS:
-        ROOMS[room_code]["eta"] = payload
-        ROOMS[room_code]["ver"] += 1
-        _cleanup_and_save()
+    # 업스트림 호출 동안은 락을 놓고, 결과 저장할 때만 다시 잡음
+    if room_code:
+        with _span("persist"):
+            yield _Blocking(lambda: STORE.set_eta(room_code, payload))
 
-    return jsonify(payload)
+    return payload, 200
 
 # ── Suggest
+# 카카오 검색은 쪽(15개) 단위. 소스(카테고리/검색어)별 여러 쪽을 병렬로 받아 id로 합치고,
+# 영업시간 필터를 통과한 후보가 SUGGEST_TARGET개 모이거나 쪽 요청 예산을 다 쓰면 멈춤
+SUGGEST_ETA_MAX = int(os.getenv("SUGGEST_ETA_MAX") or 30)        # ETA로 순위를 매길 상위 장소 수(0이면 거리순만)
+SUGGEST_ENRICH_MAX = int(os.getenv("SUGGEST_ENRICH_MAX") or 12)  # Google 보강(영업시간 등)을 붙일 상위 장소 수
+SUGGEST_TARGET = int(os.getenv("SUGGEST_TARGET") or 20)          # 필터 통과 후보가 이만큼 모이면 다음 쪽을 받지 않음
+SUGGEST_PAGE_BUDGET = int(os.getenv("SUGGEST_PAGE_BUDGET") or 12)  # 추천 한 번에 보낼 카카오 쪽 요청 수 상한
+SUGGEST_PAGES_PER_WAVE = int(os.getenv("SUGGEST_PAGES_PER_WAVE") or 3)  # 소스 하나에서 한 번에 당겨 받을 쪽 수
+BAR_TOKENS = ["술집","호프","바","이자카야","와인바","pub","bar","펍","칵테일바"]
+
 @app.route("/api/meeting-suggest", methods=["POST"])
 def meeting_suggest():
-    payload = request.get_json(silent=True) or {}
+    # stream=true(본문) 또는 ?stream=1이면 NDJSON으로 쪽이 도착할 때마다 통과한 장소를 흘려보내고 마지막 줄에 최종 결과
+    body = request.get_json(silent=True) or {}
+    wants_async = body.get("async") is True or request.args.get("async") in ("1", "true")
+    if not wants_async and (body.get("stream") is True or request.args.get("stream") in ("1", "true")):
+        return _ndjson(_drive(_suggest_events(body)))
+    return _job_or_run("suggest", _meeting_suggest)
+
+def _ndjson(events):
+    def _gen():
+        with _deadline():
+            for ev in events:
+                yield json.dumps(ev, ensure_ascii=False) + "\n"
+
+    resp = Response(stream_with_context(_gen()), mimetype="application/x-ndjson")
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+def _meeting_suggest(payload: Dict) -> Tuple[Dict, int]:
+    # 동기/비동기 작업 경로: 스트림을 끝까지 돌리고 마지막 결과만
+    out = {"type": "done", "status": 500, "result": {"ok": False, "error": "no_result"}}
+    for ev in _drive(_suggest_events(payload)):
+        out = ev
+    return out["result"], out["status"]
+
+def _suggest_sources(centroid: Dict, category: str, query: str, radius: int) -> List[Callable]:
+    # 소스마다 page → 카카오 검색 결과. BAR/PUB은 검색어마다 소스 하나
+    lat, lng = centroid["lat"], centroid["lng"]
+    if category in ("BAR","PUB"):
+        tokens = query.split() if query else BAR_TOKENS
+        return [(lambda page, t=t: kakao_keyword_search(lat, lng, t, radius, category_group_code="FD6", page=page))
+                for t in tokens]
+    if query:
+        code = category if category in ("FD6","CE7","AD5") else None
+        return [lambda page: kakao_keyword_search(lat, lng, query, radius, category_group_code=code, page=page)]
+    return [lambda page: kakao_category_search(lat, lng, category, radius, page=page)]
+
+def _kakao_pages(sources: List[Callable], enough: Callable, stats: Dict, on_page: Callable):
+    # 도착하는 대로 on_page(소스 번호, 쪽, 결과) 단계를 실행. 파도마다 남은 예산을 열린 소스에 나눠 여러 쪽을 동시에 요청하고,
+    # 결과의 is_end/pageable_count로 소스별 마지막 쪽을 좁힘. 파도 사이에 enough()가 참이면 멈춤
+    nxt = [1] * len(sources)
+    last = [KAKAO_MAX_PAGE] * len(sources)
+    while not enough():
+        live = [i for i in range(len(sources)) if nxt[i] <= last[i]]
+        room = SUGGEST_PAGE_BUDGET - stats["requests"]
+        if not live or room <= 0:
+            return
+        per = max(1, min(SUGGEST_PAGES_PER_WAVE, room // len(live)))
+        wave = [(i, page) for i in live for page in range(nxt[i], min(nxt[i] + per, last[i] + 1))][:room]
+        for i, page in wave:
+            nxt[i] = max(nxt[i], page + 1)
+        stats["requests"] += len(wave)
+        calls = _Calls([_spanned("kakao_search", lambda i=i, page=page: sources[i](page)) for i, page in wave], each=True)
+        for _ in wave:
+            k, res = yield calls
+            i, page = wave[k]
+            if res is None or not res.get("ok"):
+                # 마감에 걸렸거나 실패한 소스는 더 받지 않음
+                if res is None: stats["partial"] = True
+                else: stats["error"] = res
+                last[i] = 0
+                continue
+            stats["pages"] += 1
+            if res["is_end"]:
+                last[i] = min(last[i], page)
+            last[i] = min(last[i], max(1, math.ceil(res["pageable_count"] / KAKAO_PAGE_SIZE)))
+            yield from on_page(i, page, res)
+
+def _suggest_rank_key(x: Dict):
+    rank = 0 if x.get("_open_enough") is True else 1
+    return (rank, x.get("_centroid_dist_km") is None, x.get("_centroid_dist_km") or 0.0)
+
+def _suggest_filter(items: List[Dict], centroid: Dict, meeting_dt: datetime, req_minutes: int,
+                    ivs: Dict[str, List[int] | None]) -> List[Dict]:
+    # 무게중심 거리 + meetingTime 기준 영업시간 필터. ivs = 장소 id → 보강에서 떼어 낸 컴파일 구간. 영업시간을 모르는 곳은 남김
+    kept = []
+    lefts = _open_minutes_batch([ivs.get(d.get("id")) for d in items], meeting_dt)
+    for d, left_min in zip(items, lefts):
+        try:
+            d["_centroid_dist_km"] = round(haversine_km(centroid["lat"], centroid["lng"], float(d["y"]), float(d["x"])), 3)
+        except:
+            d["_centroid_dist_km"] = None
+
+        if left_min is False:
+            d["_open_enough"] = None
+        else:
+            if left_min is None: continue
+            d["_open_minutes_left"] = left_min
+            d["_closes_at"] = None if left_min >= WEEK_MIN else (meeting_dt + timedelta(minutes=left_min)).strftime("%H:%M")
+            d["_open_enough"] = (left_min >= req_minutes)
+            if not d["_open_enough"]: continue
+
+        kept.append(d)
+    return kept
+
+def _suggest_events(payload: Dict):
+    # 이벤트: start → page(쪽마다 새로 통과한 장소) … → done(status, result). 단계 제너레이터(_drive/_arun으로 실행)
     room_code = (payload.get("roomCode") or "").upper()
     category = payload.get("category") or "FD6"
     radius = int(payload.get("radius") or 2000)
     query = (payload.get("query") or "").strip()
 
     pts = []
-    if room_code and room_code in ROOMS:
-        for p in ROOMS[room_code]["participants"].values():
+    meeting_dt = None
+    snap = (yield _Blocking(lambda: STORE.snapshot(room_code))) if room_code else None
+    if snap is not None:
+        meeting_dt = _parse_meeting_time(snap["meta"].get("meetingTime"))
+        for p in snap["participants"]:
             if isinstance(p.get("lat"),(int,float)) and isinstance(p.get("lng"),(int,float)):
                 pts.append({"lat":p["lat"],"lng":p["lng"],"mode":p["mode"]})
-    else:
+    if meeting_dt is None:
         for p in payload.get("participants") or []:
             try: pts.append({"lat":float(p["lat"]), "lng":float(p["lng"]), "mode":(p.get("mode") or "car")})
             except: pass
 
-    if not pts: return jsonify({"ok":False,"error":"no_points"})
+    if not pts:
+        yield {"type": "done", "status": 200, "result": {"ok":False,"error":"no_points"}}
+        return
 
     centroid = time_weighted_centroid(pts)
+    # 방에 ETA 결과가 있으면 그 최적점을 중심으로 검색(center="centroid"면 무게중심)
+    center_source = "centroid"
+    eta = (yield _Blocking(lambda: STORE.blob(room_code, "eta"))) if snap is not None else None
+    eta_best = (eta[0] or {}).get("best") if eta else None
+    if eta_best and payload.get("center") != "centroid":
+        centroid = {"lat": eta_best["lat"], "lng": eta_best["lng"]}
+        center_source = "eta"
 
-    # Kakao 검색
-    if category in ("BAR","PUB"):
-        tokens = query.split() if query else ["술집","호프","바","이자카야","와인바","pub","bar","펍","칵테일바"]
-        pool = {}; last_err = None
-        for t in tokens:
-            res = kakao_keyword_search(centroid["lat"], centroid["lng"], t, radius, category_group_code="FD6")
-            if res.get("ok"):
-                for d in res["items"]: pool[d["id"]] = d
-            else: last_err = res
-        if not pool and last_err: return jsonify(last_err), 502
-        items = list(pool.values())
-    elif query:
-        res = kakao_keyword_search(centroid["lat"], centroid["lng"], query, radius,
-                                   category_group_code=(category if category in ("FD6","CE7","AD5") else None))
-        if not res.get("ok"): return jsonify(res), 502
-        items = res["items"]
-    else:
-        res = kakao_category_search(centroid["lat"], centroid["lng"], category, radius)
-        if not res.get("ok"): return jsonify(res), 502
-        items = res["items"]
-
-    # Google 보강(상위 12개만)
-    if GOOGLE_API_KEY:
-        for d in items[:12]:
-            try:
-                lat, lng = float(d["y"]), float(d["x"])
-                d.update({k:v for k,v in google_enrich(d["place_name"], lat, lng, category).items() if v is not None})
-            except Exception:
-                pass
-
-    # meetingTime 기준으로 영업시간 필터
-    meeting_dt = _parse_meeting_time(ROOMS[room_code]["meta"].get("meetingTime")) if room_code in ROOMS else datetime.now()
+    if meeting_dt is None:
+        meeting_dt = datetime.now()
     req_minutes = 120 if category in ("BAR","PUB") else 60
+    yield {"type": "start", "centroid": centroid, "center_source": center_source, "category": category}
 
+    # Kakao 검색(쪽 단위) → 새 장소만 Google 보강(전체 SUGGEST_ENRICH_MAX개까지, 병렬) → 영업시간 필터
+    _progress("search", category=category, radius=radius)
+    degraded: List[str] = []   # 업스트림을 못 써서 대체 경로로 채운 단계
+    page_stats = {"requests": 0, "pages": 0, "partial": False, "error": None}
+    acc = {"partial": False, "enrich_left": SUGGEST_ENRICH_MAX, "unenriched": 0}
+    seen = set()
+    ivs: Dict[str, List[int] | None] = {}
     filtered = []
-    for d in items:
-        try:
-            d["_centroid_dist_km"] = round(haversine_km(centroid["lat"], centroid["lng"], float(d["y"]), float(d["x"])), 3)
-        except:
-            d["_centroid_dist_km"] = None
 
-        periods = d.get("_periods")
-        if periods:
-            rs = _minutes_open_after(meeting_dt, periods)
-            if rs is None: continue
-            left_min, close_dt = rs
-            d["_open_minutes_left"] = left_min
-            d["_closes_at"] = close_dt.strftime("%H:%M")
-            d["_open_enough"] = (left_min >= req_minutes)
-            if not d["_open_enough"]: continue
-        else:
-            d["_open_enough"] = None
+    def on_page(src, page, res):
+        new = [d for d in res["items"] if d.get("id") not in seen]
+        seen.update(d.get("id") for d in new)
+        if GOOGLE_API_KEY and acc["enrich_left"] > 0 and new:
+            targets = new[:acc["enrich_left"]]
+            acc["enrich_left"] -= len(targets)
+            _progress("enrich", found=len(seen))
+            with _span("google_enrich"):
+                extras, enrich_partial = yield _Calls([
+                    (lambda d=d: google_enrich(d["place_name"], float(d["y"]), float(d["x"]), category, d.get("id")))
+                    for d in targets])
+            acc["partial"] = acc["partial"] or enrich_partial
+            for d, extra in zip(targets, extras):
+                if extra:
+                    ivs[d.get("id")] = extra.pop("_open_intervals", None)
+                    d.update({k:v for k,v in extra.items() if v is not None})
+            acc["unenriched"] += sum(1 for extra in extras if extra is None)
+        with _span("hours_filter"):
+            kept = _suggest_filter(new, centroid, meeting_dt, req_minutes, ivs)
+        kept.sort(key=_suggest_rank_key)
+        filtered.extend(kept)
+        _progress("search", category=category, radius=radius, pages=page_stats["pages"], found=len(seen), kept=len(filtered))
+        yield {"type": "page", "source": src, "page": page, "found": len(new), "kept": len(filtered), "items": kept}
 
-        filtered.append(d)
+    sources = _suggest_sources(centroid, category, query, radius)
+    yield from _kakao_pages(sources, lambda: len(filtered) >= SUGGEST_TARGET, page_stats, on_page)
+    partial, enrich_left, unenriched = acc["partial"], acc["enrich_left"], acc["unenriched"]
 
-    def _rank_key(x):
-        rank = 0 if x.get("_open_enough") is True else 1
-        return (rank, x.get("_centroid_dist_km") is None, x.get("_centroid_dist_km") or 0.0)
+    if not page_stats["pages"] and page_stats["error"]:
+        yield {"type": "done", "status": 502, "result": page_stats["error"]}
+        return
+    partial = partial or page_stats["partial"]
+    if unenriched:
+        # 스로틀/차단/오류로 보강 못 한 곳은 영업시간 필터 없이 그대로 남김
+        degraded.append("google_enrich")
+        log.warning("suggest: %d/%d places left unenriched", unenriched, SUGGEST_ENRICH_MAX - enrich_left)
 
-    filtered.sort(key=_rank_key)
+    filtered.sort(key=_suggest_rank_key)
 
-    result_payload = {"ok": True, "count": len(filtered), "centroid": centroid, "items": filtered}
+    # 가까운 순 상위 SUGGEST_ETA_MAX곳은 참가자 전원의 ETA를 구해 (최대, 합) 순으로 다시 정렬
+    dm_stats = {"requests": 0, "elements": 0, "cache_hits": 0, "partial": 0}
+    ranking = "distance"
+    pool = filtered[:SUGGEST_ETA_MAX] if SUGGEST_ETA_MAX > 0 else []
+    if pool:
+        _progress("eta_rank", candidates=len(pool), participants=len(pts))
+        depart_unix = int(meeting_dt.replace(tzinfo=timezone.utc).timestamp())
+        with _span("eta_rank"):
+            etas = yield from _eta_matrix_steps(pts, [(float(d["y"]), float(d["x"])) for d in pool], depart_unix, dm_stats)
+        for j, d in enumerate(pool):
+            col = [int(row[j]) for row in etas]
+            d["_eta_max"], d["_eta_sum"] = max(col), sum(col)
+        filtered.sort(key=lambda x: (_suggest_rank_key(x)[0], x.get("_eta_max") is None,
+                                     x.get("_eta_max") or 0, x.get("_eta_sum") or 0, _suggest_rank_key(x)[2]))
+        ranking = "eta_max_then_sum"
+        partial = partial or bool(dm_stats["partial"])
+        if dm_stats.get("degraded"):
+            degraded.append("distance_matrix")
 
-    if room_code in ROOMS:
-        ROOMS[room_code]["results"] = {"count": len(filtered), "centroid": centroid, "items": filtered}
-        ROOMS[room_code]["ver"] += 1
-        _cleanup_and_save()
+    result_payload = {"ok": True, "count": len(filtered), "centroid": centroid, "center_source": center_source,
+                      "ranking": ranking, "items": filtered, "partial": partial, "degraded": degraded,
+                      "upstream": {"kakao_page_requests": page_stats["requests"],
+                                   "kakao_pages": page_stats["pages"],
+                                   "kakao_places": len(seen),
+                                   "distance_matrix_requests": dm_stats["requests"],
+                                   "distance_matrix_elements": dm_stats["elements"],
+                                   "distance_matrix_cache_hits": dm_stats["cache_hits"]}}
 
-    return jsonify(result_payload)
+    if room_code:
+        with _span("persist"):
+            yield _Blocking(lambda: STORE.set_results(room_code, {"count": len(filtered), "centroid": centroid, "items": filtered}))
+
+    yield {"type": "done", "status": 200, "result": result_payload}
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 정적 서빙 (반드시 API 라우트들 아래)
@@ -693,8 +3990,183 @@ def static_files(fname):
         resp.headers["Cache-Control"] = "no-store, max-age=0"
     return resp
 
+# ── ASGI (비동기 모드)
+# SERVER_MODE=async면 uvicorn으로 asgi_app을 띄움(uvicorn server:asgi_app 으로 직접 띄워도 같음)
+# /api/eta-centroid, /api/meeting-suggest(동기 응답과 NDJSON 스트림)는 이벤트 루프에서 단계 제너레이터를 _arun으로 돌려
+# 업스트림을 기다리는 동안 스레드를 잡지 않음. 요청 컨텍스트/훅(CORS, 메트릭, Server-Timing)은 Flask 것을 그대로 씀
+# 그 밖의 라우트(방 API, long-poll, SSE, async=true 작업 제출, 정적 파일)는 WSGI 그대로: asgiref WsgiToAsgi로 Flask에 넘겨
+# 요청마다 스레드 하나에서 실행(동시에 ASYNC_WSGI_THREADS개까지, long-poll/SSE가 하나씩 잡음)
+SERVER_MODE        = (os.getenv("SERVER_MODE") or "sync").strip().lower()   # sync | async
+ASYNC_WSGI_THREADS = int(os.getenv("ASYNC_WSGI_THREADS") or 256)           # 비동기 모드에서 동시에 도는 Flask 라우트 수 상한
+
+# (선택) asgiref: SERVER_MODE=async에서만 필요
+try:
+    from asgiref.sync import ThreadSensitiveContext
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+except ImportError:
+    WsgiToAsgi = None
+
+_ASYNC_ROUTES = {"/api/eta-centroid": "eta", "/api/meeting-suggest": "suggest"}
+_WSGI_SLOTS: asyncio.Semaphore | None = None   # 첫 요청 때 서빙 루프에서 만듦
+
+class ClientDisconnected(OSError):
+    pass
+
+def _wsgi_app(environ, start_response):
+    # WsgiToAsgi에 넘기는 Flask 래퍼
+    #  - 본문은 asgi_app이 이미 다 받아 둔 것이므로 Content-Length가 없어도(chunked) 끝까지 읽게 함
+    #  - 클라이언트가 끊겨 보내기가 실패해도 응답 iterable을 close() → 스트림 제너레이터/요청 정리가 바로 돎
+    environ["wsgi.input_terminated"] = True
+    it = app(environ, start_response)
+    try:
+        yield from it
+    finally:
+        if hasattr(it, "close"):
+            it.close()
+
+_ASGI_WSGI = WsgiToAsgi(_wsgi_app) if WsgiToAsgi is not None else None
+
+def _asgi_environ(scope: Dict, body: bytes) -> Dict:
+    # 네이티브 라우트의 Flask 요청 컨텍스트용 environ. WSGI 라우트와 같은 규칙(asgiref)으로 만듦
+    inst = WsgiToAsgiInstance(app)
+    inst.scope = scope
+    env = inst.build_environ(scope, io.BytesIO(body))
+    env["wsgi.input_terminated"] = True
+    return env
+
+async def _asgi_start(send, resp: Response):
+    await send({"type": "http.response.start", "status": resp.status_code,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in resp.headers.to_wsgi_list()]})
+
+async def _asgi_wsgi(scope: Dict, body: bytes, send, disconnected: asyncio.Event):
+    # Flask에 그대로 넘김. 본문은 이미 받아 둔 것을 한 번에 다시 건네고, 끊긴 뒤의 보내기는 예외로 바꿔
+    # 무한 SSE/long-poll 스트림이 스레드를 계속 잡지 않게 함(uvicorn은 끊긴 연결로의 send를 조용히 버림)
+    global _WSGI_SLOTS
+    if _WSGI_SLOTS is None:
+        _WSGI_SLOTS = asyncio.Semaphore(ASYNC_WSGI_THREADS)
+
+    async def replay():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send_live(msg):
+        if disconnected.is_set():
+            raise ClientDisconnected()
+        await send(msg)
+
+    async with _WSGI_SLOTS:
+        # 요청마다 자기 스레드(asgiref 기본은 스레드 하나를 모든 요청이 나눠 씀 → long-poll 하나가 나머지를 막음)
+        async with ThreadSensitiveContext():
+            try:
+                await _ASGI_WSGI(scope, replay, send_live)
+            except ClientDisconnected:
+                pass
+
+async def _asgi_native(environ: Dict, kind: str, body: Dict, stream: bool, send):
+    # 동기 뷰(eta_centroid / meeting_suggest)와 같은 응답을 만들되 풀이는 _arun으로
+    with app.request_context(environ):
+        try:
+            rv = app.preprocess_request()
+            if rv is None and stream:
+                resp = Response(b"", mimetype="application/x-ndjson")
+                resp.headers["Cache-Control"] = "no-store"
+                resp.headers["X-Accel-Buffering"] = "no"
+                resp = app.process_response(resp)
+                resp.headers.pop("Content-Length", None)
+                await _asgi_start(send, resp)
+
+                async def emit(ev):
+                    await send({"type": "http.response.body", "more_body": True,
+                                "body": (json.dumps(ev, ensure_ascii=False) + "\n").encode("utf-8")})
+                try:
+                    with _deadline():
+                        await _arun(_suggest_events(body), emit)
+                except Exception:
+                    # 헤더는 이미 나갔으니 스트림만 끊음(동기 모드 스트림과 같음)
+                    log.exception("suggest stream failed")
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            if rv is None:
+                with _deadline():
+                    if kind == "eta":
+                        out, status = await _arun(_eta_centroid_steps(body))
+                    else:
+                        out = {"type": "done", "status": 500, "result": {"ok": False, "error": "no_result"}}
+
+                        async def keep_last(ev):
+                            nonlocal out
+                            out = ev
+                        await _arun(_suggest_events(body), keep_last)
+                        out, status = out["result"], out["status"]
+                rv = (jsonify(out), status)
+            resp = app.process_response(app.make_response(rv))
+        except Exception as e:
+            resp = app.make_response(app.handle_exception(e))
+    await _asgi_start(send, resp)
+    await send({"type": "http.response.body", "body": resp.get_data(), "more_body": False})
+
+async def _asgi_body(receive) -> bytes:
+    chunks = []
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            return b"".join(chunks)
+        chunks.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            return b"".join(chunks)
+
+async def asgi_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                if _ASGI_WSGI is None:
+                    await send({"type": "lifespan.startup.failed", "message": "SERVER_MODE=async needs asgiref"})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    raw = await _asgi_body(receive)
+    disconnected = asyncio.Event()
+
+    async def _watch():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+    watcher = asyncio.ensure_future(_watch())
+    try:
+        kind = _ASYNC_ROUTES.get(scope["path"]) if scope["method"] == "POST" else None
+        body, stream = {}, False
+        if kind is not None:
+            # 뷰와 같은 규칙으로 본문/쿼리를 읽음. async=true(작업 제출)는 Flask 쪽 _job_or_run으로
+            req = app.request_class(_asgi_environ(scope, raw))
+            body = req.get_json(silent=True) or {}
+            if body.get("async") is True or req.args.get("async") in ("1", "true"):
+                kind = None
+            else:
+                stream = kind == "suggest" and (body.get("stream") is True or req.args.get("stream") in ("1", "true"))
+        if kind is None:
+            await _asgi_wsgi(scope, raw, send, disconnected)
+        else:
+            await _asgi_native(_asgi_environ(scope, raw), kind, body, stream, send)
+    finally:
+        watcher.cancel()
+
 # ── main
 if __name__ == "__main__":
     log.info("Serving static from: %s", STATIC_DIR)
     log.info("KAKAO_REST_KEY=%s, GOOGLE_API_KEY=%s", bool(KAKAO_REST_KEY), bool(GOOGLE_API_KEY))
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    port = int(os.getenv("PORT") or 5000)
+    if SERVER_MODE == "async":
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit("SERVER_MODE=async needs uvicorn (pip install uvicorn)")
+        if _ASGI_WSGI is None:
+            raise SystemExit("SERVER_MODE=async needs asgiref (pip install asgiref)")
+        log.info("Serving async (ASGI) on :%d", port)
+        uvicorn.run(asgi_app, host="0.0.0.0", port=port, log_level="warning", lifespan="on")
+    else:
+        app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
@@ -0,0 +1,162 @@
+"""방 저장소 테스트: memory/sqlite 백엔드가 같은 동작을 하는지, rooms.dat + rooms.log 복구가 맞는지.
+
+    cd meeting-midpoint/backend && python -m pytest -q tests
+
+서버 모듈을 임시 디렉터리의 rooms.dat/rooms.log로 띄우므로 실제 데이터는 건드리지 않음.
+"""
+import os, sys, time, pathlib, tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="meetpoint-test-")
+os.environ["ROOMS_PATH"] = os.path.join(_TMP, "rooms.json")
+os.environ["ROOM_STORE"] = "memory"
+os.environ["ROOM_PAGE_OUT_S"] = "0"
+os.environ.setdefault("CACHE_DB_PATH", "")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+import server  # noqa: E402
+
+
+def _room(ttl_min=60):
+    now = server._now_ms()
+    return {"code": None, "created_at": now, "expires_at": now + ttl_min * 60 * 1000,
+            "meta": {"purpose": "test", "meetingTime": ""}, "participants": {}, "ver": 0,
+            "results": None, "host_secret": "HS_TEST", "eta": None, "job": None, "ttl_ms": ttl_min * 60 * 1000}
+
+
+def _results(*ids):
+    items = [{"id": i, "place_name": f"장소{i}", "x": "127.0", "y": "37.5", "_centroid_dist_km": 0.5} for i in ids]
+    return {"count": len(items), "total": len(items), "items": items}
+
+
+@pytest.fixture(scope="module", params=["memory", "sqlite"])
+def store(request):
+    if request.param == "memory":
+        return server.STORE
+    st = server.SqliteRoomStore(os.path.join(_TMP, "rooms.sqlite3"))
+    st.start()
+    return st
+
+
+def _scenario(store):
+    # create → join ×2 → update → delta → set_blob(results/eta). pid/code는 무작위라 자리표시로 바꿔서 돌려줌
+    code = store.create(_room())
+    a = store.join(code, "a")
+    b = store.join(code, "b")
+    base = store.ver(code)
+    ver = store.update(code, a, 37.55, 126.97, "subway")
+    names = {a: "A", b: "B"}
+    out = {"ver_after_update": ver, "base": base}
+
+    d = store.delta(code, base)
+    out["delta"] = {"ver": d["ver"], "base": d["base"], "removed": d["removed"],
+                    "participants": [(names[p["pid"]], p["lat"], p["lng"], p["mode"]) for p in d["participants"]],
+                    "blobs_changed": [d[f"{n}_changed"] for n in server.ROOM_BLOBS]}
+
+    out["set_results_ver"] = store.set_results(code, _results("1", "2"))
+    out["set_eta_ver"] = store.set_eta(code, {"best": {"lat": 37.5, "lng": 127.0}})
+    d = store.delta(code, ver)
+    out["delta_blobs"] = {n: d[f"{n}_changed"] for n in server.ROOM_BLOBS}
+    out["results"] = store.results(code)
+    out["eta"] = store.blob(code, "eta")[0]
+    out["results_hash_stable"] = store.blob(code, "results")[1] == store.state(code, lite=True)["results_hash"]
+
+    st = store.state(code)
+    out["state"] = {"ver": st["ver"], "participants": sorted((names[p["pid"]], p["lat"]) for p in st["participants"])}
+    out["leave_ver"] = store.leave(code, b)
+    out["missing_join"] = _raises(lambda: store.join("NOPE00", "x"))
+    out["missing_state"] = store.state("NOPE00")
+    out["missing_set_blob"] = store.set_blob("NOPE00", "eta", {})
+    store.close(code, "HS_TEST")
+    out["closed_state"] = store.state(code)
+    return out
+
+
+def _raises(fn):
+    try:
+        fn()
+    except server.RoomError as e:
+        return str(e)
+    return None
+
+
+def test_store_scenario(store):
+    out = _scenario(store)
+    assert out["base"] == 2 and out["ver_after_update"] == 3
+    assert out["delta"] == {"ver": 3, "base": 2, "removed": [], "participants": [("A", 37.55, 126.97, "subway")],
+                            "blobs_changed": [False] * len(server.ROOM_BLOBS)}
+    assert (out["set_results_ver"], out["set_eta_ver"]) == (4, 5)
+    assert out["delta_blobs"]["results"] and out["delta_blobs"]["eta"]
+    assert [d["place_name"] for d in out["results"]["items"]] == ["장소1", "장소2"]
+    assert out["results"]["items"][0]["_centroid_dist_km"] == 0.5
+    assert out["eta"] == {"best": {"lat": 37.5, "lng": 127.0}}
+    assert out["results_hash_stable"]
+    assert out["state"] == {"ver": 5, "participants": [("A", 37.55), ("B", None)]}
+    assert out["leave_ver"] == 6
+    assert out["missing_join"] == "room_not_found"
+    assert out["missing_state"] is None and out["missing_set_blob"] is None
+    assert out["closed_state"] is None
+
+
+def test_backends_agree():
+    sqlite = server.SqliteRoomStore(os.path.join(_TMP, "agree.sqlite3"))
+    sqlite.start()
+    assert _scenario(server.STORE) == _scenario(sqlite)
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class Partial(server.RoomStore):
+        def create(self, room):
+            return "X"
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_snapshot_and_log_recovery():
+    # 스냅샷(rooms.dat) 뒤에 로그(rooms.log)에만 남은 변경까지 재시작(_load_rooms) 후 그대로 복구돼야 함
+    st = server.STORE
+    codes = []
+    for i in range(5):
+        code = st.create(_room())
+        pid = st.join(code, f"n{i}")
+        st.update(code, pid, 37.5 + i * 0.01, 127.0, "car")
+        st.set_results(code, _results(str(i), "shared"))
+        codes.append(code)
+    server.ROOM_LOG.flush()
+    server.ROOM_LOG.compact()
+
+    late = st.join(codes[0], "late")
+    st.set_eta(codes[1], {"after": "snapshot"})
+    st.leave(codes[2], st.state(codes[2])["participants"][0]["pid"])
+    st.close(codes[3], "HS_TEST")
+    server.ROOM_LOG.flush()
+    expect = {c: st.state(c) for c in codes}
+    venues = server.VENUES.info()
+
+    server._load_rooms()
+    assert {c: st.state(c) for c in codes} == expect
+    assert expect[codes[3]] is None and codes[3] not in server.ROOMS
+    assert any(p["pid"] == late for p in expect[codes[0]]["participants"])
+    assert st.blob(codes[1], "eta")[0] == {"after": "snapshot"}
+    assert [d["place_name"] for d in st.results(codes[4])["items"]] == ["장소4", "장소shared"]
+    assert server.VENUES.info() == venues
+
+
+def test_log_ttl_extension_survives_restart():
+    # 스냅샷의 만료시각은 지났어도 로그에서 연장된 방은 남고, 연장 안 된 방은 재생 뒤 정리됨
+    st = server.STORE
+    keep, gone = st.create(_room()), st.create(_room())
+    now = server._now_ms()
+    for code in (keep, gone):
+        with server._locked_room(code) as room:
+            room["expires_at"] = now + 200
+    server.ROOM_LOG.compact()
+    with server._locked_room(keep) as room:
+        room["expires_at"] = now + 3600 * 1000
+        server._persist("set", keep, fields={"expires_at": room["expires_at"]})
+    server.ROOM_LOG.flush()
+    time.sleep(0.3)
+
+    server._load_rooms()
+    assert keep in server.ROOMS and gone not in server.ROOMS
@@ -41,6 +41,48 @@ async function apiPost(url, body){
   const r=await fetch(url,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(body||{})});
   const t=await r.text(); if(!r.ok) throw new Error(t); try{return JSON.parse(t);}catch{return t;}
 }
+// 비동기 작업으로 요청 → 작업 id를 받아 끝날 때까지 조회(진행 상황은 onProgress로)
+async function apiJob(url, body, onProgress){
+  const r = await apiPost(url, {...body, async:true});
+  if(!r.job) return r;
+  let job = r.job;
+  while(job.state==='queued' || job.state==='running'){
+    if(onProgress) onProgress(job);
+    await sleep(700);
+    job = (await apiGet(`/api/job/${encodeURIComponent(job.id)}`)).job;
+  }
+  if(job.state!=='done') throw new Error(JSON.stringify(job.result||{error:job.state}));
+  return job.result;
+}
+// NDJSON 스트림으로 요청 → 줄(이벤트)마다 onEvent, 마지막 done 이벤트의 결과를 돌려줌
+async function apiStream(url, body, onEvent){
+  const r=await fetch(url,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({...body, stream:true})});
+  if(!r.ok || !r.body) throw new Error(await r.text());
+  const reader=r.body.getReader(), dec=new TextDecoder();
+  let buf='', done=null;
+  const take=line=>{
+    if(!line.trim()) return;
+    const ev=JSON.parse(line);
+    if(ev.type==='done') done=ev; else if(onEvent) onEvent(ev);
+  };
+  for(;;){
+    const {value, done:end}=await reader.read();
+    if(end) break;
+    buf+=dec.decode(value,{stream:true});
+    const lines=buf.split('\n'); buf=lines.pop();
+    lines.forEach(take);
+  }
+  take(buf);
+  if(!done) throw new Error('stream_ended');
+  if(done.status>=400) throw new Error(JSON.stringify(done.result));
+  return done.result;
+}
+function jobProgressText(job){
+  const p = job.progress||{};
+  const label = job.kind==='suggest' ? '장소 추천' : 'ETA 계산';
+  const scored = p.scored!=null ? ` · 후보 ${p.scored}${p.budget?'/'+p.budget:''}곳 평가` : '';
+  return `${label} 중… ${job.stage||job.state}${scored}`;
+}
 
 // ===== 모달 시트
 function openSheet(id){ el(id)?.setAttribute('aria-hidden','false'); }
@@ -171,12 +213,14 @@ function renderSuggest(list, centroid){
   list.forEach(d=>{
     const lat = parseFloat(d.y), lng = parseFloat(d.x);
     const dist = (d._centroid_dist_km!=null)? `${d._centroid_dist_km}km` : '';
-    const open = (d._open_minutes_left!=null) ? `영업 ${d._open_minutes_left}분 남음 (마감 ${d._closes_at||''})` : '';
+    const eta = (d._eta_max!=null)? `최대 ${d._eta_max}분` : '';
+    const open = (d._open_minutes_left!=null) ? (d._closes_at ? `영업 ${d._open_minutes_left}분 남음 (마감 ${d._closes_at})` : '24시간 영업') : '';
     const phone = d._phone || d.phone || '';
     const addr = d.road_address_name || d.address_name || '';
     const tags = [
       d.category_name ? `<span class="tag">${escapeHtml(d.category_name)}</span>` : '',
       d._open_enough===true ? `<span class="badge">충분히 영업</span>` : '',
+      eta ? `<span class="tag">${eta}</span>` : '',
       dist ? `<span class="tag">${dist}</span>` : ''
     ].join(' ');
     const img = d._photo_url ? `<img src="${d._photo_url}" alt="">` : `<div style="width:100%;height:100px;border-radius:10px;background:#111827;border:1px solid #1f2937;"></div>`;
@@ -204,35 +248,118 @@ function renderSuggest(list, centroid){
 }
 
 // ===== 상태 갱신
+// 구독 중인 방 코드, SSE 핸들, 마지막 ver/ETag, 누적된 참가자 목록(delta 적용 대상)
+const live = { code:'', es:null, ver:null, etag:null, parts:new Map(), meta:null, seq:0 };
+const blobCache = new Map();  // 내용 해시 → results/eta/job (해시가 같으면 다시 받지 않음)
+function renderState(st){
+  // 우측 패널
+  el('metaText').textContent = JSON.stringify(st.meta||{}, null, 0);
+  el('centroidText').textContent = st.centroid ? `${st.centroid.lat.toFixed(5)}, ${st.centroid.lng.toFixed(5)}` : '-';
+  renderParticipants(st.participants||[]);
+  // 지도
+  clearMarks();
+  (st.participants||[]).forEach(p=>{
+    if(isFinite(p.lat)&&isFinite(p.lng)) addParticipantMarker(p);
+  });
+  if(st.centroid) setCentroidMarker(st.centroid);
+  if(st.eta && st.eta.best) setBestMarker(st.eta.best);
+  // 방에서 도는 비동기 작업 진행 상황(다른 참가자가 시작한 것도 보임)
+  if(st.job && (st.job.state==='queued' || st.job.state==='running')) el('etaSummary').textContent = jobProgressText(st.job);
+  fitToPoints([
+    ...(st.participants||[]).filter(p=>isFinite(p.lat)&&isFinite(p.lng)),
+    st.centroid, st.eta?.best
+  ]);
+  // 추천 결과 표시(저장된 결과)
+  if(st.results && Array.isArray(st.results.items)){
+    renderSuggest(st.results.items, st.results.centroid);
+  }
+}
 async function refreshState(showToast=false){
   if(!S.code) return;
   try{
-    const st = await apiGet(`/api/room/state?code=${encodeURIComponent(S.code)}`);
-    // 우측 패널
-    el('metaText').textContent = JSON.stringify(st.meta||{}, null, 0);
-    el('centroidText').textContent = st.centroid ? `${st.centroid.lat.toFixed(5)}, ${st.centroid.lng.toFixed(5)}` : '-';
-    renderParticipants(st.participants||[]);
-    // 지도
-    clearMarks();
-    (st.participants||[]).forEach(p=>{
-      if(isFinite(p.lat)&&isFinite(p.lng)) addParticipantMarker(p);
-    });
-    if(st.centroid) setCentroidMarker(st.centroid);
-    if(st.eta && st.eta.best) setBestMarker(st.eta.best);
-    fitToPoints([
-      ...(st.participants||[]).filter(p=>isFinite(p.lat)&&isFinite(p.lng)),
-      st.centroid, st.eta?.best
-    ]);
-    // 추천 결과 표시(저장된 결과)
-    if(st.results && Array.isArray(st.results.items)){
-      renderSuggest(st.results.items, st.results.centroid);
-    }
+    const st = await apiGet(`/api/room/state?code=${encodeURIComponent(S.code)}&full=1`);
+    renderState(st);
     if(showToast) console.log('[state] refreshed');
   }catch(e){
     console.error('state error', e);
   }
 }
 
+// ===== 실시간 구독 (SSE, 안 되면 long-poll) — ver가 바뀔 때만 서버가 응답
+function isLive(){ return !!S.code && live.code===S.code; }
+function unsubscribeRoom(){
+  if(live.es){ live.es.close(); live.es=null; }
+  live.code=''; live.ver=null; live.etag=null; live.parts=new Map(); live.meta=null; live.seq++;
+}
+async function loadBlob(code, name, hash){
+  if(!hash) return null;
+  if(blobCache.has(hash)) return blobCache.get(hash);
+  const v = await apiGet(`/api/room/blob?code=${encodeURIComponent(code)}&name=${name}&hash=${hash}`);
+  if(blobCache.size>=32) blobCache.delete(blobCache.keys().next().value);
+  blobCache.set(hash, v);
+  return v;
+}
+// delta=1 응답(스냅샷 또는 변경분)을 누적 상태에 반영하고, 해시가 바뀐 blob만 받아서 렌더
+async function applyLiteState(code, st){
+  if(st.delta){
+    (st.participants||[]).forEach(p=>live.parts.set(p.pid,p));
+    (st.removed||[]).forEach(pid=>live.parts.delete(pid));
+  }else{
+    live.parts = new Map((st.participants||[]).map(p=>[p.pid,p]));
+    live.meta = st.meta;
+  }
+  live.ver = st.ver;
+  const seq = ++live.seq;
+  let results=null, eta=null, job=null;
+  try{
+    [results, eta, job] = await Promise.all([loadBlob(code,'results',st.results_hash), loadBlob(code,'eta',st.eta_hash),
+                                             loadBlob(code,'job',st.job_hash)]);
+  }catch(e){ console.warn('[live] blob fetch failed', e); }
+  if(seq!==live.seq || live.code!==code) return;  // 그 사이 더 최신 상태가 도착
+  renderState({ meta:live.meta, participants:[...live.parts.values()], centroid:st.centroid, ver:st.ver, results, eta, job });
+}
+async function longPollLoop(code){
+  while(live.code===code){
+    try{
+      const q = live.ver!=null ? `&since=${live.ver}&wait=25` : '';
+      const headers = live.etag ? {'If-None-Match': live.etag} : {};
+      const r = await fetch(`/api/room/state?code=${encodeURIComponent(code)}&delta=1${q}`, {cache:'no-store', headers});
+      if(r.status===404){ if(live.code===code) unsubscribeRoom(); break; }
+      if(r.status===304) continue;
+      if(!r.ok) throw new Error('HTTP '+r.status);
+      const st = await r.json();
+      if(live.code!==code) break;
+      if(!st.unchanged){ live.etag=r.headers.get('ETag'); await applyLiteState(code, st); }
+    }catch(e){
+      console.error('[live] long-poll error', e);
+      await sleep(3000);
+    }
+  }
+}
+function subscribeRoom(){
+  const code = S.code;
+  if(!code || live.code===code) return;
+  unsubscribeRoom();
+  live.code = code;
+  if(!window.EventSource){ longPollLoop(code); return; }
+  const es = new EventSource(`/api/room/events?code=${encodeURIComponent(code)}&delta=1`);
+  es.addEventListener('state', (e)=>{
+    let st; try{ st=JSON.parse(e.data); }catch(err){ console.error('[live] bad event', err); return; }
+    applyLiteState(code, st);
+  });
+  es.addEventListener('closed', ()=>{ if(live.code===code) unsubscribeRoom(); });
+  es.onerror = ()=>{
+    // 연결 자체가 막히면(프록시 등) long-poll로 전환
+    if(es.readyState===EventSource.CLOSED && live.code===code){ live.es=null; longPollLoop(code); }
+  };
+  live.es = es;
+}
+// 구독 중이면 서버가 밀어주므로 직접 조회 생략
+async function syncState(showToast=false){
+  if(isLive()) return;
+  await refreshState(showToast);
+}
+
 // ===== 이벤트 핸들러 묶음
 async function handleCreate(){
   try{
@@ -246,7 +373,8 @@ async function handleCreate(){
     const jr = await apiPost('/api/room/join', { code: res.code, nickname });
     S.pid = jr.pid;
     el('pidLabel').textContent = jr.pid;
-    await refreshState(true);
+    subscribeRoom();
+    await syncState(true);
   }catch(e){
     alert('방 생성 실패: '+e.message);
   }
@@ -259,7 +387,8 @@ async function handleJoin(){
     S.code = code; S.nickname = nickname; S.pid = res.pid;
     fillRoomInfo({code});
     closeSheet('sheetJoin');
-    await refreshState(true);
+    subscribeRoom();
+    await syncState(true);
   }catch(e){
     alert('방 참가 실패: '+e.message);
   }
@@ -279,7 +408,7 @@ async function handleUpdate(){
   try{
     await apiPost('/api/room/update', { code: S.code, pid: S.pid, lat, lng, mode });
     el('geoStatus').textContent = `서버 저장됨 (${mode})`;
-    await refreshState();
+    await syncState();
   }catch(e){
     alert('업데이트 실패: '+e.message);
   }
@@ -289,7 +418,7 @@ async function handleLeave(){
   try{
     await apiPost('/api/room/leave', { code: S.code, pid: S.pid });
     S.pid=''; el('pidLabel').textContent='-';
-    await refreshState(true);
+    await syncState(true);
   }catch(e){ alert('나가기 실패: '+e.message); }
 }
 async function handleClose(){
@@ -299,6 +428,7 @@ async function handleClose(){
   try{
     await apiPost('/api/room/close', { code: S.code, hostSecret });
     alert('방이 닫혔습니다.');
+    unsubscribeRoom();
     S.code=''; S.pid=''; S.hostSecret=''; S.joinUrl='';
     location.href='/';
   }catch(e){ alert('방 닫기 실패: '+e.message); }
@@ -309,7 +439,12 @@ async function handleSuggest(){
   const radius = parseInt(el('radius').value||'2000',10);
   const query = el('q').value.trim();
   try{
-    const r = await apiPost('/api/meeting-suggest', { roomCode:S.code, category, radius, query });
+    // 쪽이 도착할 때마다 통과한 장소를 먼저 보여 주고, 끝나면 ETA 순위로 다시 그림
+    let centroid=null; const seen=[];
+    const r = await apiStream('/api/meeting-suggest', { roomCode:S.code, category, radius, query }, ev=>{
+      if(ev.type==='start') centroid=ev.centroid;
+      if(ev.type==='page' && ev.items.length){ seen.push(...ev.items); renderSuggest(seen, centroid); }
+    });
     renderSuggest(r.items||[], r.centroid);
   }catch(e){ alert('추천 실패: '+e.message); }
 }
@@ -318,11 +453,13 @@ async function handleEta(){
   const searchRadius = parseInt(el('etaRadius').value||'2000',10);
   const includeTopN = parseInt(el('topN').value||'5',10);
   try{
-    const r = await apiPost('/api/eta-centroid', { roomCode:S.code, searchRadius, includeTopN, twoStage:true });
+    const r = await apiJob('/api/eta-centroid', { roomCode:S.code, searchRadius, includeTopN, twoStage:true },
+                           job=>{ el('etaSummary').textContent = jobProgressText(job); });
     const sum = r.participants_eta?.map(p=>`${escapeHtml(p.nickname||'')||p.index}: ${p.eta_min}분`).join(' · ') || '';
-    el('etaSummary').textContent = `중간지점 ETA 계산 완료. 후보(1단계 ${r.candidate_count_stage1} / 2단계 ${r.candidate_count_stage2}) ${sum? ' | '+sum:''}`;
+    const place = r.best?.place?.name ? ` → ${r.best.place.name}` : '';
+    el('etaSummary').textContent = `중간지점 ETA 계산 완료${place}. 후보(1단계 ${r.candidate_count_stage1} / 2단계 ${r.candidate_count_stage2}) ${sum? ' | '+sum:''}`;
     // 지도 표시
-    clearMarks(); await refreshState(); // state에 best 저장됨
+    await syncState(); // state에 best 저장됨 (구독 중이면 이벤트로 반영)
   }catch(e){ alert('ETA 계산 실패: '+e.message); }
 }
 function handleShowSaved(){ refreshState(true); }
@@ -383,7 +520,7 @@ async function init(){
   };
 
   // 저장된 코드 정보 반영
-  if(S.code){ fillRoomInfo({code:S.code, hostSecret:S.hostSecret, joinUrl:S.joinUrl}); await refreshState(); }
+  if(S.code){ fillRoomInfo({code:S.code, hostSecret:S.hostSecret, joinUrl:S.joinUrl}); subscribeRoom(); }
 }
 
 // ===== 안전한 DOMContentLoaded